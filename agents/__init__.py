@@ -2,5 +2,6 @@
 
 from .main_agent import main_agent
 from .agent_registry import agent_registry
+from .circuit_breaker import circuit_breakers
 
-__all__ = ["main_agent", "agent_registry"]
\ No newline at end of file
+__all__ = ["main_agent", "agent_registry", "circuit_breakers"]
\ No newline at end of file
@@ -8,6 +8,9 @@ class AgentRegistry:
     
     def __init__(self):
         self.agents: Dict[str, Agent] = {}
+        # Bumped whenever the set of agents or an agent's status changes,
+        # so cached catalog responses know when to re-render
+        self.version = 0
         self._initialize_agents()
     
     def _initialize_agents(self):
@@ -44,6 +47,17 @@ class AgentRegistry:
         Register a new agent in the registry
         """
         self.agents[agent.id] = agent
+        self.version += 1
+
+    def set_agent_status(self, agent_id: str, status: str) -> Optional[Agent]:
+        """
+        Update the status of a registered agent
+        """
+        agent = self.agents.get(agent_id)
+        if agent:
+            agent.status = status
+            self.version += 1
+        return agent
 
 # Global instance of the registry
 agent_registry = AgentRegistry()
\ No newline at end of file
@@ -0,0 +1,204 @@
+import os
+import time
+from collections import deque
+from enum import Enum
+from typing import Deque, Dict, Optional, Tuple
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Tracks the recent error rate and latency of a single agent and decides
+    whether new requests may be routed to it
+    """
+
+    def __init__(
+        self,
+        agent_id: str,
+        window_size: int = 50,
+        min_requests: int = 10,
+        error_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 10.0,
+        slow_call_rate_threshold: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+        min_latency_samples: int = 20,
+    ):
+        self.agent_id = agent_id
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.min_latency_samples = min_latency_samples
+
+        self.state = CircuitState.CLOSED
+        self.opened_at: Optional[float] = None
+        self._half_open_calls = 0
+        # (failed, latency_seconds) for the most recent calls
+        self._outcomes: Deque[Tuple[bool, float]] = deque(maxlen=window_size)
+        # Latencies of successful calls only, used for hedging delays
+        self._latencies: Deque[float] = deque(maxlen=window_size)
+
+    def is_available(self) -> bool:
+        """
+        Check whether the agent may currently receive requests, without reserving a slot
+        """
+        if self.state == CircuitState.OPEN:
+            return time.monotonic() - self.opened_at >= self.open_seconds
+        if self.state == CircuitState.HALF_OPEN:
+            return self._half_open_calls < self.half_open_max_calls
+        return True
+
+    def allow_request(self) -> bool:
+        """
+        Check whether a request may be sent to the agent and reserve a trial
+        slot when the breaker is half-open
+        """
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                return False
+            self.state = CircuitState.HALF_OPEN
+            self._half_open_calls = 0
+
+        if self.state == CircuitState.HALF_OPEN:
+            if self._half_open_calls >= self.half_open_max_calls:
+                return False
+            self._half_open_calls += 1
+
+        return True
+
+    def release(self):
+        """
+        Give back a reserved slot for a call that was abandoned (e.g. a cancelled hedge)
+        """
+        if self.state == CircuitState.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record_success(self, latency: float):
+        """
+        Record a successful call and its latency
+        """
+        self._latencies.append(latency)
+        if self.state == CircuitState.HALF_OPEN:
+            self._close()
+            return
+        self._outcomes.append((False, latency))
+        self._evaluate()
+
+    def record_failure(self, latency: float):
+        """
+        Record a failed call
+        """
+        if self.state == CircuitState.HALF_OPEN:
+            self._open()
+            return
+        self._outcomes.append((True, latency))
+        self._evaluate()
+
+    def record_cancelled(self, latency: float):
+        """
+        Record a call abandoned after latency seconds, e.g. a primary that
+        lost to its hedge. Its real latency was at least this long, and
+        leaving it out would bias the p95 low and hide slow calls.
+        """
+        self.release()
+        self._latencies.append(latency)
+        if self.state == CircuitState.HALF_OPEN:
+            return
+        self._outcomes.append((False, latency))
+        self._evaluate()
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """
+        Return the given percentile (0-1) of recent successful call latencies,
+        or None while there are too few samples to be meaningful
+        """
+        if len(self._latencies) < self.min_latency_samples:
+            return None
+        ordered = sorted(self._latencies)
+        index = min(int(percentile * len(ordered)), len(ordered) - 1)
+        return ordered[index]
+
+    def snapshot(self) -> Dict:
+        """
+        Summarize the breaker state for status endpoints
+        """
+        total = len(self._outcomes)
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        return {
+            "state": self.state.value,
+            "recent_calls": total,
+            "error_rate": failures / total if total else 0.0,
+            "p95_latency_seconds": self.latency_percentile(0.95),
+        }
+
+    def _evaluate(self):
+        total = len(self._outcomes)
+        if total < self.min_requests:
+            return
+
+        failures = 0
+        slow_calls = 0
+        for failed, latency in self._outcomes:
+            if failed:
+                failures += 1
+            elif latency >= self.slow_call_seconds:
+                slow_calls += 1
+
+        if (failures / total >= self.error_rate_threshold
+                or slow_calls / total >= self.slow_call_rate_threshold):
+            self._open()
+
+    def _open(self):
+        self.state = CircuitState.OPEN
+        self.opened_at = time.monotonic()
+        self._half_open_calls = 0
+
+    def _close(self):
+        self.state = CircuitState.CLOSED
+        self.opened_at = None
+        self._half_open_calls = 0
+        self._outcomes.clear()
+
+
+class CircuitBreakerRegistry:
+    """
+    Holds one circuit breaker per agent, created on first use
+    """
+
+    def __init__(self):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.settings = {
+            "window_size": int(os.getenv("CIRCUIT_BREAKER_WINDOW", "50")),
+            "min_requests": int(os.getenv("CIRCUIT_BREAKER_MIN_REQUESTS", "10")),
+            "error_rate_threshold": float(os.getenv("CIRCUIT_BREAKER_ERROR_RATE", "0.5")),
+            "slow_call_seconds": float(os.getenv("CIRCUIT_BREAKER_SLOW_CALL_SECONDS", "10")),
+            "slow_call_rate_threshold": float(os.getenv("CIRCUIT_BREAKER_SLOW_CALL_RATE", "0.8")),
+            "open_seconds": float(os.getenv("CIRCUIT_BREAKER_OPEN_SECONDS", "30")),
+        }
+
+    def get(self, agent_id: str) -> CircuitBreaker:
+        """
+        Get the breaker for an agent, creating it if needed
+        """
+        breaker = self.breakers.get(agent_id)
+        if breaker is None:
+            breaker = CircuitBreaker(agent_id, **self.settings)
+            self.breakers[agent_id] = breaker
+        return breaker
+
+    def reset(self):
+        """
+        Forget all breaker state
+        """
+        self.breakers.clear()
+
+# Global instance of the circuit breaker registry
+circuit_breakers = CircuitBreakerRegistry()
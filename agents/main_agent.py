@@ -1,10 +1,22 @@
 import asyncio
 import json
-from typing import Dict, List, Optional
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from enum import Enum
 from pydantic import BaseModel
 from datetime import datetime
 
+from .circuit_breaker import circuit_breakers
+from monitoring.metrics import (
+    agent_hedged_requests_total,
+    agent_queue_depth,
+    agent_requests_in_flight,
+    agent_routing_decisions_total,
+)
+from monitoring.activity import activity_log
+from monitoring.timing import phase
+
 class AgentStatus(str, Enum):
     ACTIVE = "active"
     INACTIVE = "inactive"
@@ -37,26 +49,34 @@ class Agent:
         raise NotImplementedError("Subclasses must implement process_request")
 
 class MainAgent(Agent):
-    def __init__(self, agent_id: str, name: str, description: str):
+    def __init__(self, agent_id: str, name: str, description: str, hedging_enabled: bool = False):
         super().__init__(agent_id, name, description, ["orchestration", "task_delegation"])
         self.sub_agents: Dict[str, Agent] = {}
+        self.hedging_enabled = hedging_enabled
 
     def register_sub_agent(self, agent: Agent):
         """Register a sub-agent with the main agent"""
         self.sub_agents[agent.id] = agent
 
-    def find_best_agent(self, request: str) -> Optional[Agent]:
-        """Find the best sub-agent to handle a request based on skills matching"""
-        best_match = None
-        best_score = 0
-
+    def rank_agents(self, request: str) -> List[Tuple[Agent, int]]:
+        """Return the sub-agents whose skills match a request, best match first"""
+        ranked = []
         for agent in self.sub_agents.values():
             score = self._calculate_skill_match(request, agent.skills)
-            if score > best_score:
-                best_score = score
-                best_match = agent
+            if score > 0:
+                ranked.append((agent, score))
+
+        # sort() is stable, so ties keep registration order
+        ranked.sort(key=lambda item: item[1], reverse=True)
+        return ranked
 
-        return best_match
+    def find_best_agent(self, request: str) -> Optional[Agent]:
+        """Find the best sub-agent to handle a request based on skills matching"""
+        for agent, _ in self.rank_agents(request):
+            if circuit_breakers.get(agent.id).is_available():
+                return agent
+
+        return None
 
     def _calculate_skill_match(self, request: str, skills: List[str]) -> int:
         """Calculate how well an agent's skills match a request"""
@@ -69,23 +89,158 @@ class MainAgent(Agent):
 
         return score
 
+    def _next_allowed_agent(self, candidates: List[Agent]) -> Optional[Agent]:
+        """Pop candidates until one whose circuit breaker admits the request"""
+        while candidates:
+            agent = candidates.pop(0)
+            if circuit_breakers.get(agent.id).allow_request():
+                return agent
+        return None
+
+    async def _call_agent(self, agent: Agent, message: Message, record_cancel: bool = False) -> str:
+        """
+        Run a sub-agent and record the outcome on its circuit breaker; with
+        record_cancel a cancelled call still counts with its elapsed time
+        """
+        breaker = circuit_breakers.get(agent.id)
+        in_flight = agent_requests_in_flight.labels(agent.id)
+        in_flight.inc()
+        activity_log.record("agent_start", agent_id=agent.id, message=message.content[:100])
+        start = time.perf_counter()
+        try:
+            response = await agent.process_request(message)
+        except asyncio.CancelledError:
+            latency = time.perf_counter() - start
+            if record_cancel:
+                breaker.record_cancelled(latency)
+            else:
+                breaker.release()
+            activity_log.record("agent_cancelled", agent_id=agent.id, latency_ms=latency * 1000)
+            raise
+        except Exception as e:
+            latency = time.perf_counter() - start
+            breaker.record_failure(latency)
+            activity_log.record("agent_error", agent_id=agent.id, latency_ms=latency * 1000, error=str(e))
+            raise
+        finally:
+            in_flight.dec()
+        latency = time.perf_counter() - start
+        breaker.record_success(latency)
+        activity_log.record("agent_finish", agent_id=agent.id, latency_ms=latency * 1000)
+        return response
+
+    async def _call_with_hedging(self, primary: Agent, candidates: List[Agent], message: Message) -> Tuple[Agent, str]:
+        """
+        Call the primary agent; if it has not answered by its p95 latency,
+        send the same request to the next available agent and return
+        whichever succeeds first
+        """
+        if not self.hedging_enabled or not candidates:
+            return primary, await self._call_agent(primary, message)
+        hedge_delay = circuit_breakers.get(primary.id).latency_percentile(0.95)
+        if hedge_delay is None:
+            return primary, await self._call_agent(primary, message)
+
+        # A primary cancelled because its hedge won was at least this slow
+        primary_task = asyncio.ensure_future(self._call_agent(primary, message, record_cancel=True))
+
+        owners = {primary_task: primary}
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=hedge_delay)
+            if done:
+                return primary, primary_task.result()
+
+            hedge_agent = self._next_allowed_agent(candidates)
+            if hedge_agent is None:
+                return primary, await primary_task
+
+            agent_hedged_requests_total.labels(hedge_agent.id).inc()
+            owners[asyncio.ensure_future(self._call_agent(hedge_agent, message))] = hedge_agent
+            pending = set(owners)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return owners[task], task.result()
+
+            # Every attempt failed; surface the primary agent's error
+            return primary, primary_task.result()
+        finally:
+            for task in owners:
+                if not task.done():
+                    task.cancel()
+
     async def process_request(self, message: Message) -> str:
         """Process a request by delegating to the appropriate sub-agent"""
         if not self.sub_agents:
             return "No sub-agents available for task delegation."
 
-        # Find the best agent for the request
-        best_agent = self.find_best_agent(message.content)
+        agent_queue_depth.inc()
+        try:
+            return await self._delegate(message)
+        finally:
+            agent_queue_depth.dec()
+
+    async def process_with(self, agent: Agent, message: Message) -> str:
+        """Process a request on a chosen sub-agent, counted in the queue depth like a delegated one"""
+        agent_queue_depth.inc()
+        try:
+            return await agent.process_request(message)
+        finally:
+            agent_queue_depth.dec()
 
-        if best_agent:
-            # Update message to indicate which agent will process it
-            message.agent_used = best_agent.name
+    async def process_batch(self, messages: List[Message], concurrency: int = 8) -> AsyncIterator[Tuple[int, Optional[str], Optional[str]]]:
+        """
+        Process many requests concurrently, at most `concurrency` at a time.
+        Yields (index, response, error) for each request as it completes; a
+        failing request is reported in place and does not stop the others.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
 
-            # Process the request with the selected agent
-            response = await best_agent.process_request(message)
-            return response
-        else:
+        async def run(index: int, message: Message):
+            async with semaphore:
+                try:
+                    return index, await self.process_request(message), None
+                except Exception as e:
+                    return index, None, str(e)
+
+        tasks = [asyncio.ensure_future(run(index, message)) for index, message in enumerate(messages)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # The consumer went away (e.g. a streaming client disconnected)
+            for task in tasks:
+                task.cancel()
+
+    async def _delegate(self, message: Message) -> str:
+        """Route a request to the best available sub-agent and run it"""
+        # Rank the matching agents and skip any whose circuit breaker is open
+        with phase("routing"):
+            ranked = self.rank_agents(message.content)
+            candidates = [agent for agent, _ in ranked]
+            best_agent = self._next_allowed_agent(candidates)
+
+        if not ranked:
+            agent_routing_decisions_total.labels("none").inc()
+            activity_log.record("routing", message=message.content[:100], error="no matching agent")
             return "No suitable agent found for this request."
+        if not best_agent:
+            agent_routing_decisions_total.labels("unavailable").inc()
+            activity_log.record("routing", message=message.content[:100], error="all matching agents unavailable")
+            return "All suitable agents are temporarily unavailable."
+
+        agent_routing_decisions_total.labels(best_agent.id).inc()
+        activity_log.record("routing", agent_id=best_agent.id, message=message.content[:100],
+                            score=ranked[0][1])
+
+        # Process the request with the selected agent (hedged if enabled)
+        with phase("agent"):
+            agent_used, response = await self._call_with_hedging(best_agent, candidates, message)
+
+        # Update message to indicate which agent processed it
+        message.agent_used = agent_used.name
+        return response
 
 # Import specialized agents
 from .sub_agents.frontend_agent import FrontendAgent
@@ -101,7 +256,8 @@ from .sub_agents.deployment_agent import DeploymentAgent
 main_agent = MainAgent(
     agent_id="main-agent-001",
     name="Main Agent",
-    description="Central orchestrator that routes requests to appropriate sub-agents"
+    description="Central orchestrator that routes requests to appropriate sub-agents",
+    hedging_enabled=os.getenv("AGENT_HEDGING_ENABLED", "false").lower() == "true"
 )
 
 # Create and register sub-agents
@@ -0,0 +1,80 @@
+"""
+Compare per-endpoint serialization cost of FastAPI's default path
+(jsonable_encoder + json.dumps) against the orjson renderer and the
+pre-serialized catalog cache.
+
+Run from the backend directory:
+
+    python benchmarks/bench_serialization.py
+"""
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.encoders import jsonable_encoder
+
+import main
+from responses import ResponseCache, render_json
+from speckit.task_analyzer import task_analyzer
+
+
+CATALOG_PATHS = ("/agents", "/skills", "/skills/categories", "/config", "/agents/types")
+
+
+def default_render(payload):
+    """FastAPI's default: jsonable_encoder followed by JSONResponse.render"""
+    return json.dumps(
+        jsonable_encoder(payload),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def endpoint_payloads():
+    content = "Create a FastAPI endpoint that queries the Postgres database"
+    return {
+        "/agents": main._build_agents_catalog(),
+        "/skills": main._build_skills_catalog(),
+        "/skills/categories": main._build_skills_by_category(),
+        "/config": main._build_config(),
+        "/agents/types": main._build_agent_types(),
+        "/analyze/task": {
+            "task_content": content,
+            "analysis": task_analyzer.analyze_task(content),
+        },
+        "/agents/backend": {
+            "task_content": content,
+            "processed_by": "Backend APIs Agent",
+            "response": f"[Backend Agent] Processing backend request: {content[:50]}...",
+            "timestamp": datetime.utcnow().isoformat(),
+        },
+    }
+
+
+def bench(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main_bench(number=2000):
+    cache = ResponseCache("benchmark")
+    print(f"{'endpoint':<20} {'default us':>12} {'orjson us':>12} {'cached us':>12} {'speedup':>9}")
+    for path, payload in endpoint_payloads().items():
+        default_us = bench(lambda: default_render(payload), number)
+        orjson_us = bench(lambda: render_json(payload), number)
+        if path in CATALOG_PATHS:
+            cached_us = bench(lambda: cache.get(path, 0, lambda: payload), number)
+            cached = f"{cached_us:12.2f}"
+        else:
+            cached = f"{'-':>12}"
+        print(f"{path:<20} {default_us:12.2f} {orjson_us:12.2f} {cached} {default_us / orjson_us:8.1f}x")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,144 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+from monitoring.metrics import cache_requests_total
+
+# Marks a cached miss, so a stored None is told apart from "not cached"
+_MISSING = object()
+
+
+class SharedInvalidations:
+    """
+    Cache invalidations shared by the workers on a host through an
+    append-only file with one key per line ("*" for everything). Each
+    worker reads the lines appended since its last look: one stat per
+    lookup, plus a read only when the file has grown. Past max_size the
+    file is truncated, and readers that see it shrink clear everything.
+    """
+
+    ALL = "*"
+    max_size = 1 << 20
+
+    def __init__(self, path: str, parse: Callable[[str], Hashable] = str):
+        self.path = path
+        self.parse = parse
+        self._inode, self._offset = self._stat()
+
+    def _stat(self) -> Tuple[Optional[int], int]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None, 0
+        return stat.st_ino, stat.st_size
+
+    def publish(self, key: Hashable):
+        try:
+            with open(self.path, "ab") as log:
+                log.write(f"{key}\n".encode())
+                if log.tell() > self.max_size:
+                    log.truncate(0)
+        except OSError:
+            # Other workers fall back to their TTLs
+            pass
+
+    def poll(self) -> List[str]:
+        """
+        Keys invalidated by any worker since the last poll
+        """
+        inode, size = self._stat()
+        if inode == self._inode and size == self._offset:
+            return []
+        if self._inode is None:
+            # Created since the last look: read it from the start
+            self._inode, self._offset = inode, 0
+        elif inode != self._inode or size < self._offset:
+            # Truncated or replaced: whatever it held is gone
+            self._inode, self._offset = inode, size
+            return [self.ALL]
+        try:
+            with open(self.path, "rb") as log:
+                log.seek(self._offset)
+                data = log.read(size - self._offset)
+        except OSError:
+            return [self.ALL]
+        # A line still being written is read next time
+        complete = data[:data.rfind(b"\n") + 1]
+        self._offset += len(complete)
+        return complete.decode().split()
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire after a TTL. Lookups that found
+    nothing can be cached too, under a separate and usually much shorter
+    TTL, so repeated requests for a missing key do not all reach the
+    database while a newly created key still shows up quickly.
+
+    Each worker process has its own cache. With shared invalidations, a
+    key invalidated in any worker is dropped by all of them; otherwise a
+    worker only sees its own invalidations and the TTLs bound
+    how stale an entry can be after a change made by another worker.
+    """
+
+    def __init__(self, name: str, maxsize: int = 10000, ttl: float = 30.0, negative_ttl: float = 2.0,
+                 shared: Optional[SharedInvalidations] = None):
+        self.name = name
+        self.shared = shared
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = cache_requests_total.labels(name, "hit")
+        self.misses = cache_requests_total.labels(name, "miss")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, now: Optional[float] = None) -> Tuple[bool, Any]:
+        """
+        Return (found, value); value is None for a cached miss
+        """
+        now = time.monotonic() if now is None else now
+        if self.shared is not None:
+            for shared_key in self.shared.poll():
+                if shared_key == SharedInvalidations.ALL:
+                    self._entries.clear()
+                else:
+                    self._entries.pop(self.shared.parse(shared_key), None)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= now:
+            if entry is not None:
+                self._entries.pop(key, None)
+            self.misses.inc()
+            return False, None
+
+        self._entries.move_to_end(key)
+        self.hits.inc()
+        value = entry[1]
+        return True, None if value is _MISSING else value
+
+    def set(self, key: Hashable, value: Any, now: Optional[float] = None):
+        """
+        Cache a value, or a miss if value is None
+        """
+        now = time.monotonic() if now is None else now
+        if value is None:
+            entry = (now + self.negative_ttl, _MISSING)
+        else:
+            entry = (now + self.ttl, value)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.publish(key)
+
+    def clear(self):
+        self._entries.clear()
+        if self.shared is not None:
+            self.shared.publish(SharedInvalidations.ALL)
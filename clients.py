@@ -0,0 +1,44 @@
+"""
+Who is calling: the identity that per-client limits are keyed on.
+
+The app is deployed behind Railway's edge proxy (see Procfile), so the
+socket peer of every request is the proxy. The proxy appends the address
+it accepted the connection from to X-Forwarded-For, which makes the
+right-most entry of that header the real client IP. TRUST_FORWARDED_FOR
+is therefore on by default; set it to "false" only when the app is
+reachable directly, where the header would be whatever the caller sent.
+"""
+import os
+from typing import AbstractSet
+
+from starlette.datastructures import Headers
+from starlette.types import Scope
+
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "true").lower() == "true"
+
+
+def client_ip(scope: Scope, trust_forwarded: bool = TRUST_FORWARDED_FOR) -> str:
+    """
+    The client's IP address, from our proxy's X-Forwarded-For entry when trusted
+    """
+    if trust_forwarded:
+        forwarded_for = Headers(scope=scope).get("x-forwarded-for")
+        if forwarded_for:
+            # The right-most entry is the one added by our own proxy; anything
+            # to its left is client-supplied and cannot be trusted
+            return forwarded_for.rsplit(",", 1)[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def client_key(scope: Scope, trust_forwarded: bool = TRUST_FORWARDED_FOR,
+               api_keys: AbstractSet[str] = frozenset()) -> str:
+    """
+    Identify the caller: a known API key, otherwise the client IP.
+    Client-chosen values such as unknown keys or sender_id are ignored, as
+    a caller could change them on every request to get a fresh bucket.
+    """
+    api_key = Headers(scope=scope).get("x-api-key")
+    if api_key and api_key in api_keys:
+        return f"key:{api_key}"
+    return f"ip:{client_ip(scope, trust_forwarded)}"
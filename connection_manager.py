@@ -0,0 +1,183 @@
+import asyncio
+import os
+import uuid
+from typing import Any, Dict, Iterable, Optional, Set
+
+from fastapi import WebSocket
+
+from monitoring.metrics import metrics_registry
+from responses import render_json_text
+
+websocket_broadcasts_total = metrics_registry.counter(
+    "websocket_broadcasts_total", "Messages fanned out to WebSocket connections, by scope", ("scope",))
+websocket_evictions_total = metrics_registry.counter(
+    "websocket_evictions_total", "WebSocket connections closed for not keeping up with their messages")
+websocket_subscriptions = metrics_registry.gauge(
+    "websocket_subscriptions", "Conversation subscriptions held by open WebSocket connections")
+
+# Sentinel that tells a connection's writer to stop
+_CLOSE = object()
+
+# Close code for connections evicted as too slow ("try again later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class Connection:
+    """
+    An open WebSocket and its outbox. Everything sent to the socket goes
+    through the outbox and one writer task, so direct replies and
+    broadcasts never interleave and a slow client never blocks a sender.
+    """
+
+    __slots__ = ("id", "websocket", "outbox", "conversations", "writer")
+
+    def __init__(self, websocket: WebSocket, max_pending: int):
+        self.id = str(uuid.uuid4())
+        self.websocket = websocket
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.conversations: Set[str] = set()
+        self.writer: Optional[asyncio.Task] = None
+
+    def send(self, text: str) -> bool:
+        """
+        Queue an already serialized message; returns False if the outbox is full
+        """
+        try:
+            self.outbox.put_nowait(text)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def _write(self):
+        while True:
+            text = await self.outbox.get()
+            if text is _CLOSE:
+                return
+            await self.websocket.send_text(text)
+
+
+class ConnectionManager:
+    """
+    Registry of open WebSocket connections with an index from conversation
+    id to subscribed connections. A publish serializes the message once
+    and queues the same string for each subscriber, so fan-out costs
+    O(subscribers) queue puts. Connections whose outbox fills up are
+    closed instead of letting them hold memory or stall the others.
+    """
+
+    def __init__(self, max_pending: int = 256, close_timeout: float = 5.0):
+        self.max_pending = max_pending
+        self.close_timeout = close_timeout
+        self._connections: Dict[str, Connection] = {}
+        self._subscribers: Dict[str, Set[Connection]] = {}
+
+    def __len__(self) -> int:
+        return len(self._connections)
+
+    async def connect(self, websocket: WebSocket) -> Connection:
+        """
+        Accept a WebSocket and register it
+        """
+        await websocket.accept()
+        connection = Connection(websocket, self.max_pending)
+        connection.writer = asyncio.get_running_loop().create_task(connection._write())
+        self._connections[connection.id] = connection
+        return connection
+
+    async def disconnect(self, connection: Connection):
+        """
+        Unregister a connection, sending whatever is still queued for it first
+        """
+        self._forget(connection)
+        writer = connection.writer
+        if writer is None or writer.done():
+            return
+        try:
+            connection.outbox.put_nowait(_CLOSE)
+            await asyncio.wait_for(writer, self.close_timeout)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            writer.cancel()
+        except Exception:
+            # The socket is already gone; nothing left to deliver
+            pass
+
+    def subscribe(self, connection: Connection, conversation_id: str):
+        subscribers = self._subscribers.get(conversation_id)
+        if subscribers is None:
+            subscribers = self._subscribers[conversation_id] = set()
+        subscribers.add(connection)
+        connection.conversations.add(conversation_id)
+
+    def unsubscribe(self, connection: Connection, conversation_id: str):
+        subscribers = self._subscribers.get(conversation_id)
+        if subscribers is not None:
+            subscribers.discard(connection)
+            if not subscribers:
+                del self._subscribers[conversation_id]
+        connection.conversations.discard(conversation_id)
+
+    def subscriber_count(self, conversation_id: str) -> int:
+        return len(self._subscribers.get(conversation_id, ()))
+
+    def subscription_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, conversation_id: str, message: Any, exclude: Optional[Connection] = None) -> int:
+        """
+        Send a message to every connection subscribed to a conversation;
+        returns the number of connections it was queued for
+        """
+        subscribers = self._subscribers.get(conversation_id)
+        if not subscribers:
+            return 0
+        websocket_broadcasts_total.labels("conversation").inc()
+        return self._fan_out(subscribers, render_json_text(message), exclude)
+
+    def broadcast(self, message: Any) -> int:
+        """
+        Send a message to every open connection, e.g. agent status changes
+        """
+        if not self._connections:
+            return 0
+        websocket_broadcasts_total.labels("all").inc()
+        return self._fan_out(self._connections.values(), render_json_text(message))
+
+    def _fan_out(self, connections: Iterable[Connection], text: str, exclude: Optional[Connection] = None) -> int:
+        delivered = 0
+        slow = []
+        for connection in connections:
+            if connection is exclude:
+                continue
+            if connection.send(text):
+                delivered += 1
+            else:
+                slow.append(connection)
+        # Evicted after the loop, which may be iterating one of the indexes
+        for connection in slow:
+            self._evict(connection)
+        return delivered
+
+    def _evict(self, connection: Connection):
+        websocket_evictions_total.inc()
+        self._forget(connection)
+        if connection.writer is not None:
+            connection.writer.cancel()
+        asyncio.get_running_loop().create_task(self._close(connection.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            pass
+
+    def _forget(self, connection: Connection):
+        for conversation_id in list(connection.conversations):
+            self.unsubscribe(connection, conversation_id)
+        self._connections.pop(connection.id, None)
+
+# Global WebSocket connection manager
+connection_manager = ConnectionManager(
+    max_pending=int(os.getenv("WEBSOCKET_MAX_PENDING", "256")),
+)
+
+websocket_subscriptions.set_function(connection_manager.subscription_count)
@@ -1,107 +1,430 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import case, delete, event, insert, literal, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BindParameter
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+import os
+import tempfile
 import uuid
 
-from models import Task, User
+import schemas
+from caching import SharedInvalidations, TTLCache
+from models.agent_models import AgentTaskCount, ChatMessage, Conversation, Task, User, UserTaskCount
+from pagination import keyset_page
 from schemas import TaskCreate, TaskUpdate
 
+# Existence and metadata of users, in front of get_user; misses are cached
+# briefly so a user created by another worker becomes visible quickly.
+# Invalidations reach the other workers on this host through a shared file.
+user_cache = TTLCache(
+    "users",
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", "30")),
+    negative_ttl=float(os.getenv("USER_CACHE_NEGATIVE_TTL_SECONDS", "2")),
+    shared=SharedInvalidations(os.getenv(
+        "USER_CACHE_INVALIDATIONS_FILE", os.path.join(tempfile.gettempdir(), "user-cache.invalidations")),
+        parse=uuid.UUID),
+)
 
-def get_user(db: Session, user_id: str):
+
+def _written_user_ids(statement, multiparams, params) -> Optional[List]:
     """
-    Retrieve a user by ID
+    The ids of the users rows a statement writes, or None when they cannot
+    be told from its parameters (e.g. a Core update with an arbitrary WHERE)
     """
-    return db.query(User).filter(User.id == user_id).first()
+    rows = multiparams or [params or {}]
+    if statement.is_insert:
+        ids = [row.get("id") for row in rows]
+    else:
+        where = statement.whereclause
+        column = getattr(where, "left", None)
+        bound = getattr(where, "right", None)
+        if (getattr(where, "operator", None) is not operators.eq or not isinstance(bound, BindParameter)
+                or getattr(column, "name", None) != "id"):
+            return None
+        ids = [row.get(bound.key, bound.value) for row in rows]
+    return None if any(user_id is None for user_id in ids) else ids
+
+
+def _invalidate_users_on_write(conn, clauseelement, multiparams, params, execution_options, result):
+    # Catches ORM flushes and Core statements alike. Writes by id drop just
+    # those users; for anything else the whole cache goes.
+    table = getattr(clauseelement, "table", None) if getattr(clauseelement, "is_dml", False) else None
+    if table is None or table.name != User.__tablename__:
+        return
+    user_ids = _written_user_ids(clauseelement, multiparams, params)
+    written = conn.info.setdefault("written_users", set())
+    if user_ids is None:
+        user_cache.clear()
+        written.add(None)
+        return
+    for user_id in user_ids:
+        user_cache.invalidate(user_id)
+        written.add(user_id)
+
+
+def _invalidate_users_on_commit(conn):
+    # Again at commit, in case a lookup re-cached the old row meanwhile
+    written = conn.info.pop("written_users", ())
+    if None in written:
+        user_cache.clear()
+        return
+    for user_id in written:
+        user_cache.invalidate(user_id)
+
 
+def _forget_user_writes(conn):
+    conn.info.pop("written_users", None)
 
-def create_user(db: Session, user_data: dict):
+# Every statement that writes the users table, on any engine, drops cached users
+event.listen(Engine, "after_execute", _invalidate_users_on_write)
+event.listen(Engine, "commit", _invalidate_users_on_commit)
+event.listen(Engine, "rollback", _forget_user_writes)
+
+
+def as_uuid(value) -> Optional[uuid.UUID]:
+    """
+    Convert an ID to a UUID for binding; None if it is not a valid UUID
+    """
+    if isinstance(value, uuid.UUID):
+        return value
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+async def get_user(db: AsyncSession, user_id: str) -> Optional[schemas.User]:
+    """
+    Retrieve a user by ID, read through the user cache. Returns a detached
+    snapshot of the user, or None if it does not exist.
+    """
+    user_id = as_uuid(user_id)
+    if user_id is None:
+        return None
+
+    found, user = user_cache.get(user_id)
+    if found:
+        return user
+
+    db_user = await db.get(User, user_id)
+    user = schemas.User.model_validate(db_user) if db_user else None
+    user_cache.set(user_id, user)
+    return user
+
+
+async def create_user(db: AsyncSession, user_data: dict):
     """
     Create a new user
     """
-    fake_user_id = str(uuid.uuid4())
     db_user = User(
-        id=fake_user_id,
-        name=user_data.get('name', ''),
+        id=uuid.uuid4(),
+        username=user_data.get('username', ''),
         email=user_data.get('email', ''),
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow()
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    user_cache.invalidate(db_user.id)
     return db_user
 
 
-def get_task(db: Session, task_id: str):
+async def get_task(db: AsyncSession, task_id: str):
     """
     Retrieve a task by ID
     """
-    return db.query(Task).filter(Task.id == task_id).first()
+    task_id = as_uuid(task_id)
+    if task_id is None:
+        return None
+    return await db.get(Task, task_id)
 
 
-def get_user_tasks(db: Session, user_id: str, skip: int = 0, limit: int = 100):
+async def get_user_tasks(db: AsyncSession, user_id: str, cursor: Optional[str] = None, limit: int = 100) -> Tuple[List[Task], Optional[str]]:
     """
-    Retrieve all tasks for a specific user
+    Retrieve a page of a user's tasks, newest first, and the next page cursor
     """
-    return db.query(Task).filter(Task.user_id == user_id).offset(skip).limit(limit).all()
+    stmt = select(Task).where(Task.user_id == as_uuid(user_id))
+    return await keyset_page(db, stmt, Task, cursor, limit)
 
 
-def create_user_task(db: Session, task: TaskCreate):
+async def get_conversations(db: AsyncSession, user_id: Optional[str] = None, cursor: Optional[str] = None, limit: int = 20) -> Tuple[List[Conversation], Optional[str]]:
+    """
+    Retrieve a page of conversations, newest first, optionally for one user
     """
-    Create a new task for a user
+    stmt = select(Conversation)
+    if user_id is not None:
+        stmt = stmt.where(Conversation.user_id == as_uuid(user_id))
+    return await keyset_page(db, stmt, Conversation, cursor, limit)
+
+
+async def create_conversation(db: AsyncSession, title: str, user_id: Optional[str] = None):
     """
-    fake_task_id = str(uuid.uuid4())
-    db_task = Task(
-        id=fake_task_id,
-        title=task.title,
-        description=task.description,
-        user_id=task.user_id,
-        agent_assigned=task.agent_assigned,
-        status=task.status if hasattr(task, 'status') else 'pending',
+    Create a new conversation
+    """
+    db_conversation = Conversation(
+        id=uuid.uuid4(),
+        user_id=as_uuid(user_id) if user_id else None,
+        title=title,
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow()
     )
-    db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
-    return db_task
+    db.add(db_conversation)
+    await db.commit()
+    return db_conversation
+
+
+async def get_conversation(db: AsyncSession, conversation_id: str) -> Optional[Conversation]:
+    """
+    Retrieve a conversation by ID
+    """
+    conversation_id = as_uuid(conversation_id)
+    if conversation_id is None:
+        return None
+    return await db.get(Conversation, conversation_id)
+
+
+def user_tasks_export_statement(user_id: str):
+    """
+    All of a user's tasks, oldest first, for streaming exports
+    """
+    return select(Task).where(Task.user_id == as_uuid(user_id)).order_by(Task.created_at, Task.id)
+
+
+def conversation_messages_statement(conversation_id: str, since: Optional[datetime] = None,
+                                    until: Optional[datetime] = None):
+    """
+    A conversation's messages, optionally limited to [since, until). The
+    time bounds let Postgres skip every monthly partition outside them.
+    """
+    stmt = select(ChatMessage).where(ChatMessage.conversation_id == as_uuid(conversation_id))
+    if since is not None:
+        stmt = stmt.where(ChatMessage.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(ChatMessage.created_at < until)
+    return stmt
+
+
+def conversation_export_statement(conversation_id: str, since: Optional[datetime] = None,
+                                  until: Optional[datetime] = None):
+    """
+    All messages of a conversation, oldest first, for streaming exports
+    """
+    return (
+        conversation_messages_statement(conversation_id, since, until)
+        .order_by(ChatMessage.created_at, ChatMessage.id)
+    )
+
+
+async def get_conversation_messages(db: AsyncSession, conversation_id: str, cursor: Optional[str] = None, limit: int = 50,
+                                    since: Optional[datetime] = None, until: Optional[datetime] = None) -> Tuple[List[ChatMessage], Optional[str]]:
+    """
+    Retrieve a page of a conversation's messages, newest first
+    """
+    stmt = conversation_messages_statement(conversation_id, since, until)
+    return await keyset_page(db, stmt, ChatMessage, cursor, limit)
 
 
-def update_task(db: Session, task_id: str, task_update: TaskCreate):
+async def create_user_task(db: AsyncSession, user_id: str, task: TaskCreate) -> Optional[Task]:
     """
-    Update a task by ID
+    Create a new task for a user in one INSERT ... SELECT ... RETURNING;
+    returns None if the user does not exist
     """
-    db_task = db.query(Task).filter(Task.id == task_id).first()
-    if db_task:
-        update_data = task_update.dict(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_task, field, value)
-        db_task.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(db_task)
+    now = datetime.utcnow()
+    values = {
+        "id": uuid.uuid4(),
+        "user_id": as_uuid(user_id),
+        "title": task.title,
+        "description": task.description,
+        "agent_assigned": task.agent_assigned,
+        "status": getattr(task, 'status', None) or 'pending',
+        "created_at": now,
+        "updated_at": now,
+    }
+    columns = Task.__table__.c
+    # The SELECT yields the new row only when the user exists
+    source = select(*[literal(value, columns[name].type) for name, value in values.items()]).where(
+        User.id == values["user_id"])
+    stmt = insert(Task).from_select(list(values), source).returning(Task)
+
+    db_task = (await db.scalars(stmt)).first()
+    await db.commit()
     return db_task
 
 
-def update_task_status(db: Session, task_id: str, status: str):
+async def create_user_tasks(db: AsyncSession, user_id: str, tasks: List) -> Optional[List[Task]]:
+    """
+    Create many tasks for a user in one transaction. The rows go out as
+    multi-row INSERT ... VALUES ... RETURNING batches; returns None if the
+    user does not exist.
+    """
+    if not await get_user(db, user_id):
+        return None
+
+    now = datetime.utcnow()
+    user_uuid = as_uuid(user_id)
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "user_id": user_uuid,
+            "title": task.title,
+            "description": task.description,
+            "agent_assigned": task.agent_assigned,
+            "status": getattr(task, 'status', None) or 'pending',
+            "created_at": now,
+            "updated_at": now,
+        }
+        for task in tasks
+    ]
+    stmt = insert(Task).returning(Task, sort_by_parameter_order=True)
+    try:
+        db_tasks = list(await db.scalars(stmt, rows))
+        await db.commit()
+    except IntegrityError:
+        # The cached user was deleted by another worker since it was cached
+        await db.rollback()
+        user_cache.invalidate(user_uuid)
+        return None
+    return db_tasks
+
+
+async def update_user_tasks(db: AsyncSession, user_id: str, updates: List[dict]) -> Tuple[List[Task], List[uuid.UUID]]:
+    """
+    Apply many partial updates (each a dict with an "id") to a user's tasks
+    in one transaction, as executemany UPDATEs by primary key scoped to the
+    user. Returns the updated rows in request order and the ids that did not
+    match; if any did not match, nothing is changed.
+    """
+    user_uuid = as_uuid(user_id)
+    now = datetime.utcnow()
+    params = [{**values, "id": as_uuid(values["id"]), "updated_at": now} for values in updates]
+    ids = [values["id"] for values in params]
+
+    await db.execute(
+        update(Task).where(Task.user_id == user_uuid).execution_options(synchronize_session=False),
+        params
+    )
+    # Per-row parameter sets cannot carry an expression, so versions are bumped in one more statement
+    await db.execute(
+        update(Task).where(Task.id.in_(ids), Task.user_id == user_uuid)
+        .values(version=Task.version + 1).execution_options(synchronize_session=False)
+    )
+    # The read-back doubles as the ownership check for the whole batch
+    found = {
+        task.id: task
+        for task in await db.scalars(
+            select(Task).where(Task.id.in_(ids), Task.user_id == user_uuid).execution_options(populate_existing=True))
+    }
+    missing = [task_id for task_id in ids if task_id not in found]
+    if missing:
+        await db.rollback()
+        return [], missing
+
+    await db.commit()
+    return [found[task_id] for task_id in ids], []
+
+
+async def get_user_task(db: AsyncSession, user_id: str, task_id: str) -> Optional[Task]:
+    """
+    Retrieve a task only if it belongs to the user
+    """
+    user_id, task_id = as_uuid(user_id), as_uuid(task_id)
+    if user_id is None or task_id is None:
+        return None
+    stmt = select(Task).where(Task.id == task_id, Task.user_id == user_id)
+    return (await db.scalars(stmt)).first()
+
+
+async def update_user_task(db: AsyncSession, user_id: str, task_id: str, values: dict,
+                           expected_version: Optional[int] = None) -> Optional[Task]:
     """
-    Update the status of a task
+    Update a task in one UPDATE ... RETURNING, with the ownership check (and,
+    if expected_version is given, the version check) in the WHERE clause;
+    returns None if no task matched
     """
-    db_task = db.query(Task).filter(Task.id == task_id).first()
-    if db_task:
-        db_task.status = status
-        db_task.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(db_task)
+    user_id, task_id = as_uuid(user_id), as_uuid(task_id)
+    if user_id is None or task_id is None:
+        return None
+    stmt = (
+        update(Task)
+        .where(Task.id == task_id, Task.user_id == user_id)
+        .values(**values, updated_at=datetime.utcnow(), version=Task.version + 1)
+        .returning(Task)
+        .execution_options(synchronize_session=False)
+    )
+    if expected_version is not None:
+        stmt = stmt.where(Task.version == expected_version)
+    db_task = (await db.scalars(stmt)).first()
+    await db.commit()
     return db_task
 
 
-def delete_task(db: Session, task_id: str):
+async def toggle_user_task_completion(db: AsyncSession, user_id: str, task_id: str,
+                                      expected_version: Optional[int] = None) -> Optional[Task]:
+    """
+    Flip a task between completed and pending in a single statement
+    """
+    new_status = case((Task.status == 'completed', 'pending'), else_='completed')
+    return await update_user_task(db, user_id, task_id, {"status": new_status}, expected_version)
+
+
+async def delete_user_task(db: AsyncSession, user_id: str, task_id: str) -> Optional[uuid.UUID]:
+    """
+    Delete a task in one DELETE ... RETURNING, with the ownership check in
+    the WHERE clause; returns the deleted id, or None if no task matched
+    """
+    user_id, task_id = as_uuid(user_id), as_uuid(task_id)
+    if user_id is None or task_id is None:
+        return None
+    stmt = delete(Task).where(Task.id == task_id, Task.user_id == user_id).returning(Task.id)
+    deleted_id = (await db.execute(stmt)).scalar()
+    await db.commit()
+    return deleted_id
+
+
+async def get_user_task_counts(db: AsyncSession, user_id: str) -> Dict[str, int]:
+    """
+    A user's task counts by status, read from the trigger-maintained counters
+    """
+    rows = await db.execute(
+        select(UserTaskCount.status, UserTaskCount.count)
+        .where(UserTaskCount.user_id == as_uuid(user_id), UserTaskCount.count > 0)
+    )
+    return {status: count for status, count in rows}
+
+
+async def get_task_counts(db: AsyncSession) -> Tuple[Dict[str, int], Dict[str, Dict[str, int]]]:
+    """
+    Task counts by status and by assigned agent and status, read from the
+    counters; unassigned tasks are reported under "unassigned"
+    """
+    by_status: Dict[str, int] = {}
+    by_agent: Dict[str, Dict[str, int]] = {}
+    rows = await db.execute(
+        select(AgentTaskCount.agent, AgentTaskCount.status, AgentTaskCount.count).where(AgentTaskCount.count > 0)
+    )
+    for agent, status, count in rows:
+        by_status[status] = by_status.get(status, 0) + count
+        by_agent.setdefault(agent or "unassigned", {})[status] = count
+    return by_status, by_agent
+
+
+async def diagnose_task_miss(db: AsyncSession, user_id: str, task_id: Optional[str] = None, action: str = "access") -> Tuple[int, str]:
     """
-    Delete a task by ID
+    Explain why a user-scoped task statement matched nothing, as an HTTP
+    status code and detail. Only called on the miss path, so the common
+    path stays a single round-trip.
     """
-    db_task = db.query(Task).filter(Task.id == task_id).first()
-    if db_task:
-        db.delete(db_task)
-        db.commit()
-    return db_task
\ No newline at end of file
+    user_uuid, task_uuid = as_uuid(user_id), as_uuid(task_id) if task_id is not None else None
+    user_exists = select(User.id).where(User.id == user_uuid).exists()
+    task_owner = select(Task.user_id).where(Task.id == task_uuid).scalar_subquery()
+    found_user, owner = (await db.execute(select(user_exists, task_owner))).one()
+
+    if not found_user:
+        return 404, "User not found"
+    if task_id is None or owner is None:
+        return 404, "Task not found"
+    return 403, f"Not authorized to {action} this task"
@@ -1,22 +1,207 @@
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Dict, Optional
 import os
 from dotenv import load_dotenv
 
+from monitoring.metrics import db_pool_checked_out, db_pool_checkouts_total, metrics_registry
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional read replica for read-only handlers; unset means reads use the primary
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or None
+
+# Pool settings; the defaults suit a small Neon compute behind one worker
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+
+def async_database_url(url: str) -> str:
+    """
+    The async driver equivalent of a database URL: asyncpg for Postgres,
+    aiosqlite for SQLite
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "postgresql":
+        # asyncpg does not understand libpq's sslmode; engine_options maps it
+        query = {key: value for key, value in parsed.query.items() if key not in ("sslmode", "channel_binding")}
+        parsed = parsed.set(drivername="postgresql+asyncpg", query=query)
+    elif backend == "sqlite":
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    return parsed.render_as_string(hide_password=False)
+
+
+def engine_options(url: str, asynchronous: bool = False) -> Dict:
+    """
+    create_engine keyword arguments for the configured pool settings
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        # SQLite connections are local files; pool sizing does not apply
+        return {}
+
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+    connect_args = {}
+    if asynchronous:
+        if parsed.query.get("sslmode") not in (None, "disable"):
+            connect_args["ssl"] = "require"
+        if DB_STATEMENT_TIMEOUT_MS:
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    elif DB_STATEMENT_TIMEOUT_MS:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
+
+
+db_reads_total = metrics_registry.counter(
+    "db_reads_total", "Statements run by read-routed sessions, by target", ("target",))
+
+
+class RoutingSession(Session):
+    """
+    Session that can send reads to a read replica. It only does so when
+    opened with a replica and until it writes: the first flush or DML
+    statement pins it to the primary for the rest of its life, so a
+    request always reads its own writes. Sessions without a replica behave
+    like a plain Session bound to the primary.
+    """
+
+    def __init__(self, replica: Optional[Engine] = None, **kw):
+        super().__init__(**kw)
+        self.replica = replica
+        self.wrote = False
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or getattr(clause, "is_dml", False):
+            self.wrote = True
+        if self.replica is None:
+            return super().get_bind(mapper, clause=clause, **kw)
+        if self.wrote:
+            db_reads_total.labels("primary").inc()
+            return super().get_bind(mapper, clause=clause, **kw)
+        db_reads_total.labels("replica").inc()
+        return self.replica
+
+
+def _remember_writer(session: Session):
+    # Flags the request so ReadYourWritesMiddleware keeps the client's next
+    # reads on the primary until the replica catches up
+    scope = session.info.get("scope")
+    if scope is not None and getattr(session, "wrote", False):
+        scope["db_wrote"] = True
+
+event.listen(RoutingSession, "after_commit", _remember_writer)
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# The async engine serves request handlers without tying up the threadpool;
+# the sync engine remains for scripts and background jobs
+async_engine = create_async_engine(
+    async_database_url(DATABASE_URL),
+    **engine_options(DATABASE_URL, asynchronous=True)
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, sync_session_class=RoutingSession,
+                                       autoflush=False, expire_on_commit=False)
+
+replica_engine = async_replica_engine = None
+if DATABASE_REPLICA_URL:
+    replica_engine = create_engine(DATABASE_REPLICA_URL, **engine_options(DATABASE_REPLICA_URL))
+    async_replica_engine = create_async_engine(
+        async_database_url(DATABASE_REPLICA_URL),
+        **engine_options(DATABASE_REPLICA_URL, asynchronous=True)
+    )
+
+
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    db_pool_checkouts_total.inc()
+    db_pool_checked_out.inc()
+
+
+def _count_checkin(dbapi_connection, connection_record):
+    db_pool_checked_out.dec()
+
+for _pool_engine in (engine, async_engine.sync_engine, replica_engine,
+                     async_replica_engine.sync_engine if async_replica_engine else None):
+    if _pool_engine is None:
+        continue
+    event.listen(_pool_engine, "checkout", _count_checkout)
+    event.listen(_pool_engine, "checkin", _count_checkin)
+
+
+def pool_stats() -> Dict:
+    """
+    Connection pool usage of the sync and async engines
+    """
+    def stats(pool):
+        # Only queue-based pools track sizes (SQLite uses simpler pools)
+        return {
+            "pool": type(pool).__name__,
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+        }
+
+    result = {"sync": stats(engine.pool), "async": stats(async_engine.pool)}
+    if replica_engine is not None:
+        result["replica_sync"] = stats(replica_engine.pool)
+        result["replica_async"] = stats(async_replica_engine.pool)
+    return result
 
 Base = declarative_base()
 
+def _read_replica(request: Request, replica: Optional[Engine]) -> Optional[Engine]:
+    """
+    The replica a read session may use: none if there is no replica or the
+    client wrote recently enough that the replica may not have its changes
+    (flagged by ReadYourWritesMiddleware)
+    """
+    if replica is None or request.scope.get("db_recent_write"):
+        return None
+    return replica
+
 # Dependency to get DB session
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    db = SessionLocal(info={"scope": request.scope})
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Dependency to get a DB session for read-only handlers, served by the replica
+def get_read_db(request: Request):
+    db = SessionLocal(replica=_read_replica(request, replica_engine), info={"scope": request.scope})
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency to get an async DB session
+async def get_async_db(request: Request):
+    async with AsyncSessionLocal(info={"scope": request.scope}) as db:
+        yield db
+
+# Dependency to get an async DB session for read-only handlers, served by the replica
+async def get_async_read_db(request: Request):
+    replica = _read_replica(request, async_replica_engine and async_replica_engine.sync_engine)
+    async with AsyncSessionLocal(replica=replica, info={"scope": request.scope}) as db:
+        yield db
@@ -0,0 +1,73 @@
+import csv
+import io
+from typing import AsyncIterator, Callable, List, Sequence
+
+from fastapi.responses import StreamingResponse
+
+from responses import render_json
+
+# Media types and file extensions of the supported export formats
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+}
+
+
+async def stream_rows(stmt, batch_size: int = 500, session_factory: Callable = None) -> AsyncIterator[List]:
+    """
+    Yield the rows of a select in batches through a server-side cursor, so
+    memory use stays constant however many rows there are. The rows are
+    only fetched as fast as the consumer takes them.
+    """
+    if session_factory is None:
+        from database import AsyncSessionLocal
+        session_factory = AsyncSessionLocal
+
+    # The export opens its own session: it outlives the request handler
+    async with session_factory() as db:
+        result = await db.stream_scalars(stmt.execution_options(yield_per=batch_size))
+        async for partition in result.partitions():
+            yield partition
+
+
+def _value(row, column: str):
+    value = getattr(row, column)
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+async def ndjson_chunks(batches: AsyncIterator[List], columns: Sequence[str]) -> AsyncIterator[bytes]:
+    """
+    One JSON object per row, one chunk per batch
+    """
+    async for batch in batches:
+        yield b"".join(render_json({column: getattr(row, column) for column in columns}) + b"\n" for row in batch)
+
+
+async def csv_chunks(batches: AsyncIterator[List], columns: Sequence[str]) -> AsyncIterator[bytes]:
+    """
+    A header line, then one CSV record per row, one chunk per batch
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode("utf-8")
+
+    async for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        for row in batch:
+            writer.writerow([_value(row, column) for column in columns])
+        yield buffer.getvalue().encode("utf-8")
+
+
+def export_response(stmt, columns: Sequence[str], export_format: str, filename: str) -> StreamingResponse:
+    """
+    Stream the rows of a select as an NDJSON or CSV download
+    """
+    media_type, extension = EXPORT_FORMATS[export_format]
+    chunks = ndjson_chunks if export_format == "ndjson" else csv_chunks
+    return StreamingResponse(
+        chunks(stream_rows(stmt), columns),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'}
+    )
@@ -0,0 +1,23 @@
+# jobs/__init__.py
+
+from .archive_chat_history import (
+    ChatPartitionScheduler,
+    archive_chat_history,
+    chat_partition_scheduler,
+    create_chat_partitions,
+    ensure_chat_partitions,
+    maintain_chat_history,
+    purge_chat_archives,
+)
+from .reconcile_task_counts import reconcile_task_counts
+
+__all__ = [
+    "ChatPartitionScheduler",
+    "archive_chat_history",
+    "chat_partition_scheduler",
+    "create_chat_partitions",
+    "ensure_chat_partitions",
+    "maintain_chat_history",
+    "purge_chat_archives",
+    "reconcile_task_counts",
+]
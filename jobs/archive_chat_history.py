@@ -0,0 +1,342 @@
+"""
+Keep chat history bounded:
+
+    python -m jobs.archive_chat_history
+
+On Postgres chat_messages is partitioned by month. This job creates the
+partitions for the coming months, detaches every month older than
+CHAT_ARCHIVE_AFTER_MONTHS, writes it to a gzipped NDJSON file and drops
+it, and deletes archive files older than CHAT_ARCHIVE_PURGE_AFTER_MONTHS.
+Archiving a month again, e.g. rows that arrived late, writes a numbered
+file next to the earlier ones. SQLite has no partitioning, so there the
+exported rows are deleted from the single table instead.
+
+Run it daily, e.g. as a cron service. The app creates upcoming partitions
+by itself (see ChatPartitionScheduler), so only archiving depends on the
+schedule.
+"""
+import asyncio
+import gzip
+import os
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import orjson
+from sqlalchemy import Table, column, delete, func, select
+from sqlalchemy import table as sql_table
+from sqlalchemy.engine import Connection, Engine
+
+from monitoring.metrics import metrics_registry
+
+CHAT_ARCHIVE_DIR = os.getenv("CHAT_ARCHIVE_DIR", "archives")
+CHAT_ARCHIVE_AFTER_MONTHS = int(os.getenv("CHAT_ARCHIVE_AFTER_MONTHS", "6"))
+# 0 keeps archive files forever
+CHAT_ARCHIVE_PURGE_AFTER_MONTHS = int(os.getenv("CHAT_ARCHIVE_PURGE_AFTER_MONTHS", "0"))
+CHAT_PARTITION_MONTHS_AHEAD = int(os.getenv("CHAT_PARTITION_MONTHS_AHEAD", "2"))
+CHAT_PARTITION_CHECK_SECONDS = float(os.getenv("CHAT_PARTITION_CHECK_SECONDS", "3600"))
+
+chat_partition_failures_total = metrics_registry.counter(
+    "chat_partition_failures_total", "Scheduled chat partition checks that failed")
+
+_ARCHIVE_FILE = re.compile(r"^chat_messages_(\d{4})_(\d{2})(?:\.\d+)?\.ndjson\.gz$")
+
+# Holds rows for months that have no partition of their own
+DEFAULT_PARTITION = "chat_messages_default"
+
+# Every stored column; search_vector is generated and cannot be copied
+_COLUMNS = "id, conversation_id, sender_type, sender_id, content, message_type, agent_used, created_at"
+
+# Exported rows deleted per statement
+_DELETE_BATCH = 500
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"chat_messages_y{month:%Y}m{month:%m}"
+
+
+def archive_file_name(month: datetime, part: int = 0) -> str:
+    suffix = f".{part}" if part else ""
+    return f"chat_messages_{month:%Y_%m}{suffix}.ndjson.gz"
+
+
+def _messages_table() -> Table:
+    # Imported late: loading the models needs the database configuration
+    from models.agent_models import ChatMessage
+    return ChatMessage.__table__
+
+
+def _create_partition(connection: Connection, name: str, start: datetime, end: datetime):
+    bounds = f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    in_range = f"created_at >= '{start:%Y-%m-%d}' AND created_at < '{end:%Y-%m-%d}'"
+    stray = connection.exec_driver_sql(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})").scalar()
+    if not stray:
+        connection.exec_driver_sql(f"CREATE TABLE {name} PARTITION OF chat_messages {bounds}")
+        return
+
+    # Postgres refuses a new partition while the default one holds rows in
+    # its range, so take the default out, move those rows, and put it back
+    connection.exec_driver_sql(f"ALTER TABLE chat_messages DETACH PARTITION {DEFAULT_PARTITION}")
+    connection.exec_driver_sql(f"CREATE TABLE {name} PARTITION OF chat_messages {bounds}")
+    connection.exec_driver_sql(
+        f"INSERT INTO {name} ({_COLUMNS}) SELECT {_COLUMNS} FROM {DEFAULT_PARTITION} WHERE {in_range}")
+    connection.exec_driver_sql(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_range}")
+    connection.exec_driver_sql(f"ALTER TABLE chat_messages ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+
+
+def ensure_chat_partitions(connection: Connection, months_ahead: int = CHAT_PARTITION_MONTHS_AHEAD,
+                           start: Optional[datetime] = None, now: Optional[datetime] = None) -> List[str]:
+    """
+    Create the monthly partitions from start (default: this month) up to
+    months_ahead months from now; returns the partitions that were checked.
+    Rows outside every partition land in chat_messages_default; if a month
+    already has rows there when its partition is created, they are moved
+    into the new partition.
+    """
+    if connection.dialect.name != "postgresql":
+        return []
+    now = now or datetime.utcnow()
+    month = month_start(min(start, now) if start else now)
+    last = add_months(month_start(now), months_ahead)
+
+    names = []
+    while month <= last:
+        name = partition_name(month)
+        if not connection.exec_driver_sql(f"SELECT to_regclass('{name}') IS NOT NULL").scalar():
+            _create_partition(connection, name, month, add_months(month, 1))
+        names.append(name)
+        month = add_months(month, 1)
+    return names
+
+
+def create_chat_partitions(engine: Optional[Engine] = None) -> List[str]:
+    """
+    Create the upcoming monthly partitions in their own transaction
+    """
+    if engine is None:
+        from database import engine
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            # Workers starting together take turns instead of racing to
+            # create the same partition
+            connection.exec_driver_sql("SELECT pg_advisory_xact_lock(hashtext('chat_messages_partitions'))")
+        return ensure_chat_partitions(connection)
+
+
+class ChatPartitionScheduler:
+    """
+    Creates the upcoming monthly partitions when the app starts and then
+    every interval seconds, so new months get their partition without
+    relying on an external cron. A failed run is counted and retried at
+    the next interval.
+    """
+
+    def __init__(self, interval: float = 3600.0):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                # The sync engine would block the event loop
+                await asyncio.to_thread(create_chat_partitions)
+            except Exception:
+                chat_partition_failures_total.inc()
+            await asyncio.sleep(self.interval)
+
+
+def _write_rows(archive, connection: Connection, stmt, ids: Optional[List] = None) -> int:
+    count = 0
+    result = connection.execution_options(yield_per=1000).execute(stmt)
+    for rows in result.partitions():
+        for row in rows:
+            archive.write(orjson.dumps(dict(row._mapping)) + b"\n")
+            if ids is not None:
+                ids.append(row.id)
+            count += 1
+    return count
+
+
+def _store_archive(partial: str, month: datetime, archive_dir: str) -> str:
+    """
+    Give a complete archive its final name: the month's file, or the next
+    free number after earlier archives of the month
+    """
+    # Only a complete file ever carries a final name, and linking never
+    # replaces an existing archive
+    part = 0
+    while True:
+        path = os.path.join(archive_dir, archive_file_name(month, part))
+        try:
+            os.link(partial, path)
+        except FileExistsError:
+            part += 1
+            continue
+        os.remove(partial)
+        return path
+
+
+def _detach_partition(engine: Engine, month: datetime) -> Optional[str]:
+    """
+    Take the month's partition out of chat_messages, so that nothing can
+    write to it while it is exported; returns its name, or None if there
+    is none. A partition detached by an earlier run that stopped half way
+    is returned as is.
+    """
+    if engine.dialect.name != "postgresql":
+        return None
+    name = partition_name(month)
+    with engine.begin() as connection:
+        if not connection.exec_driver_sql(f"SELECT to_regclass('{name}') IS NOT NULL").scalar():
+            return None
+        attached = connection.exec_driver_sql(
+            f"SELECT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = '{name}'::regclass)").scalar()
+        if attached:
+            connection.exec_driver_sql(f"ALTER TABLE chat_messages DETACH PARTITION {name}")
+    return name
+
+
+def _detached_months(connection: Connection) -> List[datetime]:
+    # Partitions an earlier run detached but did not get to drop
+    if connection.dialect.name != "postgresql":
+        return []
+    names = connection.exec_driver_sql(
+        r"""SELECT relname FROM pg_class
+            WHERE relkind = 'r' AND NOT relispartition AND relname ~ '^chat_messages_y\d{4}m\d{2}$'"""
+    ).scalars()
+    return [datetime(int(name[15:19]), int(name[20:22]), 1) for name in names]
+
+
+def _archive_month(engine: Engine, start: datetime, end: datetime, archive_dir: str) -> Optional[str]:
+    """
+    Write one month of messages to a gzipped NDJSON file and remove exactly
+    the rows written from the database; returns the file's path, or None
+    if the month had no messages. Earlier archives of the month are kept;
+    the file gets the next free number.
+
+    On Postgres the month's partition is detached first, so it is complete
+    once exported and can be dropped whole. Rows outside it (all of the
+    month on SQLite, stray rows in the default partition on Postgres) are
+    deleted by id, so a row written while the export runs stays behind for
+    the next run instead of being deleted unarchived.
+    """
+    table = _messages_table()
+    in_month = (table.c.created_at >= start, table.c.created_at < end)
+    detached = _detach_partition(engine, start)
+
+    partial = os.path.join(archive_dir, archive_file_name(start) + ".partial")
+    ids: List = []
+    count = 0
+    with engine.connect() as connection, gzip.open(partial, "wb") as archive:
+        if detached:
+            partition = sql_table(detached, *(column(c.name, c.type) for c in table.c))
+            count += _write_rows(archive, connection, select(partition).order_by(
+                partition.c.created_at, partition.c.id))
+        count += _write_rows(archive, connection, select(table).where(*in_month).order_by(
+            table.c.created_at, table.c.id), ids)
+
+    # A month is only removed once its archive is safely written; if the
+    # removal fails, the next run archives those rows again rather than
+    # losing them
+    path = _store_archive(partial, start, archive_dir) if count else None
+    if not count:
+        os.remove(partial)
+    with engine.begin() as connection:
+        if detached:
+            connection.exec_driver_sql(f"DROP TABLE {detached}")
+        for offset in range(0, len(ids), _DELETE_BATCH):
+            connection.execute(delete(table).where(*in_month, table.c.id.in_(ids[offset:offset + _DELETE_BATCH])))
+    return path
+
+
+def archive_chat_history(engine: Optional[Engine] = None, archive_dir: str = CHAT_ARCHIVE_DIR,
+                         keep_months: int = CHAT_ARCHIVE_AFTER_MONTHS,
+                         now: Optional[datetime] = None) -> List[str]:
+    """
+    Move every month of chat history before the last keep_months months
+    to archive_dir and remove it from the database, one month at a time;
+    returns the archive files written
+    """
+    if engine is None:
+        from database import engine
+    cutoff = add_months(month_start(now or datetime.utcnow()), -keep_months)
+    os.makedirs(archive_dir, exist_ok=True)
+
+    created_at = _messages_table().c.created_at
+    with engine.connect() as connection:
+        first = connection.execute(select(func.min(created_at)).where(created_at < cutoff)).scalar()
+        months = [month for month in _detached_months(connection) if month < cutoff]
+    if first is not None:
+        months.append(month_start(first))
+    if not months:
+        return []
+
+    written = []
+    month = min(months)
+    while month < cutoff:
+        end = add_months(month, 1)
+        path = _archive_month(engine, month, end, archive_dir)
+        if path:
+            written.append(path)
+        month = end
+    return written
+
+
+def purge_chat_archives(archive_dir: str = CHAT_ARCHIVE_DIR, keep_months: int = CHAT_ARCHIVE_PURGE_AFTER_MONTHS,
+                        now: Optional[datetime] = None) -> List[str]:
+    """
+    Delete archive files for months before the last keep_months months;
+    returns the files deleted. keep_months=0 keeps everything.
+    """
+    if not keep_months or not os.path.isdir(archive_dir):
+        return []
+    cutoff = add_months(month_start(now or datetime.utcnow()), -keep_months)
+
+    purged = []
+    for name in sorted(os.listdir(archive_dir)):
+        match = _ARCHIVE_FILE.match(name)
+        if match and datetime(int(match.group(1)), int(match.group(2)), 1) < cutoff:
+            path = os.path.join(archive_dir, name)
+            os.remove(path)
+            purged.append(path)
+    return purged
+
+
+def maintain_chat_history(engine: Optional[Engine] = None) -> Dict[str, List[str]]:
+    """
+    Create upcoming partitions, archive cold months and purge old archives
+    """
+    if engine is None:
+        from database import engine
+    return {
+        "partitions": create_chat_partitions(engine),
+        "archived": archive_chat_history(engine),
+        "purged": purge_chat_archives(),
+    }
+
+
+# Global chat partition scheduler, started with the app
+chat_partition_scheduler = ChatPartitionScheduler(interval=CHAT_PARTITION_CHECK_SECONDS)
+
+
+if __name__ == "__main__":
+    print(f"Chat history maintenance: {maintain_chat_history()}")
@@ -0,0 +1,48 @@
+"""
+Rebuild the task status counters from the tasks table:
+
+    python -m jobs.reconcile_task_counts
+
+The counters are maintained incrementally by triggers; this job corrects
+any drift (e.g. after a manual data fix with the triggers disabled).
+"""
+from typing import Dict, Optional
+
+from sqlalchemy.engine import Connection, Engine
+
+
+def rebuild_task_counts(connection: Connection) -> Dict[str, int]:
+    """
+    Replace the counters with fresh GROUP BY counts, inside the caller's
+    transaction; returns the number of counter rows written per table
+    """
+    if connection.dialect.name == "postgresql":
+        # Block task writes until commit so no trigger update is lost
+        # between the DELETE and the recount
+        connection.exec_driver_sql("LOCK TABLE tasks IN SHARE MODE")
+
+    connection.exec_driver_sql("DELETE FROM user_task_counts")
+    connection.exec_driver_sql("DELETE FROM agent_task_counts")
+    users = connection.exec_driver_sql(
+        """INSERT INTO user_task_counts (user_id, status, count)
+           SELECT user_id, coalesce(status, 'pending'), count(*) FROM tasks
+           GROUP BY user_id, coalesce(status, 'pending')""")
+    agents = connection.exec_driver_sql(
+        """INSERT INTO agent_task_counts (agent, status, count)
+           SELECT coalesce(agent_assigned, ''), coalesce(status, 'pending'), count(*) FROM tasks
+           GROUP BY coalesce(agent_assigned, ''), coalesce(status, 'pending')""")
+    return {"user_task_counts": users.rowcount, "agent_task_counts": agents.rowcount}
+
+
+def reconcile_task_counts(engine: Optional[Engine] = None) -> Dict[str, int]:
+    """
+    Rebuild the task status counters in one transaction
+    """
+    if engine is None:
+        from database import engine
+    with engine.begin() as connection:
+        return rebuild_task_counts(connection)
+
+
+if __name__ == "__main__":
+    print(f"Rebuilt task counters: {reconcile_task_counts()}")
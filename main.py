@@ -1,8 +1,14 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import asyncio
 import json
+import math
+import os
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime
 import uuid
@@ -10,15 +16,87 @@ import uuid
 # Import routers
 from routers import chat, agents, websocket, tasks
 
+import crud
+from database import get_async_db, get_async_read_db, pool_stats
+from exports import export_response
+from search import SEARCH_KINDS, search
+from migrations import migrate
+from message_writer import message_writer
+from connection_manager import connection_manager
+from jobs import chat_partition_scheduler
+
 # Import models and agents
-from agents.main_agent import main_agent
+from agents.main_agent import Message, main_agent
 from agents.agent_registry import agent_registry
+from agents.circuit_breaker import circuit_breakers
 from speckit.skills_matcher import skills_matcher
 from speckit.task_analyzer import task_analyzer
+from responses import FastJSONResponse, catalog_cache, render_json
+from middleware import (
+    CompressionMiddleware,
+    LoadSheddingMiddleware,
+    RateLimitMiddleware,
+    ReadYourWritesMiddleware,
+    TimingMiddleware,
+)
+from middleware.rate_limit import charge
+from monitoring.activity import activity_log
+from monitoring.loop_lag import loop_lag_monitor
+from monitoring.metrics import agent_routing_decisions_total, http_requests_total, metrics_registry
+from monitoring.timing import phase, process_rss_bytes, request_stats
+from schemas.conversation import ConversationSummary
+from schemas.agent import (
+    AgentInfo,
+    AgentSkills,
+    TaskRouteResponse,
+    ProcessTaskResponse,
+    MainAgentResponse,
+    AgentTaskResponse,
+    TaskAnalysisResponse,
+    BatchProcessRequest,
+    BatchProcessResponse,
+)
 
 load_dotenv()
 
-app = FastAPI(title="Hackathon 2 Backend")
+# Limits for POST /agents/process/batch
+BATCH_MAX_TASKS = int(os.getenv("BATCH_MAX_TASKS", "500"))
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv("BATCH_DEFAULT_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start background services with the app and stop them on shutdown
+    """
+    if os.getenv("MIGRATE_ON_STARTUP", "false").lower() == "true":
+        # Migrations run on the sync engine, so keep them off the event loop
+        await asyncio.to_thread(migrate)
+    metrics_registry.start()
+    loop_lag_monitor.start()
+    message_writer.start()
+    # Keeps next months' chat history partitions in place (Postgres only)
+    chat_partition_scheduler.start()
+    yield
+    # Drain buffered chat history before anything else shuts down
+    await message_writer.stop()
+    await chat_partition_scheduler.stop()
+    await loop_lag_monitor.stop()
+    await metrics_registry.stop()
+
+# Handlers on the hot paths return FastJSONResponse directly, which skips both
+# jsonable_encoder and response_model re-validation; the response models are
+# still declared for the OpenAPI schema
+app = FastAPI(title="Hackathon 2 Backend", default_response_class=FastJSONResponse, lifespan=lifespan)
+
+# Innermost: routes a client's reads to the primary right after it wrote
+app.add_middleware(ReadYourWritesMiddleware, **ReadYourWritesMiddleware.settings_from_env())
+
+# An overloaded process rejects work before doing any of it
+app.add_middleware(LoadSheddingMiddleware, **LoadSheddingMiddleware.settings_from_env())
+
+# Rate limiting sits inside CORS so 429 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware, **RateLimitMiddleware.settings_from_env())
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,8 +104,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+app.add_middleware(CompressionMiddleware)
+# Added last so it is the outermost middleware and its timings include compression
+app.add_middleware(TimingMiddleware)
+
 # Include routers
 app.include_router(chat.router)
 app.include_router(agents.router)
@@ -38,12 +121,7 @@ app.include_router(tasks.router)
 async def root():
     return {"message": "Hackathon 2 Backend LIVE ✅"}
 
-# 1. Get all agents status
-@app.get("/agents")
-async def get_all_agents():
-    """
-    Get status of all agents in the system
-    """
+def _build_agents_catalog():
     main_agent_info = {
         "id": main_agent.id,
         "name": main_agent.name,
@@ -68,8 +146,24 @@ async def get_all_agents():
         "sub_agents": sub_agents_info
     }
 
+# 1. Get all agents status
+@app.get("/agents")
+async def get_all_agents(request: Request):
+    """
+    Get status of all agents in the system
+    """
+    return catalog_cache.response(request, "agents", agent_registry.version, _build_agents_catalog)
+
+# 17. Get agent types (declared before /agents/{agent_id} so the path parameter does not shadow it)
+@app.get("/agents/types")
+async def get_agent_types(request: Request):
+    """
+    Get different types of agents available
+    """
+    return catalog_cache.response(request, "agent_types", agent_registry.version, _build_agent_types)
+
 # 2. Get specific agent by ID
-@app.get("/agents/{agent_id}")
+@app.get("/agents/{agent_id}", response_model=AgentInfo)
 async def get_agent(agent_id: str):
     """
     Get details of a specific agent by ID
@@ -78,16 +172,16 @@ async def get_agent(agent_id: str):
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
 
-    return {
+    return FastJSONResponse({
         "id": agent.id,
         "name": agent.name,
         "description": agent.description,
         "status": agent.status,
         "skills": agent.skills
-    }
+    })
 
 # 3. Get agent skills
-@app.get("/agents/{agent_id}/skills")
+@app.get("/agents/{agent_id}/skills", response_model=AgentSkills)
 async def get_agent_skills(agent_id: str):
     """
     Get skills of a specific agent
@@ -96,22 +190,28 @@ async def get_agent_skills(agent_id: str):
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
 
-    return {
+    return FastJSONResponse({
         "agent_id": agent.id,
         "agent_name": agent.name,
         "skills": agent.skills
-    }
+    })
 
 # 4. Route task to best agent
-@app.post("/agents/route")
+@app.post("/agents/route", response_model=TaskRouteResponse)
 async def route_task(content: str = Query(..., description="Task content to route")):
     """
     Route a task to the best matching agent based on skills
     """
-    best_agent, confidence = skills_matcher.find_best_agent(content, list(main_agent.sub_agents.values()))
+    # Agents with an open circuit breaker are not considered
+    available_agents = [
+        agent for agent in main_agent.sub_agents.values()
+        if circuit_breakers.get(agent.id).is_available()
+    ]
+    with phase("routing"):
+        best_agent, confidence = skills_matcher.find_best_agent(content, available_agents)
 
     if best_agent:
-        return {
+        return FastJSONResponse({
             "task_content": content,
             "best_agent": {
                 "id": best_agent.id,
@@ -120,17 +220,17 @@ async def route_task(content: str = Query(..., description="Task content to rout
             },
             "confidence": confidence,
             "skills_matched": best_agent.skills
-        }
+        })
     else:
-        return {
+        return FastJSONResponse({
             "task_content": content,
             "best_agent": None,
             "confidence": 0,
             "message": "No suitable agent found for this task"
-        }
+        })
 
 # 5. Process task with main agent
-@app.post("/agents/process")
+@app.post("/agents/process", response_model=ProcessTaskResponse)
 async def process_task(content: str = Query(..., description="Task content to process")):
     """
     Process a task using the main agent orchestrator
@@ -149,18 +249,13 @@ async def process_task(content: str = Query(..., description="Task content to pr
 
     response = await main_agent.process_request(temp_message)
 
-    return {
+    return FastJSONResponse({
         "original_task": content,
         "processed_by": getattr(temp_message, 'agent_used', 'Main Agent'),
         "response": response
-    }
+    })
 
-# 6. Get all skills in the system
-@app.get("/skills")
-async def get_all_skills():
-    """
-    Get all skills across all agents
-    """
+def _build_skills_catalog():
     all_skills = []
 
     for agent_id, agent in main_agent.sub_agents.items():
@@ -174,49 +269,74 @@ async def get_all_skills():
 
     return {"skills": all_skills}
 
+# 6. Get all skills in the system
+@app.get("/skills")
+async def get_all_skills(request: Request):
+    """
+    Get all skills across all agents
+    """
+    return catalog_cache.response(request, "skills", agent_registry.version, _build_skills_catalog)
+
 # 7. Analyze a task
-@app.post("/analyze/task")
+@app.post("/analyze/task", response_model=TaskAnalysisResponse)
 async def analyze_task(content: str = Query(..., description="Task content to analyze")):
     """
     Analyze a task to determine its category and complexity
     """
-    analysis = task_analyzer.analyze_task(content)
+    with phase("analysis"):
+        analysis = task_analyzer.analyze_task(content)
 
-    return {
+    return FastJSONResponse({
         "task_content": content,
         "analysis": analysis
-    }
+    })
 
 # 8. Get agent statistics
 @app.get("/stats")
-async def get_stats():
+async def get_stats(db: AsyncSession = Depends(get_async_db)):
     """
     Get system statistics
     """
     total_agents = len(main_agent.sub_agents) + 1  # +1 for main agent
     active_agents = sum(1 for agent in main_agent.sub_agents.values() if agent.status == "active")
+    routing_decisions = agent_routing_decisions_total.samples()
+    tasks_by_status, tasks_by_agent = await crud.get_task_counts(db)
 
     return {
         "total_agents": total_agents,
         "active_agents": active_agents,
         "main_agent_status": main_agent.status,
         "total_skills": sum(len(agent.skills) for agent in main_agent.sub_agents.values()),
+        "requests_processed": sum(http_requests_total.samples().values()),
+        "tasks_routed": sum(routing_decisions.values()),
+        "tasks_routed_by_agent": {labels[0]: count for labels, count in routing_decisions.items()},
+        "tasks_by_status": tasks_by_status,
+        "tasks_by_agent": tasks_by_agent,
         "timestamp": datetime.utcnow().isoformat()
     }
 
+def _activity_page(limit: int, cursor: Optional[str], agent_id: Optional[str] = None):
+    try:
+        return activity_log.page(limit=limit, cursor=cursor, agent_id=agent_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 # 9. Get agent activity
 @app.get("/activity")
-async def get_activity():
+async def get_activity(limit: int = Query(20, ge=1, le=500), cursor: Optional[str] = None):
     """
-    Get recent activity in the system
+    Get recent activity in the system, newest first
     """
-    # This would normally track actual activity
-    # For now, returning a mock response
+    events, next_cursor = _activity_page(limit, cursor)
+    last_activity = activity_log.last_timestamp()
+
     return {
-        "recent_tasks_processed": 0,
-        "active_conversations": 0,
-        "last_activity": datetime.utcnow().isoformat(),
-        "system_uptime": "Just started"
+        "recent_tasks_processed": sum(agent_routing_decisions_total.samples().values()),
+        "active_conversations": request_stats.active_websockets,
+        "last_activity": last_activity.isoformat() if last_activity else None,
+        "system_uptime": f"{int(time.time() - activity_log.started_at)}s",
+        "events": events,
+        "next_cursor": next_cursor
     }
 
 # 10. Health check
@@ -233,17 +353,24 @@ async def health_check():
 
 # 11. Get conversation history
 @app.get("/conversations")
-async def get_conversations(limit: int = 10, offset: int = 0):
+async def get_conversations(
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
     """
-    Get list of conversations (mock implementation)
+    Get a page of conversations, newest first; pass next_cursor to page back
     """
-    # This would normally fetch from database
-    # For now, returning a mock response
+    try:
+        conversations, next_cursor = await crud.get_conversations(db, user_id=user_id, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
     return {
-        "conversations": [],
-        "total_count": 0,
+        "conversations": [ConversationSummary.model_validate(c).model_dump() for c in conversations],
         "limit": limit,
-        "offset": offset
+        "next_cursor": next_cursor
     }
 
 # 12. Get specific conversation
@@ -261,49 +388,57 @@ async def get_conversation(conversation_id: str):
 
 # 13. Create new conversation
 @app.post("/conversations")
-async def create_conversation(title: str = Query(..., description="Title for the new conversation")):
+async def create_conversation(
+    title: str = Query(..., description="Title for the new conversation"),
+    user_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Create a new conversation (mock implementation)
+    Create a new conversation
     """
-    conversation_id = str(uuid.uuid4())
+    if user_id is not None and crud.as_uuid(user_id) is None:
+        raise HTTPException(status_code=400, detail="Invalid user_id")
+
+    conversation = await crud.create_conversation(db, title=title, user_id=user_id)
 
     return {
-        "conversation_id": conversation_id,
-        "title": title,
-        "created_at": datetime.utcnow().isoformat()
+        "conversation_id": conversation.id,
+        "title": conversation.title,
+        "created_at": conversation.created_at
     }
 
 # 14. Get agent logs
 @app.get("/logs/agents/{agent_id}")
-async def get_agent_logs(agent_id: str, limit: int = 10):
+async def get_agent_logs(agent_id: str, limit: int = Query(10, ge=1, le=500), cursor: Optional[str] = None):
     """
-    Get logs for a specific agent (mock implementation)
+    Get logs for a specific agent, newest first; pass next_cursor to page back
     """
+    logs, next_cursor = _activity_page(limit, cursor, agent_id=agent_id)
+
     return {
         "agent_id": agent_id,
-        "logs": [],
+        "logs": logs,
         "limit": limit,
-        "total_count": 0
+        "total_count": activity_log.count(agent_id),
+        "next_cursor": next_cursor
     }
 
 # 15. Get all logs
 @app.get("/logs")
-async def get_all_logs(limit: int = 10):
+async def get_all_logs(limit: int = Query(10, ge=1, le=500), cursor: Optional[str] = None):
     """
-    Get system-wide logs (mock implementation)
+    Get system-wide logs, newest first; pass next_cursor to page back
     """
+    logs, next_cursor = _activity_page(limit, cursor)
+
     return {
-        "logs": [],
+        "logs": logs,
         "limit": limit,
-        "total_count": 0
+        "total_count": activity_log.count(),
+        "next_cursor": next_cursor
     }
 
-# 16. Get system config
-@app.get("/config")
-async def get_config():
-    """
-    Get system configuration
-    """
+def _build_config():
     return {
         "system_name": "AI Agent Chat System",
         "version": "1.0.0",
@@ -313,12 +448,15 @@ async def get_config():
         "database_connected": True
     }
 
-# 17. Get agent types
-@app.get("/agents/types")
-async def get_agent_types():
+# 16. Get system config
+@app.get("/config")
+async def get_config(request: Request):
     """
-    Get different types of agents available
+    Get system configuration
     """
+    return catalog_cache.response(request, "config", agent_registry.version, _build_config)
+
+def _build_agent_types():
     return {
         "agent_types": [
             {"type": "main", "description": "Main orchestrator agent"},
@@ -327,12 +465,7 @@ async def get_agent_types():
         "total_types": 2
     }
 
-# 18. Get skills by category
-@app.get("/skills/categories")
-async def get_skills_by_category():
-    """
-    Get skills organized by categories
-    """
+def _build_skills_by_category():
     categories = {}
 
     for agent_id, agent in main_agent.sub_agents.items():
@@ -367,6 +500,14 @@ async def get_skills_by_category():
 
     return {"categories": categories}
 
+# 18. Get skills by category
+@app.get("/skills/categories")
+async def get_skills_by_category(request: Request):
+    """
+    Get skills organized by categories
+    """
+    return catalog_cache.response(request, "skills_categories", agent_registry.version, _build_skills_by_category)
+
 # 19. Get agent workload
 @app.get("/agents/{agent_id}/workload")
 async def get_agent_workload(agent_id: str):
@@ -382,6 +523,7 @@ async def get_agent_workload(agent_id: str):
         "agent_name": agent.name,
         "current_tasks": 0,
         "status": agent.status,
+        "circuit_breaker": circuit_breakers.get(agent.id).snapshot(),
         "estimated_completion": None
     }
 
@@ -389,13 +531,21 @@ async def get_agent_workload(agent_id: str):
 @app.get("/performance")
 async def get_performance():
     """
-    Get system performance metrics (mock implementation)
+    Get system performance metrics measured by the timing middleware
     """
+    overall = request_stats.overall.summary()
+
     return {
-        "response_time_ms": 0,
-        "active_connections": 0,
-        "cpu_usage_percent": 0,
-        "memory_usage_mb": 0,
+        "response_time_ms": overall["mean_ms"] or 0,
+        "latency": overall,
+        "routes": {route: histogram.summary() for route, histogram in request_stats.routes.items()},
+        "phases": {name: histogram.summary() for name, histogram in request_stats.phases.items()},
+        "event_loop_lag": loop_lag_monitor.summary(),
+        "database_pool": pool_stats(),
+        "request_rate_per_second": round(request_stats.rate.rate(), 3),
+        "active_connections": request_stats.active_connections,
+        "cpu_usage_percent": request_stats.cpu_percent(),
+        "memory_usage_mb": round(process_rss_bytes() / (1024 * 1024), 2),
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -414,7 +564,14 @@ async def reset_agent_status(agent_id: str, status: str = Query(..., description
     if status not in valid_statuses:
         raise HTTPException(status_code=400, detail=f"Invalid status. Valid statuses: {valid_statuses}")
 
-    agent.status = status
+    # Goes through the registry so cached catalog responses are re-rendered
+    agent_registry.set_agent_status(agent_id, status)
+    connection_manager.broadcast({
+        "type": "agent_status",
+        "agent_id": agent.id,
+        "status": status,
+        "timestamp": datetime.utcnow().isoformat()
+    })
 
     return {
         "agent_id": agent.id,
@@ -423,7 +580,7 @@ async def reset_agent_status(agent_id: str, status: str = Query(..., description
     }
 
 # 22. Main agent endpoint - User message → Main Agent
-@app.post("/agents/main")
+@app.post("/agents/main", response_model=MainAgentResponse)
 async def process_with_main_agent(content: str = Query(..., description="Content to process by the main agent")):
     """
     Process a user message through the main agent
@@ -442,15 +599,15 @@ async def process_with_main_agent(content: str = Query(..., description="Content
 
     response = await main_agent.process_request(temp_message)
 
-    return {
+    return FastJSONResponse({
         "original_content": content,
         "processed_by": getattr(temp_message, 'agent_used', 'Main Agent'),
         "response": response,
         "timestamp": datetime.utcnow().isoformat()
-    }
+    })
 
 # 23. Frontend agent endpoint - Next.js tasks
-@app.post("/agents/frontend")
+@app.post("/agents/frontend", response_model=AgentTaskResponse)
 async def process_frontend_task(content: str = Query(..., description="Frontend task content")):
     """
     Process frontend-related tasks (Next.js, UI, etc.)
@@ -477,17 +634,18 @@ async def process_frontend_task(content: str = Query(..., description="Frontend
         'timestamp': datetime.utcnow()
     })()
 
-    response = await frontend_agent.process_request(temp_message)
+    with phase("agent"):
+        response = await main_agent.process_with(frontend_agent, temp_message)
 
-    return {
+    return FastJSONResponse({
         "task_content": content,
         "processed_by": frontend_agent.name,
         "response": response,
         "timestamp": datetime.utcnow().isoformat()
-    }
+    })
 
 # 24. Backend agent endpoint - FastAPI tasks
-@app.post("/agents/backend")
+@app.post("/agents/backend", response_model=AgentTaskResponse)
 async def process_backend_task(content: str = Query(..., description="Backend task content")):
     """
     Process backend-related tasks (FastAPI, APIs, etc.)
@@ -514,17 +672,18 @@ async def process_backend_task(content: str = Query(..., description="Backend ta
         'timestamp': datetime.utcnow()
     })()
 
-    response = await backend_agent.process_request(temp_message)
+    with phase("agent"):
+        response = await main_agent.process_with(backend_agent, temp_message)
 
-    return {
+    return FastJSONResponse({
         "task_content": content,
         "processed_by": backend_agent.name,
         "response": response,
         "timestamp": datetime.utcnow().isoformat()
-    }
+    })
 
 # 25. Database agent endpoint - Neon Postgres tasks
-@app.post("/agents/database")
+@app.post("/agents/database", response_model=AgentTaskResponse)
 async def process_database_task(content: str = Query(..., description="Database task content")):
     """
     Process database-related tasks (Neon Postgres, queries, etc.)
@@ -551,17 +710,18 @@ async def process_database_task(content: str = Query(..., description="Database
         'timestamp': datetime.utcnow()
     })()
 
-    response = await database_agent.process_request(temp_message)
+    with phase("agent"):
+        response = await main_agent.process_with(database_agent, temp_message)
 
-    return {
+    return FastJSONResponse({
         "task_content": content,
         "processed_by": database_agent.name,
         "response": response,
         "timestamp": datetime.utcnow().isoformat()
-    }
+    })
 
 # 26. Chat agent endpoint - WebSocket chat tasks
-@app.post("/agents/chat")
+@app.post("/agents/chat", response_model=AgentTaskResponse)
 async def process_chat_task(content: str = Query(..., description="Chat task content")):
     """
     Process chat-related tasks (WebSocket, messaging, etc.)
@@ -588,17 +748,18 @@ async def process_chat_task(content: str = Query(..., description="Chat task con
         'timestamp': datetime.utcnow()
     })()
 
-    response = await chat_agent.process_request(temp_message)
+    with phase("agent"):
+        response = await main_agent.process_with(chat_agent, temp_message)
 
-    return {
+    return FastJSONResponse({
         "task_content": content,
         "processed_by": chat_agent.name,
         "response": response,
         "timestamp": datetime.utcnow().isoformat()
-    }
+    })
 
 # 27. Auth agent endpoint - JWT login tasks
-@app.post("/agents/auth")
+@app.post("/agents/auth", response_model=AgentTaskResponse)
 async def process_auth_task(content: str = Query(..., description="Auth task content")):
     """
     Process authentication-related tasks (JWT, login, etc.)
@@ -625,17 +786,18 @@ async def process_auth_task(content: str = Query(..., description="Auth task con
         'timestamp': datetime.utcnow()
     })()
 
-    response = await auth_agent.process_request(temp_message)
+    with phase("agent"):
+        response = await main_agent.process_with(auth_agent, temp_message)
 
-    return {
+    return FastJSONResponse({
         "task_content": content,
         "processed_by": auth_agent.name,
         "response": response,
         "timestamp": datetime.utcnow().isoformat()
-    }
+    })
 
 # 28. DevOps agent endpoint - Railway deploy tasks
-@app.post("/agents/devops")
+@app.post("/agents/devops", response_model=AgentTaskResponse)
 async def process_devops_task(content: str = Query(..., description="DevOps task content")):
     """
     Process DevOps-related tasks (Railway, deployment, etc.)
@@ -662,17 +824,18 @@ async def process_devops_task(content: str = Query(..., description="DevOps task
         'timestamp': datetime.utcnow()
     })()
 
-    response = await devops_agent.process_request(temp_message)
+    with phase("agent"):
+        response = await main_agent.process_with(devops_agent, temp_message)
 
-    return {
+    return FastJSONResponse({
         "task_content": content,
         "processed_by": devops_agent.name,
         "response": response,
         "timestamp": datetime.utcnow().isoformat()
-    }
+    })
 
 # 29. Test agent endpoint - Testing tasks
-@app.post("/agents/test")
+@app.post("/agents/test", response_model=AgentTaskResponse)
 async def process_test_task(content: str = Query(..., description="Test task content")):
     """
     Process testing-related tasks (unit, integration, etc.)
@@ -699,17 +862,18 @@ async def process_test_task(content: str = Query(..., description="Test task con
         'timestamp': datetime.utcnow()
     })()
 
-    response = await test_agent.process_request(temp_message)
+    with phase("agent"):
+        response = await main_agent.process_with(test_agent, temp_message)
 
-    return {
+    return FastJSONResponse({
         "task_content": content,
         "processed_by": test_agent.name,
         "response": response,
         "timestamp": datetime.utcnow().isoformat()
-    }
+    })
 
 # 30. Integration agent endpoint - Full system sync tasks
-@app.post("/agents/integration")
+@app.post("/agents/integration", response_model=AgentTaskResponse)
 async def process_integration_task(content: str = Query(..., description="Integration task content")):
     """
     Process integration-related tasks (full system sync, etc.)
@@ -729,11 +893,155 @@ async def process_integration_task(content: str = Query(..., description="Integr
         'timestamp': datetime.utcnow()
     })()
 
+    # The main agent times its own routing and agent phases
     response = await integration_agent.process_request(temp_message)
 
-    return {
+    return FastJSONResponse({
         "task_content": content,
         "processed_by": integration_agent.name,
         "response": response,
         "timestamp": datetime.utcnow().isoformat()
-    }
\ No newline at end of file
+    })
+
+# 31. Prometheus metrics
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Metrics in the Prometheus text exposition format, merged across workers
+    """
+    return PlainTextResponse(
+        metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+# 32. Process many tasks in one request
+@app.post("/agents/process/batch", response_model=BatchProcessResponse)
+async def process_task_batch(batch: BatchProcessRequest, request: Request):
+    """
+    Process a batch of tasks with the main agent, running them concurrently
+    under a limit. Results are returned in request order, or, with
+    "stream": true, written as NDJSON lines in completion order. Each task
+    costs one token of the batch rate limit bucket.
+    """
+    if len(batch.tasks) > BATCH_MAX_TASKS:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {BATCH_MAX_TASKS} tasks")
+
+    # The rate limiter already took one token for the request itself
+    wait = charge(request.scope, len(batch.tasks) - 1)
+    if math.isinf(wait):
+        raise HTTPException(status_code=429, detail="Batch is larger than the rate limit allows, split it up")
+    if wait:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded",
+                            headers={"Retry-After": str(max(1, math.ceil(wait)))})
+
+    conversation_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    messages = [
+        Message(
+            id=task.id or str(uuid.uuid4()),
+            conversation_id=conversation_id,
+            sender_type="user",
+            sender_id="temp-user-id",
+            content=task.content,
+            message_type="task",
+            timestamp=now
+        )
+        for task in batch.tasks
+    ]
+    concurrency = min(batch.concurrency or BATCH_DEFAULT_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+
+    def result(index, response, error):
+        return {
+            "index": index,
+            "id": batch.tasks[index].id,
+            "processed_by": messages[index].agent_used,
+            "response": response,
+            "error": error
+        }
+
+    if batch.stream:
+        async def lines():
+            async for index, response, error in main_agent.process_batch(messages, concurrency):
+                yield render_json(result(index, response, error)) + b"\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    results = [None] * len(messages)
+    async for index, response, error in main_agent.process_batch(messages, concurrency):
+        results[index] = result(index, response, error)
+
+    failed = sum(1 for item in results if item["error"] is not None)
+    return FastJSONResponse({
+        "results": results,
+        "total": len(results),
+        "succeeded": len(results) - failed,
+        "failed": failed
+    })
+
+# Columns written by conversation exports
+MESSAGE_EXPORT_COLUMNS = ("id", "conversation_id", "sender_type", "sender_id", "content",
+                          "message_type", "agent_used", "created_at")
+
+# 33. Export conversation history
+@app.get("/conversations/{conversation_id}/export")
+async def export_conversation(
+    conversation_id: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    since: Optional[datetime] = Query(None, description="Only messages at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only messages before this time"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Stream the messages of a conversation, oldest first, as NDJSON or CSV
+    """
+    if not await crud.get_conversation(db, conversation_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    return export_response(
+        crud.conversation_export_statement(conversation_id, since, until),
+        MESSAGE_EXPORT_COLUMNS,
+        format,
+        f"conversation-{conversation_id}"
+    )
+
+# 34. Full-text search over chat messages and tasks
+@app.get("/search")
+async def search_history(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to search for"),
+    type: Optional[str] = Query(None, pattern="^(message|task)$", description="Only search messages or tasks"),
+    user_id: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+    agent: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Search chat messages and tasks, best match first; pass next_cursor to
+    get the next page
+    """
+    ids = {"user_id": user_id, "conversation_id": conversation_id}
+    for name, value in ids.items():
+        if value is not None and crud.as_uuid(value) is None:
+            raise HTTPException(status_code=400, detail=f"Invalid {name}")
+
+    try:
+        results, next_cursor = await search(
+            db,
+            q,
+            kinds=(type,) if type else SEARCH_KINDS,
+            user_id=crud.as_uuid(user_id) if user_id else None,
+            conversation_id=crud.as_uuid(conversation_id) if conversation_id else None,
+            agent=agent,
+            limit=limit,
+            cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return {
+        "query": q,
+        "results": results,
+        "limit": limit,
+        "next_cursor": next_cursor
+    }
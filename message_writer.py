@@ -0,0 +1,260 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import orjson
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models.agent_models import ChatMessage, Conversation, User
+from monitoring.metrics import metrics_registry
+
+chat_messages_persisted_total = metrics_registry.counter(
+    "chat_messages_persisted_total", "Chat messages written to the database")
+chat_messages_dropped_total = metrics_registry.counter(
+    "chat_messages_dropped_total", "Chat messages dropped by the write-behind buffer, by reason", ("reason",))
+chat_messages_pending = metrics_registry.gauge(
+    "chat_messages_pending", "Chat messages waiting in the write-behind buffer")
+chat_message_flushes_total = metrics_registry.counter(
+    "chat_message_flushes_total", "Batched chat message flushes, by result", ("result",))
+
+# Sentinel that tells the flusher to write what it has and exit
+_STOP = object()
+
+SENDER_TYPES = ("user", "main_agent", "sub_agent")
+
+
+def stable_uuid(value) -> uuid.UUID:
+    """
+    The UUID for an ID that may not be one: valid UUIDs are kept, anything
+    else (e.g. "default-user" or an agent name) maps to a fixed UUIDv5
+    """
+    try:
+        return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+    except ValueError:
+        return uuid.uuid5(uuid.NAMESPACE_URL, f"chat:{value}")
+
+
+def _optional_uuid(value) -> Optional[uuid.UUID]:
+    if value is None or isinstance(value, uuid.UUID):
+        return value
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def _text(value, limit: Optional[int] = None) -> Optional[str]:
+    """
+    Client-supplied value as a string that fits its column
+    """
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        value = orjson.dumps(value, default=str).decode()
+    return value[:limit] if limit else value
+
+
+class ChatMessageWriter:
+    """
+    Write-behind buffer for chat history. Handlers enqueue messages and
+    return immediately; a background task writes them in batches once
+    batch_size messages are waiting or flush_interval has passed, so chat
+    latency does not depend on the database.
+
+    The buffer is bounded: when it is full, add() waits up to put_timeout
+    for space (backpressure) and then drops the message. On shutdown the
+    buffer is drained before the flusher exits.
+
+    Values come from clients, so add() coerces them to the column types
+    and lengths; should a batch still fail to insert after its retries,
+    its rows are written one at a time and only the failing ones dropped.
+    """
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 0.25, max_pending: int = 10000,
+                 put_timeout: float = 1.0, retries: int = 3, drain_timeout: float = 10.0,
+                 session_factory: Optional[Callable] = None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.drain_timeout = drain_timeout
+        self.session_factory = session_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        """
+        Start the background flusher on the running event loop
+        """
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = asyncio.get_running_loop().create_task(self._run(self._queue))
+
+    async def stop(self):
+        """
+        Stop accepting messages, write everything still buffered and stop
+        """
+        if self._task is None:
+            return
+        queue, task = self._queue, self._task
+        self._queue = None
+        self._task = None
+        await queue.put(_STOP)
+        try:
+            await asyncio.wait_for(task, self.drain_timeout)
+        except asyncio.TimeoutError:
+            chat_messages_dropped_total.labels("shutdown").inc(queue.qsize())
+            print(f"Chat history drain timed out with {queue.qsize()} messages unwritten")
+
+    async def add(self, conversation_id, sender_type: str, sender_id, content: str,
+                  message_type: str = "text", agent_used: Optional[str] = None,
+                  conversation_title: Optional[str] = None, created_at: Optional[datetime] = None,
+                  user_id=None) -> bool:
+        """
+        Queue a message for writing; returns False if it had to be dropped.
+        user_id becomes the owner of the conversation if this message
+        creates it and the user exists.
+        """
+        queue = self._queue
+        if queue is None:
+            chat_messages_dropped_total.labels("not_running").inc()
+            return False
+
+        row = {
+            "id": uuid.uuid4(),
+            "conversation_id": stable_uuid(conversation_id),
+            "sender_type": sender_type if sender_type in SENDER_TYPES else "user",
+            "sender_id": stable_uuid(sender_id),
+            "content": _text(content) or "",
+            "message_type": _text(message_type, 20),
+            "agent_used": _text(agent_used, 100),
+            "created_at": created_at or datetime.utcnow(),
+            # Not columns; used to create the conversation if it is new
+            "conversation_title": _text(conversation_title, 255),
+            "user_id": _optional_uuid(user_id),
+        }
+        try:
+            queue.put_nowait(row)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(queue.put(row), self.put_timeout)
+            except asyncio.TimeoutError:
+                chat_messages_dropped_total.labels("buffer_full").inc()
+                return False
+        return True
+
+    async def _run(self, queue: asyncio.Queue):
+        # Given the queue, as stop() may clear self._queue before this runs
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stopping = False
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush_with_retry(batch)
+            if stopping:
+                return
+
+    async def _flush_with_retry(self, batch: List[Dict]):
+        for attempt in range(self.retries + 1):
+            try:
+                await self.flush(batch)
+                chat_message_flushes_total.labels("ok").inc()
+                chat_messages_persisted_total.inc(len(batch))
+                return
+            except Exception as e:
+                chat_message_flushes_total.labels("error").inc()
+                if attempt == self.retries:
+                    break
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+        # One bad row must not cost everyone else's messages
+        for row in batch:
+            try:
+                await self.flush([row])
+                chat_messages_persisted_total.inc()
+            except Exception as e:
+                chat_messages_dropped_total.labels("write_failed").inc()
+                print(f"Dropping chat message {row['id']} after failed writes: {str(e)}")
+
+    async def flush(self, batch: List[Dict]):
+        """
+        Write a batch in one transaction: first any conversations that do
+        not exist yet, then all messages in one batched insert
+        """
+        if self.session_factory is None:
+            from database import AsyncSessionLocal
+            self.session_factory = AsyncSessionLocal
+
+        now = datetime.utcnow()
+        conversations = {}
+        for row in batch:
+            conversations.setdefault(row["conversation_id"], {
+                "id": row["conversation_id"],
+                "user_id": row["user_id"],
+                "title": row["conversation_title"] or f"Conversation {row['conversation_id']}",
+                "status": "active",
+                "created_at": row["created_at"],
+                "updated_at": now,
+            })
+        messages = [
+            {key: value for key, value in row.items() if key not in ("conversation_title", "user_id")}
+            for row in batch
+        ]
+
+        async with self.session_factory() as session:
+            owners = {conversation["user_id"] for conversation in conversations.values()} - {None}
+            if owners:
+                # Unknown users would violate the foreign key; those conversations get no owner
+                known = set(await session.scalars(select(User.id).where(User.id.in_(owners))))
+                for conversation in conversations.values():
+                    if conversation["user_id"] not in known:
+                        conversation["user_id"] = None
+            dialect = session.bind.dialect.name
+            insert_conversation = postgresql_insert if dialect == "postgresql" else sqlite_insert
+            await session.execute(
+                insert_conversation(Conversation).on_conflict_do_nothing(index_elements=["id"]),
+                list(conversations.values())
+            )
+            await session.execute(insert(ChatMessage), messages)
+            await session.commit()
+
+# Global chat history writer
+message_writer = ChatMessageWriter(
+    batch_size=int(os.getenv("CHAT_WRITE_BATCH_SIZE", "200")),
+    flush_interval=float(os.getenv("CHAT_WRITE_FLUSH_SECONDS", "0.25")),
+    max_pending=int(os.getenv("CHAT_WRITE_MAX_PENDING", "10000")),
+)
+
+chat_messages_pending.set_function(message_writer.pending)
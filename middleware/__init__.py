@@ -0,0 +1,10 @@
+# middleware/__init__.py
+
+from .compression import CompressionMiddleware
+from .load_shedding import LoadSheddingMiddleware
+from .rate_limit import RateLimitMiddleware
+from .read_your_writes import ReadYourWritesMiddleware
+from .timing import TimingMiddleware
+
+__all__ = ["CompressionMiddleware", "LoadSheddingMiddleware", "RateLimitMiddleware", "ReadYourWritesMiddleware",
+           "TimingMiddleware"]
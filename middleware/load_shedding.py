@@ -0,0 +1,116 @@
+import os
+from typing import Callable, Dict, Iterable, Optional
+
+import orjson
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from monitoring.loop_lag import loop_lag_monitor
+from monitoring.metrics import agent_queue_depth, metrics_registry
+
+shed_requests_total = metrics_registry.counter(
+    "shed_requests_total", "Requests rejected by the load shedder, by reason", ("reason",))
+
+# Share of each overload threshold a class of request may use before it is
+# shed: critical requests keep being served well past the point where
+# expensive, retryable ones are turned away
+PRIORITY_HEADROOM = {"critical": 2.0, "normal": 1.0, "low": 0.5}
+
+_WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+def route_priority(scope: Scope) -> str:
+    """
+    Classify a request for shedding: task writes are critical; agent
+    processing and catalog reads (agents, skills) are low priority
+    """
+    method, path = scope["method"], scope["path"]
+    if method in _WRITE_METHODS and path.startswith("/api/") and "/tasks" in path:
+        return "critical"
+    if method == "POST" and path.startswith(("/agents/", "/analyze/")):
+        return "low"
+    if method == "GET" and path.startswith(("/agents", "/skills")):
+        return "low"
+    return "normal"
+
+
+class LoadSheddingMiddleware:
+    """
+    Rejects new HTTP requests with 503 while the process is overloaded, i.e.
+    while the event loop lag or the agent queue depth is above its
+    threshold. Shedding early and cheaply keeps a burst from turning into a
+    latency spiral. Thresholds are scaled by the request's priority from
+    classify, so low priority work is shed first and critical writes last.
+    Health checks and metrics scrapes are always served, and WebSocket
+    sessions are never touched.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_loop_lag: float = 0.25,
+        max_queue_depth: int = 200,
+        exempt_paths: Iterable[str] = ("/health", "/metrics"),
+        retry_after: int = 1,
+        enabled: bool = True,
+        loop_lag: Optional[Callable[[], float]] = None,
+        queue_depth: Optional[Callable[[], float]] = None,
+        classify: Callable[[Scope], str] = route_priority,
+        headroom: Optional[Dict[str, float]] = None,
+    ):
+        self.app = app
+        self.enabled = enabled
+        self.max_loop_lag = max_loop_lag
+        self.max_queue_depth = max_queue_depth
+        self.exempt_paths = tuple(exempt_paths)
+        self.retry_after = str(retry_after).encode()
+        self.loop_lag = loop_lag or (lambda: loop_lag_monitor.lag)
+        self.queue_depth = queue_depth or agent_queue_depth.labels().value
+        self.classify = classify
+        self.headroom = headroom or PRIORITY_HEADROOM
+
+    def overload_reason(self, priority: str = "normal") -> Optional[str]:
+        """
+        Why the process is too overloaded for requests of this priority,
+        or None if it is not
+        """
+        headroom = self.headroom.get(priority, 1.0)
+        if self.loop_lag() > self.max_loop_lag * headroom:
+            return "loop_lag"
+        if self.queue_depth() > self.max_queue_depth * headroom:
+            return "queue_depth"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self.enabled or scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        reason = self.overload_reason(self.classify(scope))
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        shed_requests_total.labels(reason).inc()
+        body = orjson.dumps({"detail": "Server is overloaded, retry shortly"})
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", self.retry_after),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @classmethod
+    def settings_from_env(cls) -> Dict:
+        """
+        Middleware options read from LOAD_SHEDDING_* environment variables
+        """
+        return {
+            "enabled": os.getenv("LOAD_SHEDDING_ENABLED", "true").lower() == "true",
+            "max_loop_lag": float(os.getenv("LOAD_SHEDDING_MAX_LOOP_LAG_MS", "250")) / 1000,
+            "max_queue_depth": int(os.getenv("LOAD_SHEDDING_MAX_QUEUE_DEPTH", "200")),
+            "retry_after": int(os.getenv("LOAD_SHEDDING_RETRY_AFTER", "1")),
+        }
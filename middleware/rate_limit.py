@@ -0,0 +1,215 @@
+import math
+import os
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+import orjson
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from clients import TRUST_FORWARDED_FOR, client_key
+from monitoring.metrics import metrics_registry
+
+rate_limited_requests_total = metrics_registry.counter(
+    "rate_limited_requests_total", "Requests rejected by the rate limiter", ("bucket",))
+
+# Key used once the store is full, so a flood of distinct clients shares one bucket
+OVERFLOW_KEY = "__overflow__"
+
+
+class TokenBucketStore:
+    """
+    Token buckets for many clients, stored compactly: two float arrays
+    indexed through a dict, with freed slots reused. Keys idle long enough
+    for their bucket to refill completely are evicted by a periodic sweep,
+    which loses no state since a full bucket is the default for a new key.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100000, idle_seconds: float = 600.0):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.idle_seconds = max(idle_seconds, burst / rate)
+        self._slots: Dict[str, int] = {}
+        self._tokens = array("d")
+        self._stamps = array("d")
+        self._free: List[int] = []
+        self._next_sweep = time.monotonic() + self.idle_seconds
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def take(self, key: str, now: Optional[float] = None, cost: float = 1.0) -> float:
+        """
+        Take tokens for a request; returns 0 if allowed, otherwise the
+        number of seconds until enough tokens will be available
+        """
+        now = time.monotonic() if now is None else now
+        if now >= self._next_sweep:
+            self.sweep(now)
+
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._allocate(key, now)
+        elapsed = now - self._stamps[slot]
+        tokens = min(self.burst, self._tokens[slot] + elapsed * self.rate)
+
+        self._stamps[slot] = now
+        if tokens >= cost:
+            self._tokens[slot] = tokens - cost
+            return 0.0
+        self._tokens[slot] = tokens
+        return (cost - tokens) / self.rate
+
+    def sweep(self, now: Optional[float] = None):
+        """
+        Evict keys whose buckets have been idle long enough to be full again
+        """
+        now = time.monotonic() if now is None else now
+        cutoff = now - self.idle_seconds
+        for key, slot in list(self._slots.items()):
+            if self._stamps[slot] < cutoff:
+                del self._slots[key]
+                self._free.append(slot)
+        self._next_sweep = now + self.idle_seconds
+
+    def _allocate(self, key: str, now: float) -> int:
+        if len(self._slots) >= self.max_keys:
+            self.sweep(now)
+            if len(self._slots) >= self.max_keys:
+                slot = self._slots.get(OVERFLOW_KEY)
+                if slot is not None:
+                    return slot
+                key = OVERFLOW_KEY
+
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._tokens)
+            self._tokens.append(0.0)
+            self._stamps.append(0.0)
+        self._slots[key] = slot
+        self._tokens[slot] = self.burst
+        self._stamps[slot] = now
+        return slot
+
+
+def charge(scope: Scope, cost: float) -> float:
+    """
+    Take cost more tokens from the bucket the request was admitted against,
+    for handlers whose work grows with the request body. Returns 0 if
+    allowed, otherwise the seconds to wait, which is infinite when cost
+    is more than the bucket can ever hold. Always 0 if rate limiting is off.
+    """
+    admitted = scope.get("rate_limit")
+    if admitted is None or cost <= 0:
+        return 0.0
+    store, key = admitted
+    if cost > store.burst:
+        return math.inf
+    return store.take(key, cost=cost)
+
+
+class RateLimitMiddleware:
+    """
+    Per-client token-bucket admission control, keyed by clients.client_key
+    (see clients.py for why X-Forwarded-For is trusted by default).
+    Expensive agent-processing calls draw from their own, smaller bucket so
+    that cheap catalog reads and agent work are limited independently.
+    Batch endpoints draw one token per task from a third bucket sized to
+    hold a full batch. Rejected requests get 429 with Retry-After.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        default_rate: float = 20.0,
+        default_burst: float = 100.0,
+        agent_rate: float = 2.0,
+        agent_burst: float = 20.0,
+        batch_rate: float = 10.0,
+        batch_burst: float = 500.0,
+        agent_paths: Iterable[str] = ("/agents/", "/analyze/", "/api/v1/chat/send"),
+        batch_paths: Iterable[str] = ("/agents/process/batch",),
+        exempt_paths: Iterable[str] = ("/health", "/metrics"),
+        max_keys: int = 100000,
+        idle_seconds: float = 600.0,
+        trust_forwarded: bool = TRUST_FORWARDED_FOR,
+        api_keys: Iterable[str] = (),
+        enabled: bool = True,
+    ):
+        self.app = app
+        self.enabled = enabled
+        self.api_keys = frozenset(api_keys)
+        self.agent_paths = tuple(agent_paths)
+        self.batch_paths = tuple(batch_paths)
+        self.exempt_paths = tuple(exempt_paths)
+        self.trust_forwarded = trust_forwarded
+        self.buckets = {
+            "default": TokenBucketStore(default_rate, default_burst, max_keys, idle_seconds),
+            "agent": TokenBucketStore(agent_rate, agent_burst, max_keys, idle_seconds),
+            "batch": TokenBucketStore(batch_rate, batch_burst, max_keys, idle_seconds),
+        }
+
+    def bucket_for(self, scope: Scope) -> Optional[str]:
+        path = scope["path"]
+        if path in self.exempt_paths or scope["method"] == "OPTIONS":
+            return None
+        if scope["method"] == "POST" and path in self.batch_paths:
+            return "batch"
+        if scope["method"] == "POST" and path.startswith(self.agent_paths):
+            return "agent"
+        return "default"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        bucket = self.bucket_for(scope)
+        if bucket is None:
+            await self.app(scope, receive, send)
+            return
+
+        store = self.buckets[bucket]
+        key = client_key(scope, self.trust_forwarded, self.api_keys)
+        wait = store.take(key)
+        if not wait:
+            # Lets handlers charge more for requests that carry more work
+            scope["rate_limit"] = (store, key)
+            await self.app(scope, receive, send)
+            return
+
+        rate_limited_requests_total.labels(bucket).inc()
+        body = orjson.dumps({"detail": "Rate limit exceeded"})
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @classmethod
+    def settings_from_env(cls) -> Dict:
+        """
+        Middleware options read from RATE_LIMIT_* environment variables
+        """
+        return {
+            "enabled": os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true",
+            "default_rate": float(os.getenv("RATE_LIMIT_DEFAULT_RATE", "20")),
+            "default_burst": float(os.getenv("RATE_LIMIT_DEFAULT_BURST", "100")),
+            "agent_rate": float(os.getenv("RATE_LIMIT_AGENT_RATE", "2")),
+            "agent_burst": float(os.getenv("RATE_LIMIT_AGENT_BURST", "20")),
+            # Tasks, not requests; the burst lets one largest allowed batch through
+            "batch_rate": float(os.getenv("RATE_LIMIT_BATCH_RATE", "10")),
+            "batch_burst": float(os.getenv("RATE_LIMIT_BATCH_BURST", os.getenv("BATCH_MAX_TASKS", "500"))),
+            "max_keys": int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")),
+            "idle_seconds": float(os.getenv("RATE_LIMIT_IDLE_SECONDS", "600")),
+            "trust_forwarded": TRUST_FORWARDED_FOR,
+            # Keys that get their own bucket instead of their IP's
+            "api_keys": [key.strip() for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key.strip()],
+        }
@@ -0,0 +1,54 @@
+import os
+from typing import Dict
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import cookie_parser
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Scope keys shared with the read sessions in database.py: "db_recent_write"
+# tells them the client wrote recently, and they set "db_wrote" when a
+# request commits a write
+RECENT_WRITE_SCOPE_KEY = "db_recent_write"
+WROTE_SCOPE_KEY = "db_wrote"
+
+
+class ReadYourWritesMiddleware:
+    """
+    Keeps a client's reads on the primary for sticky_seconds after it
+    wrote, so the read replica's lag cannot hide its own writes. A request
+    that commits a write sets a cookie that expires after sticky_seconds;
+    while the client sends it back, its read sessions skip the replica.
+    The client holds the state, so every worker honours it and clients
+    that share an address do not pin each other to the primary. Clients
+    that do not keep cookies read from the replica right after writing.
+    """
+
+    def __init__(self, app: ASGIApp, sticky_seconds: float = 5.0, cookie_name: str = "db_wrote"):
+        self.app = app
+        self.sticky_seconds = sticky_seconds
+        self.cookie_name = cookie_name
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self.sticky_seconds <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        cookies = cookie_parser(Headers(scope=scope).get("cookie", ""))
+        scope[RECENT_WRITE_SCOPE_KEY] = self.cookie_name in cookies
+
+        async def send_with_cookie(message: Message):
+            if message["type"] == "http.response.start" and scope.get(WROTE_SCOPE_KEY):
+                headers = MutableHeaders(scope=message)
+                headers.append("Set-Cookie", f"{self.cookie_name}=1; Max-Age={max(1, round(self.sticky_seconds))}; "
+                                             "Path=/; HttpOnly; SameSite=Lax")
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+    @classmethod
+    def settings_from_env(cls) -> Dict:
+        """
+        Middleware options read from DB_REPLICA_STICKY_SECONDS; 0 turns
+        read-your-writes stickiness off
+        """
+        return {"sticky_seconds": float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))}
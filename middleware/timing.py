@@ -0,0 +1,74 @@
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from monitoring.metrics import http_request_duration_seconds, http_requests_total
+from monitoring.timing import begin_request, request_stats
+
+
+def route_path(scope: Scope) -> str:
+    """
+    The route template that handled a request, e.g. "/agents/{agent_id}";
+    unmatched paths share one label so 404 scans cannot grow the route table
+    """
+    return getattr(scope.get("route"), "path", None) or "UNMATCHED"
+
+
+class TimingMiddleware:
+    """
+    Records per-route latency (for /performance and /metrics), tracks active
+    connections and adds a Server-Timing header listing the phases measured
+    while handling the request
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "websocket":
+            request_stats.active_websockets += 1
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                request_stats.active_websockets -= 1
+            return
+
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        phases = begin_request()
+        recorded = False
+        status = 500
+
+        def record():
+            duration = time.perf_counter() - start
+            method, path = scope["method"], route_path(scope)
+            request_stats.record_request(f"{method} {path}", duration)
+            http_requests_total.labels(method, path, status).inc()
+            http_request_duration_seconds.labels(method, path).observe(duration)
+
+        async def send_with_timing(message: Message):
+            nonlocal recorded, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                entries = [f"{name};dur={duration * 1000:.3f}" for name, duration in phases.items()]
+                entries.append(f"app;dur={elapsed_ms:.3f}")
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", ", ".join(entries))
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                recorded = True
+                record()
+            await send(message)
+
+        request_stats.active_requests += 1
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_stats.active_requests -= 1
+            if not recorded:
+                # Failed or disconnected before the body was complete
+                record()
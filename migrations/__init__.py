@@ -0,0 +1,6 @@
+# migrations/__init__.py
+
+from .runner import Migration, applied_versions, migrate
+from .versions import MIGRATIONS
+
+__all__ = ["Migration", "MIGRATIONS", "applied_versions", "migrate"]
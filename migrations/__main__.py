@@ -0,0 +1,13 @@
+"""
+Apply pending schema migrations to DATABASE_URL:
+
+    python -m migrations
+"""
+from . import migrate
+
+if __name__ == "__main__":
+    applied = migrate()
+    for migration in applied:
+        print(f"Applied {migration!r}")
+    if not applied:
+        print("Schema is up to date")
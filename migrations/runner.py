@@ -0,0 +1,67 @@
+from datetime import datetime
+from typing import Callable, List, Optional, Set
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, insert, select
+from sqlalchemy.engine import Connection, Engine
+
+# Bookkeeping table recording which migrations have been applied
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration:
+    """
+    One schema change. upgrade receives a connection inside the migration's
+    own transaction, so a failing migration leaves no partial changes.
+    """
+
+    def __init__(self, version: int, name: str, upgrade: Callable[[Connection], None]):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+
+    def __repr__(self) -> str:
+        return f"<Migration {self.version:04d} {self.name}>"
+
+
+def applied_versions(connection: Connection) -> Set[int]:
+    """
+    Versions already recorded in schema_migrations
+    """
+    schema_migrations.create(connection, checkfirst=True)
+    return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def migrate(engine: Optional[Engine] = None, target: Optional[int] = None,
+            migrations: Optional[List[Migration]] = None) -> List[Migration]:
+    """
+    Apply pending migrations in version order, up to target if given, and
+    return the ones applied
+    """
+    if engine is None:
+        from database import engine
+    if migrations is None:
+        from .versions import MIGRATIONS as migrations
+
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+
+    applied = []
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version in done or (target is not None and migration.version > target):
+            continue
+        with engine.begin() as connection:
+            migration.upgrade(connection)
+            connection.execute(insert(schema_migrations).values(
+                version=migration.version,
+                name=migration.name,
+                applied_at=datetime.utcnow()
+            ))
+        applied.append(migration)
+    return applied
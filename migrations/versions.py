@@ -0,0 +1,349 @@
+from sqlalchemy import JSON, Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text, Uuid
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from .runner import Migration
+
+# Table definitions are frozen here as they were when each migration was
+# written, rather than taken from the ORM models, so that replaying the
+# history on a fresh database always produces the same schema
+
+
+def _0001_initial_schema(connection: Connection):
+    metadata = MetaData()
+    tables = [
+        Table(
+            "users", metadata,
+            Column("id", Uuid(as_uuid=True), primary_key=True),
+            Column("username", String(30), unique=True, nullable=False),
+            Column("email", String(255), unique=True, nullable=False),
+            Column("created_at", DateTime),
+            Column("updated_at", DateTime),
+        ),
+        Table(
+            "conversations", metadata,
+            Column("id", Uuid(as_uuid=True), primary_key=True),
+            Column("user_id", Uuid(as_uuid=True), ForeignKey("users.id")),
+            Column("title", String(255)),
+            Column("status", String(20)),
+            Column("created_at", DateTime),
+            Column("updated_at", DateTime),
+        ),
+        Table(
+            "chat_messages", metadata,
+            Column("id", Uuid(as_uuid=True), primary_key=True),
+            Column("conversation_id", Uuid(as_uuid=True), ForeignKey("conversations.id")),
+            Column("sender_type", String(20), nullable=False),
+            Column("sender_id", Uuid(as_uuid=True), nullable=False),
+            Column("content", Text, nullable=False),
+            Column("message_type", String(20)),
+            Column("agent_used", String(100)),
+            Column("created_at", DateTime),
+        ),
+        Table(
+            "tasks", metadata,
+            Column("id", Uuid(as_uuid=True), primary_key=True),
+            Column("user_id", Uuid(as_uuid=True), ForeignKey("users.id"), nullable=False),
+            Column("title", String(255), nullable=False),
+            Column("description", Text),
+            Column("agent_assigned", String(100)),
+            Column("status", String(20)),
+            Column("created_at", DateTime),
+            Column("updated_at", DateTime),
+        ),
+        Table(
+            "main_agents", metadata,
+            Column("id", Uuid(as_uuid=True), primary_key=True),
+            Column("name", String(100), nullable=False),
+            Column("description", Text),
+            Column("status", String(20)),
+            Column("created_at", DateTime),
+            Column("updated_at", DateTime),
+        ),
+        Table(
+            "sub_agents", metadata,
+            Column("id", Uuid(as_uuid=True), primary_key=True),
+            Column("name", String(100), unique=True, nullable=False),
+            Column("description", Text),
+            Column("skills", JSON),
+            Column("status", String(20)),
+            Column("created_at", DateTime),
+            Column("updated_at", DateTime),
+        ),
+        Table(
+            "skills_definitions", metadata,
+            Column("id", Uuid(as_uuid=True), primary_key=True),
+            Column("agent_id", Uuid(as_uuid=True), ForeignKey("sub_agents.id")),
+            Column("skill_name", String(100), nullable=False),
+            Column("description", Text),
+            Column("keywords", JSON),
+            Column("created_at", DateTime),
+            Column("updated_at", DateTime),
+        ),
+    ]
+    # IF NOT EXISTS adopts databases whose tables were created before migrations existed
+    for table in tables:
+        connection.execute(CreateTable(table, if_not_exists=True))
+
+
+def _0002_access_path_indexes(connection: Connection):
+    metadata = MetaData()
+    tasks = Table("tasks", metadata, Column("id"), Column("user_id"), Column("created_at"))
+    conversations = Table("conversations", metadata, Column("id"), Column("user_id"), Column("created_at"))
+    chat_messages = Table("chat_messages", metadata, Column("id"), Column("conversation_id"), Column("created_at"))
+
+    # Each index ends in (created_at, id) so keyset pages are index range
+    # scans; newest-first pages walk the same index backwards, which both
+    # Postgres and SQLite do without a DESC index
+    indexes = [
+        Index("ix_tasks_user_created_id", tasks.c.user_id, tasks.c.created_at, tasks.c.id),
+        Index("ix_conversations_user_created_id", conversations.c.user_id, conversations.c.created_at, conversations.c.id),
+        Index("ix_conversations_created_id", conversations.c.created_at, conversations.c.id),
+        Index("ix_chat_messages_conversation_created_id",
+              chat_messages.c.conversation_id, chat_messages.c.created_at, chat_messages.c.id),
+    ]
+    for index in indexes:
+        connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+def _0003_full_text_search(connection: Connection):
+    if connection.dialect.name == "postgresql":
+        # Generated columns keep the vectors current on every write; titles
+        # weigh more than descriptions when ranking tasks
+        statements = [
+            """ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+               GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED""",
+            "CREATE INDEX IF NOT EXISTS ix_chat_messages_search ON chat_messages USING GIN (search_vector)",
+            """ALTER TABLE tasks ADD COLUMN IF NOT EXISTS search_vector tsvector
+               GENERATED ALWAYS AS (
+                   setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                   setweight(to_tsvector('english', coalesce(description, '')), 'B')
+               ) STORED""",
+            "CREATE INDEX IF NOT EXISTS ix_tasks_search ON tasks USING GIN (search_vector)",
+        ]
+    else:
+        # SQLite (local and tests): FTS5 tables keyed by the row id and kept
+        # in sync by triggers
+        statements = [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5(id UNINDEXED, content)",
+            "INSERT INTO chat_messages_fts (id, content) SELECT id, content FROM chat_messages",
+            """CREATE TRIGGER IF NOT EXISTS chat_messages_fts_insert AFTER INSERT ON chat_messages BEGIN
+                   INSERT INTO chat_messages_fts (id, content) VALUES (new.id, new.content);
+               END""",
+            """CREATE TRIGGER IF NOT EXISTS chat_messages_fts_update AFTER UPDATE OF content ON chat_messages BEGIN
+                   UPDATE chat_messages_fts SET content = new.content WHERE id = old.id;
+               END""",
+            """CREATE TRIGGER IF NOT EXISTS chat_messages_fts_delete AFTER DELETE ON chat_messages BEGIN
+                   DELETE FROM chat_messages_fts WHERE id = old.id;
+               END""",
+            "CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(id UNINDEXED, title, description)",
+            "INSERT INTO tasks_fts (id, title, description) SELECT id, title, description FROM tasks",
+            """CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+                   INSERT INTO tasks_fts (id, title, description) VALUES (new.id, new.title, new.description);
+               END""",
+            """CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+                   UPDATE tasks_fts SET title = new.title, description = new.description WHERE id = old.id;
+               END""",
+            """CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+                   DELETE FROM tasks_fts WHERE id = old.id;
+               END""",
+        ]
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+def _0004_task_status_counters(connection: Connection):
+    metadata = MetaData()
+    user_counts = Table(
+        "user_task_counts", metadata,
+        Column("user_id", Uuid(as_uuid=True), primary_key=True),
+        Column("status", String(20), primary_key=True),
+        Column("count", Integer, nullable=False, server_default="0"),
+    )
+    agent_counts = Table(
+        "agent_task_counts", metadata,
+        # '' stands for tasks without an assigned agent
+        Column("agent", String(100), primary_key=True),
+        Column("status", String(20), primary_key=True),
+        Column("count", Integer, nullable=False, server_default="0"),
+    )
+    for table in (user_counts, agent_counts):
+        connection.execute(CreateTable(table, if_not_exists=True))
+
+    # Triggers keep the counters in the same transaction as every task
+    # write, whichever code path (ORM, bulk or single-statement) makes it
+    if connection.dialect.name == "postgresql":
+        statements = [
+            """CREATE OR REPLACE FUNCTION tasks_maintain_counts() RETURNS trigger AS $$
+               BEGIN
+                   IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                       UPDATE user_task_counts SET count = count - 1
+                       WHERE user_id = OLD.user_id AND status = coalesce(OLD.status, 'pending');
+                       UPDATE agent_task_counts SET count = count - 1
+                       WHERE agent = coalesce(OLD.agent_assigned, '') AND status = coalesce(OLD.status, 'pending');
+                   END IF;
+                   IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                       INSERT INTO user_task_counts (user_id, status, count)
+                       VALUES (NEW.user_id, coalesce(NEW.status, 'pending'), 1)
+                       ON CONFLICT (user_id, status) DO UPDATE SET count = user_task_counts.count + 1;
+                       INSERT INTO agent_task_counts (agent, status, count)
+                       VALUES (coalesce(NEW.agent_assigned, ''), coalesce(NEW.status, 'pending'), 1)
+                       ON CONFLICT (agent, status) DO UPDATE SET count = agent_task_counts.count + 1;
+                   END IF;
+                   RETURN NULL;
+               END
+               $$ LANGUAGE plpgsql""",
+            "DROP TRIGGER IF EXISTS tasks_counts ON tasks",
+            """CREATE TRIGGER tasks_counts
+               AFTER INSERT OR DELETE OR UPDATE OF status, user_id, agent_assigned ON tasks
+               FOR EACH ROW EXECUTE FUNCTION tasks_maintain_counts()""",
+        ]
+    else:
+        decrement = """
+            UPDATE user_task_counts SET count = count - 1
+            WHERE user_id = old.user_id AND status = coalesce(old.status, 'pending');
+            UPDATE agent_task_counts SET count = count - 1
+            WHERE agent = coalesce(old.agent_assigned, '') AND status = coalesce(old.status, 'pending');"""
+        increment = """
+            INSERT INTO user_task_counts (user_id, status, count)
+            VALUES (new.user_id, coalesce(new.status, 'pending'), 1)
+            ON CONFLICT (user_id, status) DO UPDATE SET count = count + 1;
+            INSERT INTO agent_task_counts (agent, status, count)
+            VALUES (coalesce(new.agent_assigned, ''), coalesce(new.status, 'pending'), 1)
+            ON CONFLICT (agent, status) DO UPDATE SET count = count + 1;"""
+        statements = [
+            f"CREATE TRIGGER IF NOT EXISTS tasks_counts_insert AFTER INSERT ON tasks BEGIN {increment} END",
+            f"CREATE TRIGGER IF NOT EXISTS tasks_counts_delete AFTER DELETE ON tasks BEGIN {decrement} END",
+            f"""CREATE TRIGGER IF NOT EXISTS tasks_counts_update
+                AFTER UPDATE OF status, user_id, agent_assigned ON tasks BEGIN {decrement} {increment} END""",
+        ]
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+    # Counts for tasks that existed before the triggers
+    statements = [
+        "DELETE FROM user_task_counts",
+        "DELETE FROM agent_task_counts",
+        """INSERT INTO user_task_counts (user_id, status, count)
+           SELECT user_id, coalesce(status, 'pending'), count(*) FROM tasks
+           GROUP BY user_id, coalesce(status, 'pending')""",
+        """INSERT INTO agent_task_counts (agent, status, count)
+           SELECT coalesce(agent_assigned, ''), coalesce(status, 'pending'), count(*) FROM tasks
+           GROUP BY coalesce(agent_assigned, ''), coalesce(status, 'pending')""",
+    ]
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+def _0005_task_versions(connection: Connection):
+    # Row version for optimistic concurrency; existing rows start at 1
+    connection.exec_driver_sql("ALTER TABLE tasks ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+
+def _0006_partition_chat_messages(connection: Connection):
+    if connection.dialect.name != "postgresql":
+        # SQLite has no table partitioning; the archival job deletes
+        # archived months from the single table instead
+        return
+    # The partition key has to be part of the primary key and never NULL
+    connection.exec_driver_sql(
+        "UPDATE chat_messages SET created_at = now() AT TIME ZONE 'utc' WHERE created_at IS NULL")
+    first = connection.exec_driver_sql("SELECT min(created_at) FROM chat_messages").scalar()
+    now = connection.exec_driver_sql("SELECT now() AT TIME ZONE 'utc'").scalar()
+
+    columns = "id, conversation_id, sender_type, sender_id, content, message_type, agent_used, created_at"
+    connection.exec_driver_sql("ALTER TABLE chat_messages RENAME TO chat_messages_unpartitioned")
+    connection.exec_driver_sql(
+        "ALTER TABLE chat_messages_unpartitioned RENAME CONSTRAINT chat_messages_pkey TO chat_messages_unpartitioned_pkey")
+    connection.exec_driver_sql(
+        """CREATE TABLE chat_messages (
+               id UUID NOT NULL,
+               conversation_id UUID REFERENCES conversations (id),
+               sender_type VARCHAR(20) NOT NULL,
+               sender_id UUID NOT NULL,
+               content TEXT NOT NULL,
+               message_type VARCHAR(20),
+               agent_used VARCHAR(100),
+               created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+               search_vector tsvector GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED,
+               PRIMARY KEY (id, created_at)
+           ) PARTITION BY RANGE (created_at)""")
+    # Catches rows for months whose partition has not been created yet
+    connection.exec_driver_sql("CREATE TABLE chat_messages_default PARTITION OF chat_messages DEFAULT")
+    # Monthly partitions from the oldest message up to two months ahead
+    month = (min(first, now) if first else now).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    last = now.year * 12 + now.month + 2
+    while month.year * 12 + month.month <= last:
+        following = month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+        connection.exec_driver_sql(
+            f"CREATE TABLE chat_messages_y{month:%Y}m{month:%m} PARTITION OF chat_messages "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        )
+        month = following
+
+    connection.exec_driver_sql(
+        f"INSERT INTO chat_messages ({columns}) SELECT {columns} FROM chat_messages_unpartitioned")
+    connection.exec_driver_sql("DROP TABLE chat_messages_unpartitioned")
+    # Indexes on the parent are created on every partition, current and future
+    connection.exec_driver_sql(
+        "CREATE INDEX ix_chat_messages_conversation_created_id ON chat_messages (conversation_id, created_at, id)")
+    connection.exec_driver_sql("CREATE INDEX ix_chat_messages_search ON chat_messages USING GIN (search_vector)")
+
+def _0007_external_content_fts(connection: Connection):
+    if connection.dialect.name == "postgresql":
+        return
+    # The 0003 FTS tables matched rows on an UNINDEXED id column, so every
+    # trigger update and delete scanned the whole index. External-content
+    # tables keyed by the source rowid look rows up by the FTS5 primary key
+    # and read the text back from the source table. Tables without an
+    # INTEGER PRIMARY KEY may be renumbered by VACUUM, so run
+    # INSERT INTO <table>_fts (<table>_fts) VALUES ('rebuild') after one
+    statements = [
+        "DROP TRIGGER IF EXISTS chat_messages_fts_insert",
+        "DROP TRIGGER IF EXISTS chat_messages_fts_update",
+        "DROP TRIGGER IF EXISTS chat_messages_fts_delete",
+        "DROP TABLE IF EXISTS chat_messages_fts",
+        "CREATE VIRTUAL TABLE chat_messages_fts USING fts5(content, content='chat_messages', content_rowid='rowid')",
+        "INSERT INTO chat_messages_fts (chat_messages_fts) VALUES ('rebuild')",
+        """CREATE TRIGGER chat_messages_fts_insert AFTER INSERT ON chat_messages BEGIN
+               INSERT INTO chat_messages_fts (rowid, content) VALUES (new.rowid, new.content);
+           END""",
+        """CREATE TRIGGER chat_messages_fts_update AFTER UPDATE OF content ON chat_messages BEGIN
+               INSERT INTO chat_messages_fts (chat_messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+               INSERT INTO chat_messages_fts (rowid, content) VALUES (new.rowid, new.content);
+           END""",
+        """CREATE TRIGGER chat_messages_fts_delete AFTER DELETE ON chat_messages BEGIN
+               INSERT INTO chat_messages_fts (chat_messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+           END""",
+        "DROP TRIGGER IF EXISTS tasks_fts_insert",
+        "DROP TRIGGER IF EXISTS tasks_fts_update",
+        "DROP TRIGGER IF EXISTS tasks_fts_delete",
+        "DROP TABLE IF EXISTS tasks_fts",
+        "CREATE VIRTUAL TABLE tasks_fts USING fts5(title, description, content='tasks', content_rowid='rowid')",
+        "INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')",
+        """CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks BEGIN
+               INSERT INTO tasks_fts (rowid, title, description) VALUES (new.rowid, new.title, new.description);
+           END""",
+        """CREATE TRIGGER tasks_fts_update AFTER UPDATE OF title, description ON tasks BEGIN
+               INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+                   VALUES ('delete', old.rowid, old.title, old.description);
+               INSERT INTO tasks_fts (rowid, title, description) VALUES (new.rowid, new.title, new.description);
+           END""",
+        """CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks BEGIN
+               INSERT INTO tasks_fts (tasks_fts, rowid, title, description)
+                   VALUES ('delete', old.rowid, old.title, old.description);
+           END""",
+    ]
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+MIGRATIONS = [
+    Migration(1, "initial_schema", _0001_initial_schema),
+    Migration(2, "access_path_indexes", _0002_access_path_indexes),
+    Migration(3, "full_text_search", _0003_full_text_search),
+    Migration(4, "task_status_counters", _0004_task_status_counters),
+    Migration(5, "task_versions", _0005_task_versions),
+    Migration(6, "partition_chat_messages", _0006_partition_chat_messages),
+    Migration(7, "external_content_fts", _0007_external_content_fts),
+]
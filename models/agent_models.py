@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, JSON
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, JSON, Index
+from sqlalchemy import Uuid
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from database import Base
@@ -9,19 +9,55 @@ from datetime import datetime
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
     username = Column(String(30), unique=True, nullable=False)
     email = Column(String(255), unique=True, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     conversations = relationship("Conversation", back_populates="user")
+    tasks = relationship("Task", back_populates="user")
+
+class Task(Base):
+    __tablename__ = "tasks"
+
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(Uuid(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    title = Column(String(255), nullable=False)
+    description = Column(Text)
+    agent_assigned = Column(String(100))
+    status = Column(String(20), default='pending')  # 'pending', 'in_progress', 'completed', 'failed'
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped by every update; conditional updates compare it to detect lost updates
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    user = relationship("User", back_populates="tasks")
+
+    # Serves keyset pagination of a user's tasks on (created_at, id)
+    __table_args__ = (Index("ix_tasks_user_created_id", "user_id", "created_at", "id"),)
+
+class UserTaskCount(Base):
+    """Number of a user's tasks in each status, maintained by database triggers"""
+    __tablename__ = "user_task_counts"
+
+    user_id = Column(Uuid(as_uuid=True), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class AgentTaskCount(Base):
+    """Number of tasks per assigned agent ('' when unassigned) and status, maintained by database triggers"""
+    __tablename__ = "agent_task_counts"
+
+    agent = Column(String(100), primary_key=True)
+    status = Column(String(20), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
 
 class Conversation(Base):
     __tablename__ = "conversations"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(Uuid(as_uuid=True), ForeignKey("users.id"))
     title = Column(String(255))
     status = Column(String(20), default='active')
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -30,25 +66,33 @@ class Conversation(Base):
     user = relationship("User", back_populates="conversations")
     messages = relationship("ChatMessage", back_populates="conversation")
 
+    __table_args__ = (
+        Index("ix_conversations_user_created_id", "user_id", "created_at", "id"),
+        Index("ix_conversations_created_id", "created_at", "id"),
+    )
+
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id"))
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    conversation_id = Column(Uuid(as_uuid=True), ForeignKey("conversations.id"))
     sender_type = Column(String(20), nullable=False)  # 'user', 'main_agent', 'sub_agent'
-    sender_id = Column(UUID(as_uuid=True), nullable=False)
+    sender_id = Column(Uuid(as_uuid=True), nullable=False)
     content = Column(Text, nullable=False)
     message_type = Column(String(20), default='text')  # 'text', 'command', 'response', 'progress_update'
     agent_used = Column(String(100))  # Which agent processed this message, optional
 
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Part of the key because Postgres partitions the table by month on it
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
 
     conversation = relationship("Conversation", back_populates="messages")
 
+    __table_args__ = (Index("ix_chat_messages_conversation_created_id", "conversation_id", "created_at", "id"),)
+
 class MainAgent(Base):
     __tablename__ = "main_agents"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String(100), nullable=False)
     description = Column(Text)
     status = Column(String(20), default='active')
@@ -58,7 +102,7 @@ class MainAgent(Base):
 class SubAgent(Base):
     __tablename__ = "sub_agents"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String(100), unique=True, nullable=False)
     description = Column(Text)
     skills = Column(JSON)  # List of skills/capabilities
@@ -69,8 +113,8 @@ class SubAgent(Base):
 class SkillsDefinition(Base):
     __tablename__ = "skills_definitions"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    agent_id = Column(UUID(as_uuid=True), ForeignKey("sub_agents.id"))
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    agent_id = Column(Uuid(as_uuid=True), ForeignKey("sub_agents.id"))
     skill_name = Column(String(100), nullable=False)
     description = Column(Text)
     keywords = Column(JSON)  # Keywords associated with the skill
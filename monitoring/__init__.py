@@ -0,0 +1,8 @@
+# monitoring/__init__.py
+
+from .histogram import LatencyHistogram
+from .loop_lag import loop_lag_monitor
+from .metrics import metrics_registry
+from .timing import request_stats, phase
+
+__all__ = ["LatencyHistogram", "loop_lag_monitor", "metrics_registry", "request_stats", "phase"]
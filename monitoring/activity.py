@@ -0,0 +1,118 @@
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+class ActivityLog:
+    """
+    Fixed-capacity ring buffer of structured activity events. Slots are
+    preallocated and overwritten oldest-first, so memory stays bounded no
+    matter the traffic; appending is O(1) and never blocks the event loop.
+
+    Every event gets a monotonically increasing sequence number, which is
+    also the pagination cursor. A bounded per-agent index of sequence
+    numbers lets agent-specific reads skip unrelated events.
+    """
+
+    def __init__(self, capacity: int = 10000, per_agent_capacity: int = 2000):
+        self.capacity = capacity
+        self.per_agent_capacity = per_agent_capacity
+        self._events: List[Optional[Dict]] = [None] * capacity
+        self._next_seq = 1
+        self._by_agent: Dict[str, Deque[int]] = {}
+        self.started_at = time.time()
+
+    def record(self, kind: str, agent_id: Optional[str] = None, message: Optional[str] = None,
+               latency_ms: Optional[float] = None, error: Optional[str] = None, **details) -> int:
+        """
+        Append an event and return its sequence number
+        """
+        seq = self._next_seq
+        self._next_seq = seq + 1
+        event = {
+            "seq": seq,
+            "timestamp": datetime.utcnow(),
+            "kind": kind,
+            "agent_id": agent_id,
+            "message": message,
+            "latency_ms": latency_ms,
+            "error": error,
+        }
+        if details:
+            event["details"] = details
+        self._events[seq % self.capacity] = event
+
+        if agent_id is not None:
+            index = self._by_agent.get(agent_id)
+            if index is None:
+                index = self._by_agent[agent_id] = deque(maxlen=self.per_agent_capacity)
+            index.append(seq)
+        return seq
+
+    def __len__(self) -> int:
+        return min(self._next_seq - 1, self.capacity)
+
+    @property
+    def oldest_seq(self) -> int:
+        return max(1, self._next_seq - self.capacity)
+
+    def _get(self, seq: int) -> Optional[Dict]:
+        event = self._events[seq % self.capacity]
+        # The slot may already hold a newer event
+        if event is not None and event["seq"] == seq:
+            return event
+        return None
+
+    def page(self, limit: int = 50, cursor: Optional[str] = None,
+             agent_id: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Return up to limit events older than the cursor, newest first, and
+        the cursor for the next page (None when there are no older events)
+        """
+        before = min(self._parse_cursor(cursor), self._next_seq)
+        if agent_id is not None:
+            candidates = reversed(self._by_agent.get(agent_id, ()))
+        else:
+            candidates = range(before - 1, self.oldest_seq - 1, -1)
+
+        events = []
+        for seq in candidates:
+            if seq >= before:
+                continue
+            event = self._get(seq)
+            if event is None:
+                # Evicted from the ring; everything older is gone too
+                break
+            if len(events) == limit:
+                return events, str(events[-1]["seq"])
+            events.append(event)
+        return events, None
+
+    def count(self, agent_id: Optional[str] = None) -> int:
+        """
+        Number of events still held, optionally for one agent
+        """
+        if agent_id is None:
+            return len(self)
+        oldest = self.oldest_seq
+        return sum(1 for seq in self._by_agent.get(agent_id, ()) if seq >= oldest)
+
+    def last_timestamp(self) -> Optional[datetime]:
+        event = self._get(self._next_seq - 1)
+        return event["timestamp"] if event else None
+
+    def _parse_cursor(self, cursor: Optional[str]) -> int:
+        if not cursor:
+            return self._next_seq
+        try:
+            return int(cursor)
+        except ValueError:
+            raise ValueError("Invalid cursor")
+
+# Global activity log for this process
+activity_log = ActivityLog(
+    capacity=int(os.getenv("ACTIVITY_LOG_CAPACITY", "10000")),
+    per_agent_capacity=int(os.getenv("ACTIVITY_LOG_PER_AGENT_CAPACITY", "2000")),
+)
@@ -0,0 +1,93 @@
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+
+def log_linear_bounds(minimum: float = 0.0001, maximum: float = 120.0, growth: float = 1.1) -> List[float]:
+    """
+    Bucket upper bounds growing geometrically from minimum to maximum, which
+    keeps the relative error of a percentile estimate under (growth - 1)
+    """
+    bounds = []
+    bound = minimum
+    while bound < maximum:
+        bounds.append(bound)
+        bound *= growth
+    bounds.append(maximum)
+    return bounds
+
+# Shared by every latency histogram so they can be merged and exported together
+DEFAULT_LATENCY_BOUNDS = log_linear_bounds()
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket histogram of durations in seconds. Recording is a bisect
+    and an integer increment, so it is cheap enough for every request.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "total", "min", "max")
+
+    def __init__(self, bounds: Optional[List[float]] = None):
+        self.bounds = bounds or DEFAULT_LATENCY_BOUNDS
+        # One extra bucket for values above the last bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def record(self, value: float):
+        """
+        Record one duration in seconds
+        """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        Estimate a percentile (0-1), interpolating linearly inside the bucket
+        """
+        if not self.count:
+            return None
+
+        rank = percentile * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if not bucket_count:
+                continue
+            if cumulative + bucket_count >= rank:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                fraction = (rank - cumulative) / bucket_count
+                estimate = lower + (upper - lower) * fraction
+                # Never report outside the observed range
+                return min(max(estimate, self.min), self.max)
+            cumulative += bucket_count
+        return self.max
+
+    def mean(self) -> Optional[float]:
+        """
+        Average recorded duration
+        """
+        return self.total / self.count if self.count else None
+
+    def summary(self) -> Dict:
+        """
+        Count and latency percentiles in milliseconds
+        """
+        def to_ms(value):
+            return round(value * 1000, 3) if value is not None else None
+
+        return {
+            "count": self.count,
+            "mean_ms": to_ms(self.mean()),
+            "p50_ms": to_ms(self.percentile(0.50)),
+            "p95_ms": to_ms(self.percentile(0.95)),
+            "p99_ms": to_ms(self.percentile(0.99)),
+            "max_ms": to_ms(self.max),
+        }
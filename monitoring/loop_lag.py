@@ -0,0 +1,61 @@
+import asyncio
+import os
+from typing import Optional
+
+from .histogram import LatencyHistogram
+from .metrics import metrics_registry
+
+event_loop_lag_seconds = metrics_registry.gauge(
+    "event_loop_lag_seconds", "Smoothed event loop scheduling lag in seconds")
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop lag: a background task sleeps for a fixed interval
+    and records how late it wakes up. Blocking CPU work on the loop shows up
+    here directly, before it shows up as request latency.
+    """
+
+    def __init__(self, interval: float = 0.1, smoothing: float = 0.3):
+        self.interval = interval
+        self.smoothing = smoothing
+        # Exponentially weighted moving average, so one slow tick does not
+        # flip the load shedder on and off
+        self.lag = 0.0
+        self.histogram = LatencyHistogram()
+        self._task: Optional[asyncio.Task] = None
+
+    def sample(self, lag: float):
+        """
+        Record one lag measurement in seconds
+        """
+        self.histogram.record(lag)
+        self.lag = self.smoothing * lag + (1 - self.smoothing) * self.lag
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.lag = 0.0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.sample(max(0.0, loop.time() - start - self.interval))
+
+    def summary(self) -> dict:
+        return {
+            "current_ms": round(self.lag * 1000, 3),
+            **self.histogram.summary(),
+        }
+
+# Global event loop lag monitor for this process
+loop_lag_monitor = LoopLagMonitor(interval=float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.1")))
+
+event_loop_lag_seconds.set_function(lambda: loop_lag_monitor.lag)
@@ -0,0 +1,484 @@
+import asyncio
+import fcntl
+import glob
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+import orjson
+
+# Bucket bounds (seconds) exported for latency histograms
+DEFAULT_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+
+class _Shards:
+    """
+    Per-thread cells that are summed on read. Each thread only ever writes
+    its own cell, so increments need no lock even from the sync threadpool.
+    Cells of threads that have exited are folded into a base value, so the
+    number of cells follows the live threads rather than every thread
+    that ever existed.
+    """
+
+    __slots__ = ("_local", "_cells", "_base", "_size", "_lock")
+
+    def __init__(self, size: int = 1):
+        self._local = threading.local()
+        self._cells: List[Tuple[threading.Thread, list]] = []
+        self._base = [0] * size
+        self._size = size
+        self._lock = threading.Lock()
+
+    def cell(self) -> list:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [0] * self._size
+            # Once per thread: register the cell and drop those of dead threads
+            with self._lock:
+                self._fold_dead()
+                self._cells.append((threading.current_thread(), cell))
+            return cell
+
+    def _fold_dead(self):
+        # A dead thread never writes its cell again, so folding it is exact
+        live = []
+        for thread, cell in self._cells:
+            if thread.is_alive():
+                live.append((thread, cell))
+            else:
+                for index, value in enumerate(cell):
+                    self._base[index] += value
+        self._cells = live
+
+    def totals(self) -> list:
+        with self._lock:
+            self._fold_dead()
+            totals = list(self._base)
+            cells = [cell for _, cell in self._cells]
+        for cell in cells:
+            for index, value in enumerate(cell):
+                totals[index] += value
+        return totals
+
+
+class _CounterChild:
+    __slots__ = ("_shards",)
+
+    def __init__(self):
+        self._shards = _Shards()
+
+    def inc(self, amount: float = 1):
+        self._shards.cell()[0] += amount
+
+    def value(self) -> float:
+        return self._shards.totals()[0]
+
+
+class _GaugeChild:
+    __slots__ = ("_shards", "_function")
+
+    def __init__(self):
+        self._shards = _Shards()
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1):
+        self._shards.cell()[0] += amount
+
+    def dec(self, amount: float = 1):
+        self._shards.cell()[0] -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """
+        Sample the gauge from a callable at scrape time instead of tracking it
+        """
+        self._function = function
+
+    def value(self) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._shards.totals()[0]
+
+
+class _HistogramChild:
+    __slots__ = ("_shards", "_bounds")
+
+    def __init__(self, bounds: List[float]):
+        self._bounds = bounds
+        # One cell per bucket, plus +Inf, plus the running sum
+        self._shards = _Shards(len(bounds) + 2)
+
+    def observe(self, value: float):
+        cell = self._shards.cell()
+        cell[bisect_left(self._bounds, value)] += 1
+        cell[-1] += value
+
+    def value(self) -> list:
+        return self._shards.totals()
+
+
+class Metric:
+    """
+    A metric family: one child per combination of label values
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        Get the child for a set of label values (created on first use)
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            # setdefault keeps the first child if two threads race here
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self) -> Dict[Tuple[str, ...], object]:
+        return {key: child.value() for key, child in list(self._children.items())}
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default.dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default.set_function(function)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Optional[List[float]] = None):
+        self.buckets = list(buckets or DEFAULT_BUCKETS)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class MetricsRegistry:
+    """
+    Holds all metric families of this process and renders them in the
+    Prometheus text format.
+
+    With several uvicorn workers, set METRICS_MULTIPROC_DIR to a directory
+    shared by the workers (and emptied on deploy). Each worker periodically
+    writes a snapshot there, named by its pid and a per-process id so a
+    reused pid never overwrites an earlier worker's totals. /metrics merges
+    them, summing counters and histograms over every worker that ever ran
+    and gauges over live workers. Snapshots of workers whose process has
+    exited are folded into an accumulated archive file and removed; a
+    worker that has only stopped flushing keeps its snapshot, so its next
+    cumulative write is never counted on top of an archived copy.
+    """
+
+    def __init__(self, multiproc_dir: Optional[str] = None, flush_seconds: float = 5.0):
+        self.metrics: Dict[str, Metric] = {}
+        self.multiproc_dir = multiproc_dir
+        self.flush_seconds = flush_seconds
+        self._flush_task: Optional[asyncio.Task] = None
+        self._process: Optional[Tuple[int, str]] = None
+
+    @property
+    def snapshot_path(self) -> str:
+        # Regenerated after a fork, so workers forked from one parent differ
+        pid = os.getpid()
+        if self._process is None or self._process[0] != pid:
+            self._process = (pid, uuid.uuid4().hex)
+        return os.path.join(self.multiproc_dir, f"metrics-{pid}-{self._process[1]}.json")
+
+    @property
+    def stale_seconds(self) -> float:
+        """
+        How long a snapshot may go unrefreshed before its gauges are left
+        out; its counters and histograms count until its process exits
+        """
+        return max(3 * self.flush_seconds, 30.0)
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Optional[List[float]] = None) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict:
+        """
+        Current values of every metric in this process
+        """
+        return {
+            name: [[list(key), value] for key, value in metric.samples().items()]
+            for name, metric in self.metrics.items()
+        }
+
+    def write_snapshot(self):
+        """
+        Publish this worker's snapshot to the shared directory
+        """
+        if not self.multiproc_dir:
+            return
+        path = self.snapshot_path
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as snapshot_file:
+            snapshot_file.write(orjson.dumps(self.snapshot()))
+        os.replace(temporary, path)
+
+    def collect(self) -> Dict[str, Dict[Tuple[str, ...], object]]:
+        """
+        Values of every metric, merged across workers when running multi-process
+        """
+        if not self.multiproc_dir:
+            return {name: metric.samples() for name, metric in self.metrics.items()}
+
+        self.write_snapshot()
+        own_path = self.snapshot_path
+        dead = []
+        merged: Dict[str, Dict[Tuple[str, ...], object]] = {name: {} for name in self.metrics}
+        for path in glob.glob(os.path.join(self.multiproc_dir, "metrics-*-*.json")):
+            if path != own_path and not _pid_alive(self._worker_pid(path)):
+                dead.append(path)
+        if dead:
+            self._archive(dead)
+
+        archive = self._read_json(self._archive_path()) or {"metrics": {}, "sources": []}
+        self._merge(merged, archive["metrics"], include_gauges=False)
+        folded = set(archive["sources"])
+        for path in glob.glob(os.path.join(self.multiproc_dir, "metrics-*-*.json")):
+            if os.path.basename(path) in folded:
+                continue
+            snapshot = self._read_json(path)
+            if snapshot is not None:
+                self._merge(merged, snapshot, include_gauges=path == own_path or self._fresh(path))
+        return merged
+
+    def _merge(self, merged: Dict, snapshot: Dict, include_gauges: bool):
+        for name, samples in snapshot.items():
+            metric = self.metrics.get(name)
+            if metric is None or (metric.kind == "gauge" and not include_gauges):
+                continue
+            target = merged[name]
+            for key, value in samples:
+                key = tuple(key)
+                if isinstance(value, list):
+                    current = target.get(key)
+                    target[key] = value if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    target[key] = target.get(key, 0) + value
+
+    @staticmethod
+    def _worker_pid(path: str) -> int:
+        return int(os.path.basename(path).split("-")[1])
+
+    def _fresh(self, path: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(path) < self.stale_seconds
+        except OSError:
+            return False
+
+    def _archive_path(self) -> str:
+        return os.path.join(self.multiproc_dir, "archive.json")
+
+    @staticmethod
+    def _read_json(path: str) -> Optional[Dict]:
+        try:
+            with open(path, "rb") as json_file:
+                return orjson.loads(json_file.read())
+        except (OSError, ValueError):
+            return None
+
+    def _archive(self, paths: List[str]):
+        """
+        Fold exited workers' counters and histograms into the archive and
+        remove their snapshots. Workers may scrape at the same time, so this
+        runs under a file lock, and the archive records which snapshots it
+        already holds in case a crash leaves one behind after folding.
+        """
+        with open(os.path.join(self.multiproc_dir, "archive.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            archive_path = self._archive_path()
+            archive = self._read_json(archive_path) or {"metrics": {}, "sources": []}
+            folded = set(archive["sources"])
+
+            totals: Dict[str, Dict[Tuple[str, ...], object]] = {}
+            for name, samples in archive["metrics"].items():
+                totals[name] = {tuple(key): value for key, value in samples}
+            for path in paths:
+                name = os.path.basename(path)
+                snapshot = self._read_json(path)
+                if snapshot is None or name in folded:
+                    continue
+                for metric_name in snapshot:
+                    if metric_name in self.metrics:
+                        totals.setdefault(metric_name, {})
+                self._merge(totals, snapshot, include_gauges=False)
+                folded.add(name)
+
+            # Names only need remembering while their file still exists
+            existing = {os.path.basename(path) for path in glob.glob(os.path.join(self.multiproc_dir, "metrics-*-*.json"))}
+            archive = {
+                "metrics": {name: [[list(key), value] for key, value in samples.items()] for name, samples in totals.items()},
+                "sources": sorted(folded & existing),
+            }
+            temporary = f"{archive_path}.tmp"
+            with open(temporary, "wb") as archive_file:
+                archive_file.write(orjson.dumps(archive))
+            os.replace(temporary, archive_path)
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+        """
+        lines = []
+        for name, samples in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(samples.items()):
+                if metric.kind == "histogram":
+                    cumulative = 0
+                    bounds = metric.buckets + [float("inf")]
+                    for bound, count in zip(bounds, value[:-1]):
+                        cumulative += count
+                        labels = _format_labels(metric.labelnames, key, f'le="{_format_value(bound)}"')
+                        lines.append(f"{name}_bucket{labels} {_format_value(cumulative)}")
+                    labels = _format_labels(metric.labelnames, key)
+                    lines.append(f"{name}_sum{labels} {_format_value(value[-1])}")
+                    lines.append(f"{name}_count{labels} {_format_value(cumulative)}")
+                else:
+                    labels = _format_labels(metric.labelnames, key)
+                    lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def start(self):
+        """
+        Start publishing snapshots periodically (multi-process mode only)
+        """
+        if self.multiproc_dir and self._flush_task is None:
+            os.makedirs(self.multiproc_dir, exist_ok=True)
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self):
+        """
+        Stop the flusher and publish a final snapshot
+        """
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.write_snapshot()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                print(f"Metrics snapshot failed: {str(e)}")
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+# Global metrics registry and the metrics recorded across the application
+metrics_registry = MetricsRegistry(
+    multiproc_dir=os.getenv("METRICS_MULTIPROC_DIR") or None,
+    flush_seconds=float(os.getenv("METRICS_FLUSH_SECONDS", "5")),
+)
+
+http_requests_total = metrics_registry.counter(
+    "http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+http_request_duration_seconds = metrics_registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency in seconds", ("method", "route"))
+http_requests_in_flight = metrics_registry.gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled")
+websocket_connections = metrics_registry.gauge(
+    "websocket_connections", "Open WebSocket connections")
+agent_routing_decisions_total = metrics_registry.counter(
+    "agent_routing_decisions_total", "Requests routed by the main agent, by chosen agent", ("agent",))
+agent_hedged_requests_total = metrics_registry.counter(
+    "agent_hedged_requests_total", "Hedged requests sent to a backup agent", ("agent",))
+agent_requests_in_flight = metrics_registry.gauge(
+    "agent_requests_in_flight", "Requests currently executing on each agent", ("agent",))
+agent_queue_depth = metrics_registry.gauge(
+    "agent_queue_depth", "Requests accepted by the main agent that have not completed")
+db_pool_checkouts_total = metrics_registry.counter(
+    "db_pool_checkouts_total", "Connections checked out of the database pool")
+db_pool_checked_out = metrics_registry.gauge(
+    "db_pool_checked_out", "Database connections currently checked out")
+cache_requests_total = metrics_registry.counter(
+    "cache_requests_total", "Cache lookups, by cache and result", ("cache", "result"))
@@ -0,0 +1,136 @@
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from .histogram import LatencyHistogram
+from .metrics import http_requests_in_flight, websocket_connections
+
+# Phase durations (seconds) of the request currently being handled
+_request_phases: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_phases", default=None)
+
+
+class RateWindow:
+    """
+    Counts events per second over a sliding window of fixed size
+    """
+
+    def __init__(self, seconds: int = 60):
+        self.seconds = seconds
+        self.counts = [0] * seconds
+        self.stamps = [0] * seconds
+        self.started = time.monotonic()
+
+    def add(self, now: Optional[float] = None):
+        second = int(now if now is not None else time.monotonic())
+        slot = second % self.seconds
+        if self.stamps[slot] != second:
+            self.stamps[slot] = second
+            self.counts[slot] = 0
+        self.counts[slot] += 1
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """
+        Average events per second over the window (or the uptime, if shorter)
+        """
+        now = now if now is not None else time.monotonic()
+        second = int(now)
+        total = sum(
+            count for count, stamp in zip(self.counts, self.stamps)
+            if second - stamp < self.seconds
+        )
+        elapsed = min(self.seconds, max(now - self.started, 1.0))
+        return total / elapsed
+
+
+class RequestStats:
+    """
+    Per-route and per-phase latency histograms plus live connection counts
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, LatencyHistogram] = {}
+        self.phases: Dict[str, LatencyHistogram] = {}
+        self.overall = LatencyHistogram()
+        self.rate = RateWindow()
+        self.active_requests = 0
+        self.active_websockets = 0
+        self._last_cpu_sample = (time.monotonic(), time.process_time())
+
+    def record_request(self, route: str, duration: float):
+        histogram = self.routes.get(route)
+        if histogram is None:
+            histogram = self.routes[route] = LatencyHistogram()
+        histogram.record(duration)
+        self.overall.record(duration)
+        self.rate.add()
+
+    def record_phase(self, name: str, duration: float):
+        histogram = self.phases.get(name)
+        if histogram is None:
+            histogram = self.phases[name] = LatencyHistogram()
+        histogram.record(duration)
+
+    @property
+    def active_connections(self) -> int:
+        return self.active_requests + self.active_websockets
+
+    def cpu_percent(self) -> float:
+        """
+        Process CPU usage since the previous call, as a percentage of one core
+        """
+        wall, cpu = time.monotonic(), time.process_time()
+        last_wall, last_cpu = self._last_cpu_sample
+        self._last_cpu_sample = (wall, cpu)
+        if wall <= last_wall:
+            return 0.0
+        return round((cpu - last_cpu) / (wall - last_wall) * 100, 2)
+
+
+def process_rss_bytes() -> int:
+    """
+    Current resident set size of this process
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # No /proc (e.g. macOS): fall back to the peak RSS, reported in bytes
+        # on macOS and in kilobytes elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def begin_request() -> Dict[str, float]:
+    """
+    Start collecting phase timings for the current request
+    """
+    phases: Dict[str, float] = {}
+    _request_phases.set(phases)
+    return phases
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Time a block as a named phase of the current request, e.g.
+    ``with phase("routing"): ...``
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        phases = _request_phases.get()
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + duration
+        request_stats.record_phase(name, duration)
+
+# Global request statistics for this process
+request_stats = RequestStats()
+
+http_requests_in_flight.set_function(lambda: request_stats.active_requests)
+websocket_connections.set_function(lambda: request_stats.active_websockets)
@@ -0,0 +1,81 @@
+import base64
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import orjson
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def encode_token(values: list) -> str:
+    """
+    Opaque URL-safe token holding a list of JSON values
+    """
+    return base64.urlsafe_b64encode(orjson.dumps(values)).rstrip(b"=").decode("ascii")
+
+
+def decode_token(token: str) -> list:
+    """
+    Parse a token produced by encode_token; raises ValueError if it is invalid
+    """
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def encode_cursor(created_at: datetime, row_id) -> str:
+    """
+    Opaque token for the position just after a row in (created_at, id) order
+    """
+    return encode_token([created_at.isoformat(), str(row_id)])
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """
+    Parse a token produced by encode_cursor; raises ValueError if it is invalid
+    """
+    try:
+        created_at, row_id = decode_token(cursor)
+        return datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def keyset_statement(stmt, model, cursor: Optional[str], limit: int):
+    """
+    Apply keyset pagination on (created_at, id), newest first, to a select
+    over model. One extra row is fetched so page_from_rows can tell whether
+    there is a next page without a COUNT.
+
+    Unlike OFFSET, the cost does not grow with page depth: with an index
+    ending in (created_at, id) the database seeks straight to the cursor.
+    Rows inserted while a client is paging do not shift later pages either.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(model.created_at, model.id) < tuple_(created_at, row_id))
+    return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+
+def page_from_rows(rows: List, limit: int) -> Tuple[List, Optional[str]]:
+    """
+    Split the rows of a keyset_statement into the page and the next cursor
+    (None on the last page)
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+async def keyset_page(db: AsyncSession, stmt, model, cursor: Optional[str], limit: int) -> Tuple[List, Optional[str]]:
+    """
+    Fetch one page of a select over model and the cursor for the next one
+    """
+    rows = (await db.scalars(keyset_statement(stmt, model, cursor, limit))).all()
+    return page_from_rows(list(rows), limit)
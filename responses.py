@@ -0,0 +1,143 @@
+import hashlib
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+
+from middleware.compression import DEFAULT_MINIMUM_SIZE, choose_encoding, compress
+from monitoring.metrics import cache_requests_total
+
+# orjson serializes datetime, UUID and Enum values natively, so handlers can
+# return plain dicts without going through FastAPI's jsonable_encoder
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def render_json(content: Any) -> bytes:
+    """
+    Serialize content to compact UTF-8 JSON bytes
+    """
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+def render_json_text(content: Any) -> str:
+    """
+    Serialize content to a JSON string (for WebSocket text frames)
+    """
+    return orjson.dumps(content, option=ORJSON_OPTIONS).decode("utf-8")
+
+
+def parse_json(data: Any) -> Any:
+    """
+    Parse JSON from str or bytes
+    """
+    return orjson.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson; used as the application default
+    """
+
+    def render(self, content: Any) -> bytes:
+        return render_json(content)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header against an ETag (weak comparison, per RFC 9110)
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class CachedBody:
+    """
+    A JSON body rendered once, together with its strong ETag and lazily
+    built compressed variants
+    """
+
+    __slots__ = ("body", "etag", "_digest", "_variants")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self._digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.etag = '"' + self._digest + '"'
+        self._variants: Dict[str, Tuple[bytes, str]] = {}
+
+    def variant(self, encoding: Optional[str]) -> Tuple[bytes, str]:
+        """
+        Return the body and ETag for a content coding; each coding is
+        compressed once at maximum level and kept for later requests
+        """
+        if encoding is None or len(self.body) < DEFAULT_MINIMUM_SIZE:
+            return self.body, self.etag
+
+        variant = self._variants.get(encoding)
+        if variant is None:
+            # A strong ETag must differ between content codings of the same resource
+            variant = (compress(self.body, encoding), f'"{self._digest}-{encoding}"')
+            self._variants[encoding] = variant
+        return variant
+
+
+class ResponseCache:
+    """
+    Pre-serialized responses for endpoints whose content only changes when
+    a version number (e.g. the agent registry version) changes
+    """
+
+    def __init__(self, name: str):
+        self.entries: Dict[str, Tuple[Hashable, CachedBody]] = {}
+        self.hits = cache_requests_total.labels(name, "hit")
+        self.misses = cache_requests_total.labels(name, "miss")
+
+    def get(self, key: str, version: Hashable, build: Callable[[], Any]) -> CachedBody:
+        """
+        Return the cached body for a key, rebuilding it if the version changed
+        """
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits.inc()
+            return entry[1]
+
+        self.misses.inc()
+        cached = CachedBody(render_json(build()))
+        self.entries[key] = (version, cached)
+        return cached
+
+    def response(self, request: Request, key: str, version: Hashable, build: Callable[[], Any]) -> Response:
+        """
+        Serve a cached body with its ETag, or 304 Not Modified if the client already has it
+        """
+        cached = self.get(key, version, build)
+        encoding = choose_encoding(request.headers.get("accept-encoding"))
+        body, etag = cached.variant(encoding)
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        if body is not cached.body:
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def clear(self):
+        """
+        Drop all cached bodies
+        """
+        self.entries.clear()
+
+# Global cache for the agent/skills catalog endpoints
+catalog_cache = ResponseCache("catalog")
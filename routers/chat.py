@@ -1,5 +1,6 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import json
 import uuid
 from datetime import datetime
@@ -7,13 +8,19 @@ from datetime import datetime
 from agents.main_agent import main_agent
 from agents.agent_registry import agent_registry
 from speckit.task_analyzer import task_analyzer
+import crud
+from database import get_async_read_db
+from message_writer import message_writer
+from schemas import ConversationSummary, Message
 
 router = APIRouter(prefix="/api/v1/chat", tags=["chat"])
 
 @router.post("/send")
-async def send_message(content: str, conversation_id: str = None, sender_type: str = "user", sender_id: str = "default-user"):
+async def send_message(content: str, conversation_id: str = None, sender_type: str = "user",
+                       sender_id: str = "default-user", user_id: Optional[str] = None):
     """
-    Send a message to the AI agent system
+    Send a message to the AI agent system; user_id owns the conversation
+    if this message starts it
     """
     try:
         # Create a new conversation if none provided
@@ -38,6 +45,15 @@ async def send_message(content: str, conversation_id: str = None, sender_type: s
 
         # Process the message through the agent system
         response_content = await main_agent.process_request(user_message)
+        agent_used = getattr(user_message, 'agent_used', None)
+
+        # Both turns are persisted in the background; the reply does not wait for the database
+        await message_writer.add(conversation_id, sender_type, sender_id, content,
+                                 conversation_title=title, created_at=user_message.created_at,
+                                 user_id=user_id)
+        await message_writer.add(conversation_id, "sub_agent" if agent_used else "main_agent",
+                                 agent_used or main_agent.id, response_content,
+                                 message_type="response", agent_used=agent_used)
 
         return {
             "success": True,
@@ -51,29 +67,51 @@ async def send_message(content: str, conversation_id: str = None, sender_type: s
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
 @router.get("/conversations")
-async def get_conversations(limit: int = 20, offset: int = 0):
+async def get_conversations(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user_id: str = Query(..., description="Owner of the conversations"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
     """
-    Get list of user's conversations (mock implementation)
+    Get a page of the user's conversations, newest first. Listing every
+    user's conversations is left to GET /conversations.
     """
-    # This would normally fetch from database
-    # For now, returning a mock response
+    try:
+        conversations, next_cursor = await crud.get_conversations(db, user_id=user_id, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
     return {
-        "conversations": [],
-        "total_count": 0,
+        "conversations": [ConversationSummary.model_validate(c).model_dump() for c in conversations],
         "limit": limit,
-        "offset": offset
+        "next_cursor": next_cursor
     }
 
 @router.get("/conversations/{conversation_id}/messages")
-async def get_messages(conversation_id: str, limit: int = 50, offset: int = 0):
+async def get_messages(
+    conversation_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = Query(None, description="Only messages at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only messages before this time"),
+    db: AsyncSession = Depends(get_async_read_db)
+):
     """
-    Get messages for a specific conversation (mock implementation)
+    Get a page of messages for a specific conversation, newest first.
+    Giving a time window keeps the query to the partitions it covers.
     """
-    # This would normally fetch from database
-    # For now, returning a mock response
+    if crud.as_uuid(conversation_id) is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    try:
+        messages, next_cursor = await crud.get_conversation_messages(
+            db, conversation_id, cursor=cursor, limit=limit, since=since, until=until)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
     return {
-        "messages": [],
-        "total_count": 0,
+        "messages": [Message.model_validate(m).model_dump() for m in messages],
         "limit": limit,
-        "offset": offset
+        "next_cursor": next_cursor
     }
\ No newline at end of file
@@ -1,218 +1,314 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import os
 import uuid
 from datetime import datetime
 
-from crud import *
-from models import *
-from schemas import Task, TaskCreate, TaskUpdate
-from database import get_db
-
-# Also import the schemas module to reference it directly
-import backend.schemas as schemas
+import crud
+import schemas
+from database import get_async_db, get_async_read_db
+from exports import export_response
 
 router = APIRouter(prefix="/api", tags=["tasks"])
 
+# Largest number of tasks accepted by one bulk request
+TASK_BULK_MAX = int(os.getenv("TASK_BULK_MAX", "5000"))
+
+
+async def raise_task_miss(db: AsyncSession, user_id: str, task_id: Optional[str] = None, action: str = "access"):
+    """
+    Raise the right error after a user-scoped task statement matched nothing
+    """
+    status_code, detail = await crud.diagnose_task_miss(db, user_id, task_id, action)
+    raise HTTPException(status_code=status_code, detail=detail)
+
+
+def task_etag(task) -> str:
+    """
+    The ETag of a task: its row version. It is a strong validator, since the
+    version changes on every write, so it can be used with If-Match
+    """
+    return f'"{task.version}"'
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """
+    The task version an If-Match header requires, or None for no condition
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip()
+    if tag.startswith("W/"):
+        # If-Match uses strong comparison (RFC 9110), so a weak tag never matches
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="If-Match needs a strong ETag"
+        )
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid If-Match header"
+        )
+
+
+async def raise_task_conflict_or_miss(db: AsyncSession, user_id: str, task_id: str, action: str):
+    """
+    Raise 409 with the current task if a conditional update lost to another
+    writer, otherwise the usual not found / not authorized error
+    """
+    current = await crud.get_user_task(db, user_id, task_id)
+    if current is None:
+        await raise_task_miss(db, user_id, task_id, action=action)
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={
+            "message": "Task was modified by another request",
+            "task": schemas.Task.model_validate(current).model_dump(mode="json")
+        },
+        headers={"ETag": task_etag(current)}
+    )
+
+
 @router.post("/{user_id}/tasks", response_model=schemas.Task)
-def create_task(
+async def create_task(
     user_id: str, 
     task: schemas.TaskCreate, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create a new task for a specific user
     """
-    # Verify user exists
-    user = crud.get_user(db, user_id)
-    if not user:
+    # The user_id from the path is used, and the insert only happens if that user exists
+    db_task = await crud.create_user_task(db, user_id, task)
+    if not db_task:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    
-    # Set the user_id from the path parameter to ensure consistency
-    task_data = task.dict()
-    task_data['user_id'] = user_id
-    task_data['status'] = 'pending'  # Default status
-    
-    # Create the task
-    db_task = crud.create_user_task(db, schemas.TaskCreate(**task_data))
     return db_task
 
 
 @router.get("/{user_id}/tasks", response_model=List[schemas.Task])
-def get_tasks(
+async def get_tasks(
     user_id: str,
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
-    Get all tasks for a specific user
+    Get a page of tasks for a specific user, newest first. The cursor for
+    the next page is returned in the X-Next-Cursor header (absent on the
+    last page).
     """
-    # Verify user exists
-    user = crud.get_user(db, user_id)
-    if not user:
+    try:
+        tasks, next_cursor = await crud.get_user_tasks(db, user_id=user_id, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+    # An empty first page may mean the user does not exist
+    if not tasks and not cursor and not await crud.get_user(db, user_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    
-    tasks = crud.get_user_tasks(db, user_id=user_id, skip=skip, limit=limit)
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return tasks
 
 
-@router.get("/{user_id}/tasks/{task_id}", response_model=schemas.Task)
-def get_task(
+@router.get("/{user_id}/tasks/stats")
+async def get_task_stats(
     user_id: str,
-    task_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get a specific task by ID for a specific user
+    Task counts by status for a specific user, from the maintained counters
     """
-    # Verify user exists
-    user = crud.get_user(db, user_id)
-    if not user:
+    if not await crud.get_user(db, user_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    
-    task = crud.get_task(db, task_id=task_id)
-    if not task:
+    by_status = await crud.get_user_task_counts(db, user_id)
+    return {
+        "user_id": user_id,
+        "total": sum(by_status.values()),
+        "by_status": by_status
+    }
+
+
+# Columns written by task exports
+TASK_EXPORT_COLUMNS = ("id", "title", "description", "agent_assigned", "status", "created_at", "updated_at")
+
+
+# Declared before /{user_id}/tasks/{task_id} so "export" is not taken for a task id
+@router.get("/{user_id}/tasks/export")
+async def export_tasks(
+    user_id: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Stream all tasks of a specific user, oldest first, as NDJSON or CSV
+    """
+    if not await crud.get_user(db, user_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Task not found"
+            detail="User not found"
         )
-    
-    # Verify task belongs to user
-    if str(task.user_id) != user_id:
+
+    return export_response(
+        crud.user_tasks_export_statement(user_id), TASK_EXPORT_COLUMNS, format, f"tasks-{user_id}")
+
+
+def check_bulk_size(count: int):
+    if count > TASK_BULK_MAX:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to access this task"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A bulk request may contain at most {TASK_BULK_MAX} tasks"
         )
-    
-    return task
 
 
-@router.put("/{user_id}/tasks/{task_id}", response_model=schemas.Task)
-def update_task(
+@router.post("/{user_id}/tasks/bulk", response_model=List[schemas.Task])
+async def create_tasks_bulk(
     user_id: str,
-    task_id: str,
-    task_update: schemas.TaskCreate,
-    db: Session = Depends(get_db)
+    bulk: schemas.TaskBulkCreate,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Update a specific task by ID for a specific user
+    Create many tasks for a specific user in one transaction
     """
-    # Verify user exists
-    user = crud.get_user(db, user_id)
-    if not user:
+    check_bulk_size(len(bulk.tasks))
+
+    db_tasks = await crud.create_user_tasks(db, user_id, bulk.tasks)
+    if db_tasks is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    
-    task = crud.get_task(db, task_id=task_id)
-    if not task:
+    return db_tasks
+
+
+@router.patch("/{user_id}/tasks/bulk", response_model=List[schemas.Task])
+async def update_tasks_bulk(
+    user_id: str,
+    bulk: schemas.TaskBulkUpdate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Update or change the status of many tasks of a specific user in one
+    transaction; either every task is updated or none is
+    """
+    check_bulk_size(len(bulk.tasks))
+
+    updates = [item.model_dump(exclude_unset=True) for item in bulk.tasks]
+    updated_tasks, missing = await crud.update_user_tasks(db, user_id, updates)
+    if missing:
+        if not await crud.get_user(db, user_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Task not found"
+            detail={"message": "Tasks not found for this user", "task_ids": [str(task_id) for task_id in missing]}
         )
-    
-    # Verify task belongs to user
-    if str(task.user_id) != user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to update this task"
-        )
-    
-    updated_task = crud.update_task(db, task_id=task_id, task_update=task_update)
+    return updated_tasks
+
+
+@router.get("/{user_id}/tasks/{task_id}", response_model=schemas.Task)
+async def get_task(
+    user_id: str,
+    task_id: str,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Get a specific task by ID for a specific user; the ETag header carries
+    its version for use in If-Match
+    """
+    task = await crud.get_user_task(db, user_id, task_id)
+    if not task:
+        await raise_task_miss(db, user_id, task_id)
+    response.headers["ETag"] = task_etag(task)
+    return task
+
+
+@router.put("/{user_id}/tasks/{task_id}", response_model=schemas.Task)
+async def update_task(
+    user_id: str,
+    task_id: str,
+    task_update: schemas.TaskCreate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Update a specific task by ID for a specific user. With If-Match, the
+    update only applies if the task is still at that version; otherwise
+    409 is returned with the current task.
+    """
+    expected_version = parse_if_match(if_match)
+    # Ownership comes from the path; a task cannot be moved to another user here
+    values = task_update.model_dump(exclude_unset=True, exclude={"user_id"})
+    updated_task = await crud.update_user_task(db, user_id, task_id, values, expected_version)
+    if not updated_task:
+        if expected_version is None:
+            await raise_task_miss(db, user_id, task_id, action="update")
+        await raise_task_conflict_or_miss(db, user_id, task_id, action="update")
+    response.headers["ETag"] = task_etag(updated_task)
     return updated_task
 
 
 @router.delete("/{user_id}/tasks/{task_id}")
-def delete_task(
+async def delete_task(
     user_id: str,
     task_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Delete a specific task by ID for a specific user
     """
-    # Verify user exists
-    user = crud.get_user(db, user_id)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    task = crud.get_task(db, task_id=task_id)
-    if not task:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Task not found"
-        )
-    
-    # Verify task belongs to user
-    if str(task.user_id) != user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to delete this task"
-        )
-    
-    crud.delete_task(db, task_id=task_id)
+    deleted_id = await crud.delete_user_task(db, user_id, task_id)
+    if not deleted_id:
+        await raise_task_miss(db, user_id, task_id, action="delete")
     return {"message": "Task deleted successfully"}
 
 
 @router.patch("/{user_id}/tasks/{task_id}/complete")
-def toggle_task_completion(
+async def toggle_task_completion(
     user_id: str,
     task_id: str,
-    db: Session = Depends(get_db)
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Toggle the completion status of a specific task
+    Toggle the completion status of a specific task. Sending If-Match
+    makes a repeated click on a stale view fail with 409 instead of
+    toggling the task back.
     """
-    # Verify user exists
-    user = crud.get_user(db, user_id)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    task = crud.get_task(db, task_id=task_id)
-    if not task:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Task not found"
-        )
-    
-    # Verify task belongs to user
-    if str(task.user_id) != user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to update this task"
-        )
-    
-    # Toggle completion status
-    new_status = "completed" if task.status != "completed" else "pending"
-    task_update = schemas.TaskCreate(
-        title=task.title,
-        description=task.description,
-        user_id=str(task.user_id),
-        agent_assigned=task.agent_assigned
-    )
-    
-    updated_task = crud.update_task_status(db, task_id=task_id, status=new_status)
+    expected_version = parse_if_match(if_match)
+    updated_task = await crud.toggle_user_task_completion(db, user_id, task_id, expected_version)
+    if not updated_task:
+        if expected_version is None:
+            await raise_task_miss(db, user_id, task_id, action="update")
+        await raise_task_conflict_or_miss(db, user_id, task_id, action="update")
+    response.headers["ETag"] = task_etag(updated_task)
+
     return {
         "id": updated_task.id,
         "title": updated_task.title,
         "description": updated_task.description,
         "status": updated_task.status,
-        "completed": updated_task.status == "completed"
-    }
\ No newline at end of file
+        "completed": updated_task.status == "completed",
+        "version": updated_task.version
+    }
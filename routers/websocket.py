@@ -1,57 +1,214 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from typing import Dict, Optional, Set
 from agents.main_agent import main_agent
-import json
+from connection_manager import Connection, connection_manager
+from crud import get_conversation
+from database import AsyncSessionLocal
+from responses import parse_json, render_json_text
+from message_writer import message_writer
+import asyncio
+import os
 import uuid
 from datetime import datetime
 
 router = APIRouter(tags=["websocket"])
 
+# Most requests a pipelined connection may have in flight at once
+WEBSOCKET_MAX_IN_FLIGHT = int(os.getenv("WEBSOCKET_MAX_IN_FLIGHT", "8"))
+# How long answers still running when a pipelined client leaves may finish
+WEBSOCKET_DRAIN_SECONDS = float(os.getenv("WEBSOCKET_DRAIN_SECONDS", "10"))
+
+
+class ChatSession:
+    """
+    One client's chat over a WebSocket: reads its messages and answers
+    them through the main agent, persisting both turns
+    """
+
+    def __init__(self, connection: Connection, conversation_id: str, sender_id: Optional[str] = None,
+                 user_id: Optional[str] = None):
+        self.connection = connection
+        self.conversation_id = conversation_id
+        self.sender_id = sender_id or 'temp-user-id'
+        # Recorded as the owner when this session starts the conversation
+        self.user_id = user_id
+        self.conversation_title = None
+
+    async def receive(self):
+        """
+        Wait for the next message and share it with the other participants
+        """
+        data = await self.connection.websocket.receive_text()
+        message_data = parse_json(data)
+
+        # Create a temporary message object
+        temp_message = type('TempMessage', (), {
+            'id': str(uuid.uuid4()),
+            'conversation_id': self.conversation_id,
+            'sender_type': message_data.get('sender_type', 'user'),
+            'sender_id': message_data.get('sender_id', self.sender_id),
+            'content': message_data.get('content', data),
+            'message_type': message_data.get('message_type', 'text'),
+            'correlation_id': message_data.get('correlation_id'),
+            'agent_used': None,
+            'timestamp': datetime.utcnow()
+        })()
+        if self.conversation_title is None:
+            self.conversation_title = temp_message.content[:50]
+
+        # Let the other participants see the message right away
+        connection_manager.publish(self.conversation_id, {
+            "type": "message",
+            "content": temp_message.content,
+            "sender_type": temp_message.sender_type,
+            "sender_id": temp_message.sender_id,
+            "message_id": temp_message.id,
+            "timestamp": temp_message.timestamp.isoformat()
+        }, exclude=self.connection)
+        return temp_message
+
+    async def answer(self, temp_message) -> Dict:
+        """
+        Process a message through the main agent and build the response
+        """
+        response_content = await main_agent.process_request(temp_message)
+        agent_used = getattr(temp_message, 'agent_used', None)
+
+        # Shielded so a cancellation cannot persist the question without its answer
+        await asyncio.shield(self._persist(temp_message, response_content, agent_used))
+
+        response = {
+            "type": "response",
+            "content": response_content,
+            "message_id": str(uuid.uuid4()),
+            "agent_used": getattr(temp_message, 'agent_used', 'Main Agent'),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        if temp_message.correlation_id is not None:
+            response["correlation_id"] = temp_message.correlation_id
+        return response
+
+    async def _persist(self, temp_message, response_content: str, agent_used: Optional[str]):
+        # Persist both turns in the background; created_at keeps them in
+        # arrival order even when answers finish out of order
+        await message_writer.add(self.conversation_id, temp_message.sender_type, temp_message.sender_id,
+                                 temp_message.content, message_type=temp_message.message_type,
+                                 conversation_title=self.conversation_title, created_at=temp_message.timestamp,
+                                 user_id=self.user_id)
+        await message_writer.add(self.conversation_id, "sub_agent" if agent_used else "main_agent",
+                                 agent_used or main_agent.id, response_content,
+                                 message_type="response", agent_used=agent_used)
+
+
+async def serve_pipelined(session: ChatSession, ordered: bool = False,
+                          max_in_flight: Optional[int] = None, drain_timeout: Optional[float] = None):
+    """
+    Read messages while earlier ones are still being answered, with at most
+    max_in_flight answers running at once; when the limit is reached the
+    socket is not read until one finishes. Responses are sent as they
+    complete, or in request order when ordered is set. When the client
+    leaves, answers in flight get drain_timeout seconds to finish and be
+    persisted before they are cancelled.
+    """
+    slots = asyncio.Semaphore(max_in_flight or WEBSOCKET_MAX_IN_FLIGHT)
+    running: Set[asyncio.Task] = set()
+    finished: Dict[int, Dict] = {}
+    next_to_send = 0
+
+    def deliver(seq: int, response: Dict):
+        nonlocal next_to_send
+        if not ordered:
+            connection_manager.publish(session.conversation_id, response)
+            return
+        finished[seq] = response
+        while next_to_send in finished:
+            connection_manager.publish(session.conversation_id, finished.pop(next_to_send))
+            next_to_send += 1
+
+    async def run(seq: int, temp_message):
+        try:
+            response = await session.answer(temp_message)
+        except Exception as e:
+            # One failed request does not end the connection
+            response = {
+                "type": "error",
+                "content": f"An error occurred: {str(e)}",
+                "timestamp": datetime.utcnow().isoformat()
+            }
+            if temp_message.correlation_id is not None:
+                response["correlation_id"] = temp_message.correlation_id
+        finally:
+            slots.release()
+        deliver(seq, response)
+
+    seq = 0
+    try:
+        while True:
+            await slots.acquire()
+            temp_message = await session.receive()
+            task = asyncio.get_running_loop().create_task(run(seq, temp_message))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            seq += 1
+    finally:
+        if running:
+            drain = WEBSOCKET_DRAIN_SECONDS if drain_timeout is None else drain_timeout
+            _, unfinished = await asyncio.wait(set(running), timeout=drain)
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, conversation_id: Optional[str] = None,
+                             sender_id: Optional[str] = None, user_id: Optional[str] = None,
+                             pipeline: bool = False, ordered: bool = False):
     """
-    WebSocket endpoint for real-time chat communication
+    WebSocket endpoint for real-time chat communication. Pass an existing
+    conversation_id to join it: every participant receives the others'
+    messages and the agent's responses. Unknown conversations are refused
+    before the connection is accepted. Without a conversation_id a new one
+    is started, owned by user_id if given.
+
+    This is not access control: sender_id and user_id are taken as the
+    client gives them, and anyone who knows a conversation_id can join it.
+    Put authentication in front of this endpoint before exposing it.
+
+    By default messages are answered one at a time. With pipeline=true
+    several are answered concurrently and each response carries the
+    correlation_id sent with its message; ordered=true additionally
+    sends responses in the order the messages arrived.
     """
-    await websocket.accept()
+    # A conversation being held here may not have been written yet
+    if conversation_id is not None and not connection_manager.subscriber_count(conversation_id):
+        async with AsyncSessionLocal() as db:
+            known = await get_conversation(db, conversation_id) is not None
+        if not known:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+
+    connection = await connection_manager.connect(websocket)
+    # One conversation per WebSocket session, new unless one is joined
+    session = ChatSession(connection, conversation_id or str(uuid.uuid4()), sender_id, user_id)
+    connection_manager.subscribe(connection, session.conversation_id)
 
     try:
         # Send connection confirmation
-        await websocket.send_text(json.dumps({
+        connection.send(render_json_text({
             "type": "connection",
             "message": "Main Agent Connected!",
+            "conversation_id": session.conversation_id,
+            "pipeline": pipeline,
             "timestamp": datetime.utcnow().isoformat()
         }))
 
-        while True:
-            # Receive message from client
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
-
-            # Process the message through the agent system
-            # Create a temporary message object
-            temp_message = type('TempMessage', (), {
-                'id': str(uuid.uuid4()),
-                'conversation_id': str(uuid.uuid4()),  # Generate a new conversation ID for each session
-                'sender_type': message_data.get('sender_type', 'user'),
-                'sender_id': message_data.get('sender_id', 'temp-user-id'),
-                'content': message_data.get('content', data),
-                'message_type': message_data.get('message_type', 'text'),
-                'agent_used': None,
-                'timestamp': datetime.utcnow()
-            })()
-
-            # Process through main agent
-            response_content = await main_agent.process_request(temp_message)
-
-            # Send response back to client
-            response = {
-                "type": "response",
-                "content": response_content,
-                "message_id": str(uuid.uuid4()),
-                "agent_used": getattr(temp_message, 'agent_used', 'Main Agent'),
-                "timestamp": datetime.utcnow().isoformat()
-            }
-
-            await websocket.send_text(json.dumps(response))
+        if pipeline:
+            await serve_pipelined(session, ordered)
+        else:
+            while True:
+                temp_message = await session.receive()
+                # Send the response to everyone in the conversation
+                connection_manager.publish(session.conversation_id, await session.answer(temp_message))
     except WebSocketDisconnect:
         print("WebSocket disconnected")
     except Exception as e:
@@ -61,4 +218,6 @@ async def websocket_endpoint(websocket: WebSocket):
             "content": f"An error occurred: {str(e)}",
             "timestamp": datetime.utcnow().isoformat()
         }
-        await websocket.send_text(json.dumps(error_response))
\ No newline at end of file
+        connection.send(render_json_text(error_response))
+    finally:
+        await connection_manager.disconnect(connection)
@@ -1,16 +1,44 @@
-from .task import Task, TaskCreate, TaskUpdate, TaskBase
+from .task import Task, TaskCreate, TaskUpdate, TaskBase, TaskBulkCreate, TaskBulkUpdate
 from .user import User, UserCreate, UserBase
 from .message import Message, MessageCreate, MessageBase
+from .conversation import ConversationSummary
+from .agent import (
+    AgentInfo,
+    AgentSkills,
+    TaskRouteResponse,
+    ProcessTaskResponse,
+    MainAgentResponse,
+    AgentTaskResponse,
+    TaskAnalysisResponse,
+    BatchTask,
+    BatchProcessRequest,
+    BatchTaskResult,
+    BatchProcessResponse,
+)
 
 __all__ = [
     "Task",
     "TaskCreate",
     "TaskUpdate",
     "TaskBase",
+    "TaskBulkCreate",
+    "TaskBulkUpdate",
     "User",
     "UserCreate",
     "UserBase",
     "Message",
     "MessageCreate",
-    "MessageBase"
+    "MessageBase",
+    "ConversationSummary",
+    "AgentInfo",
+    "AgentSkills",
+    "TaskRouteResponse",
+    "ProcessTaskResponse",
+    "MainAgentResponse",
+    "AgentTaskResponse",
+    "TaskAnalysisResponse",
+    "BatchTask",
+    "BatchProcessRequest",
+    "BatchTaskResult",
+    "BatchProcessResponse"
 ]
\ No newline at end of file
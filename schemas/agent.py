@@ -0,0 +1,77 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+
+class AgentInfo(BaseModel):
+    id: str
+    name: str
+    description: str
+    status: str
+    skills: List[str]
+
+class AgentSkills(BaseModel):
+    agent_id: str
+    agent_name: str
+    skills: List[str]
+
+class AgentSummary(BaseModel):
+    id: str
+    name: str
+    description: str
+
+class TaskRouteResponse(BaseModel):
+    task_content: str
+    best_agent: Optional[AgentSummary] = None
+    confidence: float
+    skills_matched: Optional[List[str]] = None
+    message: Optional[str] = None
+
+class ProcessTaskResponse(BaseModel):
+    original_task: str
+    processed_by: Optional[str] = None
+    response: str
+
+class MainAgentResponse(BaseModel):
+    original_content: str
+    processed_by: Optional[str] = None
+    response: str
+    timestamp: datetime
+
+class AgentTaskResponse(BaseModel):
+    task_content: str
+    processed_by: str
+    response: str
+    timestamp: datetime
+
+class BatchTask(BaseModel):
+    content: str
+    id: Optional[str] = None
+
+class BatchProcessRequest(BaseModel):
+    tasks: List[BatchTask] = Field(..., min_length=1)
+    concurrency: Optional[int] = Field(None, ge=1)
+    stream: bool = False
+
+class BatchTaskResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    processed_by: Optional[str] = None
+    response: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchProcessResponse(BaseModel):
+    results: List[BatchTaskResult]
+    total: int
+    succeeded: int
+    failed: int
+
+class TaskAnalysis(BaseModel):
+    category: str
+    confidence: float
+    complexity: str
+    keywords_found: List[str]
+    estimated_time: str
+
+class TaskAnalysisResponse(BaseModel):
+    task_content: str
+    analysis: TaskAnalysis
@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+from uuid import UUID
+
+class ConversationSummary(BaseModel):
+    id: UUID
+    user_id: Optional[UUID] = None
+    title: Optional[str] = None
+    status: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
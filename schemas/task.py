@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from datetime import datetime
 from uuid import UUID
 
@@ -26,6 +26,26 @@ class Task(TaskBase):
     status: str  # e.g., "pending", "in_progress", "completed", "failed"
     created_at: datetime
     updated_at: datetime
+    version: int
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class TaskBulkItem(BaseModel):
+    title: str
+    description: str
+    agent_assigned: Optional[str] = None
+    status: Optional[str] = None
+
+class TaskBulkCreate(BaseModel):
+    tasks: List[TaskBulkItem] = Field(..., min_length=1)
+
+class TaskBulkUpdateItem(BaseModel):
+    id: UUID
+    title: Optional[str] = None
+    description: Optional[str] = None
+    agent_assigned: Optional[str] = None
+    status: Optional[str] = None
+
+class TaskBulkUpdate(BaseModel):
+    tasks: List[TaskBulkUpdateItem] = Field(..., min_length=1)
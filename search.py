@@ -0,0 +1,147 @@
+import re
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, Float, Uuid, bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from pagination import decode_token, encode_token
+
+# What can be searched
+SEARCH_KINDS = ("message", "task")
+
+# Typed result columns, so ids come back as UUIDs on both dialects
+_RESULT_COLUMNS = {
+    "id": Uuid(as_uuid=True),
+    "conversation_id": Uuid(as_uuid=True),
+    "user_id": Uuid(as_uuid=True),
+    "score": Float,
+    "created_at": DateTime,
+}
+
+_POSTGRES_SOURCES = {
+    "message": """
+        SELECT 'message' AS kind, m.id, m.conversation_id, c.user_id, m.agent_used AS agent,
+               m.content AS body, ts_rank(m.search_vector, q.query) AS score, m.created_at
+        FROM chat_messages m
+        LEFT JOIN conversations c ON c.id = m.conversation_id
+        CROSS JOIN (SELECT websearch_to_tsquery('english', :q) AS query) q
+        WHERE m.search_vector @@ q.query {filters}""",
+    "task": """
+        SELECT 'task' AS kind, t.id, NULL AS conversation_id, t.user_id, t.agent_assigned AS agent,
+               t.title || ' ' || coalesce(t.description, '') AS body,
+               ts_rank(t.search_vector, q.query) AS score, t.created_at
+        FROM tasks t
+        CROSS JOIN (SELECT websearch_to_tsquery('english', :q) AS query) q
+        WHERE t.search_vector @@ q.query {filters}""",
+}
+
+# bm25() is lower-is-better, so it is negated to rank like ts_rank
+_SQLITE_SOURCES = {
+    "message": """
+        SELECT 'message' AS kind, m.id, m.conversation_id, c.user_id, m.agent_used AS agent,
+               snippet(chat_messages_fts, 0, '[', ']', '...', 12) AS body,
+               -bm25(chat_messages_fts) AS score, m.created_at
+        FROM chat_messages_fts
+        JOIN chat_messages m ON m.rowid = chat_messages_fts.rowid
+        LEFT JOIN conversations c ON c.id = m.conversation_id
+        WHERE chat_messages_fts MATCH :q {filters}""",
+    "task": """
+        SELECT 'task' AS kind, t.id, NULL AS conversation_id, t.user_id, t.agent_assigned AS agent,
+               snippet(tasks_fts, -1, '[', ']', '...', 12) AS body,
+               -bm25(tasks_fts, 2.0, 1.0) AS score, t.created_at
+        FROM tasks_fts
+        JOIN tasks t ON t.rowid = tasks_fts.rowid
+        WHERE tasks_fts MATCH :q {filters}""",
+}
+
+# Filter columns per source; None means the filter excludes that source
+_FILTER_COLUMNS = {
+    "message": {"user_id": "c.user_id", "conversation_id": "m.conversation_id", "agent": "m.agent_used"},
+    "task": {"user_id": "t.user_id", "conversation_id": None, "agent": "t.agent_assigned"},
+}
+
+
+def sqlite_match_query(q: str) -> str:
+    """
+    Turn free text into an FTS5 query that matches all of its words, with
+    every word quoted so user input can never be FTS5 syntax
+    """
+    words = re.findall(r"\w+", q)
+    return " ".join(f'"{word}"' for word in words)
+
+
+def _decode_search_cursor(cursor: str) -> Tuple[float, str, uuid.UUID]:
+    try:
+        score, kind, row_id = decode_token(cursor)
+        return float(score), str(kind), uuid.UUID(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+async def search(db: AsyncSession, q: str, kinds: Tuple[str, ...] = SEARCH_KINDS,
+                 user_id: Optional[uuid.UUID] = None, conversation_id: Optional[uuid.UUID] = None,
+                 agent: Optional[str] = None, limit: int = 20,
+                 cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Ranked full-text search over chat messages and tasks: tsvector and GIN
+    indexes on Postgres, FTS5 on SQLite. Results are ordered by score and
+    paged with a keyset cursor on (score, kind, id).
+    """
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        sources, query_param = _POSTGRES_SOURCES, q
+    else:
+        sources, query_param = _SQLITE_SOURCES, sqlite_match_query(q)
+        if not query_param:
+            return [], None
+
+    filters = {"user_id": user_id, "conversation_id": conversation_id, "agent": agent}
+    parts = []
+    for kind in kinds:
+        clauses = []
+        for name, value in filters.items():
+            if value is None:
+                continue
+            column = _FILTER_COLUMNS[kind][name]
+            if column is None:
+                break
+            clauses.append(f"AND {column} = :{name}")
+        else:
+            parts.append(sources[kind].format(filters=" ".join(clauses)))
+    if not parts:
+        return [], None
+
+    params = {"q": query_param, "limit": limit + 1, **{k: v for k, v in filters.items() if v is not None}}
+    keyset = ""
+    if cursor:
+        after_score, after_kind, after_id = _decode_search_cursor(cursor)
+        keyset = """WHERE r.score < :after_score
+                    OR (r.score = :after_score AND (r.kind > :after_kind OR (r.kind = :after_kind AND r.id > :after_id)))"""
+        params.update(after_score=after_score, after_kind=after_kind, after_id=after_id)
+
+    sql = f"""
+        SELECT r.kind, r.id, r.conversation_id, r.user_id, r.agent, r.body, r.score, r.created_at
+        FROM ({" UNION ALL ".join(parts)}) r
+        {keyset}
+        ORDER BY r.score DESC, r.kind, r.id
+        LIMIT :limit"""
+
+    clause = text(sql)
+    typed = [bindparam(name, type_=Uuid(as_uuid=True)) for name in ("user_id", "conversation_id", "after_id")
+             if name in params]
+    if typed:
+        clause = clause.bindparams(*typed)
+    stmt = clause.columns(**_RESULT_COLUMNS)
+    rows = (await db.execute(stmt, params)).mappings().all()
+
+    results = [dict(row) for row in rows[:limit]]
+    if dialect == "postgresql":
+        for result in results:
+            # Short preview; ts_headline over every match would be costly
+            result["body"] = result["body"][:200]
+    next_cursor = None
+    if len(rows) > limit:
+        last = results[-1]
+        next_cursor = encode_token([last["score"], last["kind"], str(last["id"])])
+    return results, next_cursor
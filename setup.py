@@ -9,10 +9,15 @@ setup(
         "uvicorn[standard]==0.24.0",
         "sqlalchemy==2.0.23",
         "psycopg2-binary==2.9.9",
+        "asyncpg==0.29.0",
+        "aiosqlite==0.19.0",
+        "greenlet==3.0.1",
         "python-dotenv==1.0.0",
         "pydantic==2.5.0",
         "pydantic-settings==2.1.0",
         "pytest==7.4.3",
         "httpx==0.25.2",
+        "orjson==3.9.10",
+        "brotli==1.1.0",
     ],
 )
\ No newline at end of file
@@ -1,7 +1,20 @@
+import os
+import tempfile
+
 import pytest
+
+# The suite shares one client address; admission control is tested separately
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
 from main import app
+from database import engine
+from migrations import migrate
 from fastapi.testclient import TestClient
 
+# Build the test schema the way production does, so migrations are exercised too
+migrate(engine)
+
 
 @pytest.fixture(scope="module")
 def client():
@@ -0,0 +1,57 @@
+from fastapi.testclient import TestClient
+
+from main import app
+from monitoring.activity import ActivityLog
+
+client = TestClient(app)
+
+
+def test_ring_buffer_stays_bounded():
+    log = ActivityLog(capacity=5, per_agent_capacity=3)
+    for i in range(12):
+        log.record("routing", agent_id="a" if i % 2 else "b", message=str(i))
+
+    assert len(log) == 5
+    events, next_cursor = log.page(limit=10)
+    assert [event["seq"] for event in events] == [12, 11, 10, 9, 8]
+    assert next_cursor is None
+
+    agent_events, _ = log.page(limit=10, agent_id="a")
+    assert [event["seq"] for event in agent_events] == [12, 10, 8]
+    assert log.count("a") == 3
+
+
+def test_cursor_pagination_walks_back_without_gaps():
+    log = ActivityLog(capacity=100)
+    for i in range(25):
+        log.record("agent_finish", agent_id="x", latency_ms=i)
+
+    seen = []
+    cursor = None
+    while True:
+        events, cursor = log.page(limit=10, cursor=cursor)
+        seen.extend(event["seq"] for event in events)
+        if cursor is None:
+            break
+
+    assert seen == list(range(25, 0, -1))
+
+
+def test_logs_endpoints_read_recorded_activity():
+    client.post("/agents/process?content=Deploy the docker container to the cloud")
+
+    logs = client.get("/logs?limit=50").json()
+    kinds = {event["kind"] for event in logs["logs"]}
+    assert {"routing", "agent_start", "agent_finish"} <= kinds
+
+    agent_id = next(event["agent_id"] for event in logs["logs"] if event["kind"] == "agent_finish")
+    agent_logs = client.get(f"/logs/agents/{agent_id}?limit=1").json()
+    assert len(agent_logs["logs"]) == 1
+    assert agent_logs["logs"][0]["agent_id"] == agent_id
+    assert agent_logs["next_cursor"] is not None
+
+    activity = client.get("/activity").json()
+    assert activity["events"]
+    assert activity["recent_tasks_processed"] >= 1
+
+    assert client.get("/logs?cursor=not-a-number").status_code == 400
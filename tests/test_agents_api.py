@@ -1,3 +1,4 @@
+import json
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import AsyncMock, patch
@@ -255,4 +256,79 @@ def test_process_integration_task():
     data = response.json()
     assert "task_content" in data
     assert "processed_by" in data
-    assert "response" in data
\ No newline at end of file
+    assert "response" in data
+
+def test_catalog_endpoints_return_etag_and_304():
+    """Test that cached catalog endpoints honor If-None-Match"""
+    for path in ["/agents", "/skills", "/skills/categories", "/config", "/agents/types"]:
+        response = client.get(path)
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+
+        cached = client.get(path, headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.headers["etag"] == etag
+        assert cached.content == b""
+
+
+def test_agent_types_not_shadowed_by_agent_id():
+    """Test the GET /agents/types endpoint"""
+    response = client.get("/agents/types")
+    assert response.status_code == 200
+    assert response.json()["total_types"] == 2
+
+
+def test_catalog_etag_changes_with_agent_status():
+    """Test that an agent status change invalidates the cached /agents body"""
+    etag = client.get("/agents").headers["etag"]
+    agent_id = client.get("/agents").json()["sub_agents"][1]["id"]
+
+    client.put(f"/agents/{agent_id}/status?status=inactive")
+    response = client.get("/agents", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+    statuses = {agent["id"]: agent["status"] for agent in response.json()["sub_agents"]}
+    assert statuses[agent_id] == "inactive"
+    client.put(f"/agents/{agent_id}/status?status=active")
+
+
+def test_processing_endpoints_use_fast_json_and_declare_models():
+    """Test that agent endpoints are served by orjson and documented with response models"""
+    response = client.post("/agents/backend?content=Build a FastAPI endpoint")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+
+    schema = client.get("/openapi.json").json()
+    backend_schema = schema["paths"]["/agents/backend"]["post"]["responses"]["200"]
+    assert backend_schema["content"]["application/json"]["schema"]["$ref"].endswith("AgentTaskResponse")
+
+
+def test_process_task_batch_returns_results_in_order():
+    """Test the POST /agents/process/batch endpoint"""
+    tasks = [
+        {"id": "a", "content": "Create a React component"},
+        {"id": "b", "content": "Write a sql query for the database"},
+        {"id": "c", "content": "Deploy the docker container"},
+    ]
+    response = client.post("/agents/process/batch", json={"tasks": tasks, "concurrency": 2})
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["total"] == 3 and data["failed"] == 0
+    assert [result["id"] for result in data["results"]] == ["a", "b", "c"]
+    assert data["results"][1]["processed_by"] == "Database Agent"
+
+
+def test_process_task_batch_streams_ndjson():
+    """Test that a streamed batch writes one JSON line per task"""
+    tasks = [{"content": f"Build a FastAPI endpoint {index}"} for index in range(5)]
+    response = client.post("/agents/process/batch", json={"tasks": tasks, "stream": True})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == list(range(5))
+    assert all(line["response"] for line in lines)
+
+    assert client.post("/agents/process/batch", json={"tasks": []}).status_code == 422
@@ -0,0 +1,83 @@
+import gzip
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from main import app
+from middleware.compression import CompressionMiddleware, choose_encoding
+from responses import catalog_cache
+
+client = TestClient(app)
+
+
+def test_choose_encoding_honors_quality_values():
+    assert choose_encoding("gzip, br") == "br"
+    assert choose_encoding("br;q=0, gzip") == "gzip"
+    assert choose_encoding("identity") is None
+    assert choose_encoding("*") == "br"
+    assert choose_encoding(None) is None
+
+
+def test_large_catalog_response_is_precompressed():
+    response = client.get("/skills", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert "skills" in response.json()
+
+    body, _ = catalog_cache.entries["skills"][1].variant("gzip")
+    again = client.get("/skills", headers={"Accept-Encoding": "gzip"})
+    assert catalog_cache.entries["skills"][1].variant("gzip")[0] is body
+    assert again.headers["etag"].endswith('-gzip"')
+
+
+def test_compressed_etag_revalidates():
+    etag = client.get("/skills", headers={"Accept-Encoding": "br"}).headers["etag"]
+    response = client.get("/skills", headers={"Accept-Encoding": "br", "If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_small_response_is_not_compressed():
+    response = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+
+def make_app():
+    test_app = FastAPI()
+    test_app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @test_app.get("/text")
+    async def text():
+        return PlainTextResponse("x" * 500)
+
+    @test_app.get("/binary")
+    async def binary():
+        return PlainTextResponse("x" * 500, media_type="application/octet-stream")
+
+    @test_app.get("/stream")
+    async def stream():
+        async def lines():
+            for i in range(50):
+                yield f'{{"row": {i}}}\n'
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return test_app
+
+
+def test_content_type_allow_list():
+    test_client = TestClient(make_app())
+    assert test_client.get("/text", headers={"Accept-Encoding": "gzip"}).headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in test_client.get("/binary", headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_streaming_response_is_compressed_incrementally():
+    test_client = TestClient(make_app())
+    with test_client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        raw = b"".join(response.iter_raw())
+
+    lines = gzip.decompress(raw).decode().splitlines()
+    assert len(lines) == 50
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+
+from middleware.load_shedding import LoadSheddingMiddleware
+from monitoring.loop_lag import LoopLagMonitor
+
+state = {"lag": 0.0, "queue": 0}
+
+app = FastAPI()
+app.add_middleware(
+    LoadSheddingMiddleware,
+    max_loop_lag=0.1,
+    max_queue_depth=5,
+    loop_lag=lambda: state["lag"],
+    queue_depth=lambda: state["queue"],
+)
+
+
+@app.get("/skills")
+async def skills():
+    return {"skills": []}
+
+
+@app.get("/conversations")
+async def conversations():
+    return []
+
+
+@app.post("/api/{user_id}/tasks")
+async def create_task(user_id: str):
+    return {"user_id": user_id}
+
+
+@app.get("/health")
+async def health():
+    return {"status": "healthy"}
+
+
+@app.websocket("/ws")
+async def echo(websocket: WebSocket):
+    await websocket.accept()
+    await websocket.send_text(await websocket.receive_text())
+    await websocket.close()
+
+client = TestClient(app)
+
+
+def test_requests_are_served_when_not_overloaded():
+    state.update(lag=0.0, queue=0)
+    assert client.get("/skills").status_code == 200
+
+
+def test_requests_are_shed_on_loop_lag_or_queue_depth():
+    state.update(lag=0.5, queue=0)
+    response = client.get("/skills")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+    state.update(lag=0.0, queue=10)
+    assert client.get("/skills").status_code == 503
+    state.update(lag=0.0, queue=0)
+
+
+def test_low_priority_requests_are_shed_first():
+    # Above the catalog's share of the lag budget but below the full one
+    state.update(lag=0.07, queue=0)
+    assert client.get("/skills").status_code == 503
+    assert client.get("/conversations").status_code == 200
+    assert client.post("/api/u1/tasks").status_code == 200
+
+    # Past the normal threshold only task writes are still admitted
+    state.update(lag=0.0, queue=8)
+    assert client.get("/conversations").status_code == 503
+    assert client.post("/api/u1/tasks").status_code == 200
+
+    state.update(lag=0.0, queue=20)
+    assert client.post("/api/u1/tasks").status_code == 503
+    state.update(lag=0.0, queue=0)
+
+
+def test_health_and_websockets_are_never_shed():
+    state.update(lag=0.5, queue=10)
+    assert client.get("/health").status_code == 200
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_text("ping")
+        assert websocket.receive_text() == "ping"
+    state.update(lag=0.0, queue=0)
+
+
+def test_loop_lag_monitor_detects_blocking_work():
+    monitor = LoopLagMonitor(interval=0.01, smoothing=1.0)
+
+    async def run():
+        monitor.start()
+        await asyncio.sleep(0.02)
+        # Block the loop the way synchronous CPU work would
+        time.sleep(0.1)
+        await asyncio.sleep(0.02)
+        lag = monitor.histogram.max
+        await monitor.stop()
+        return lag
+
+    assert asyncio.run(run()) >= 0.05
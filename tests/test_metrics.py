@@ -0,0 +1,124 @@
+import os
+import threading
+
+from fastapi.testclient import TestClient
+
+from main import app
+from monitoring.metrics import MetricsRegistry
+
+client = TestClient(app)
+
+
+def test_metrics_endpoint_exposes_prometheus_text():
+    client.post("/agents/process?content=Write a sql query for the database")
+    client.get("/skills")
+    client.get("/skills")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+    text = response.text
+    assert "# TYPE http_requests_total counter" in text
+    assert 'http_requests_total{method="POST",route="/agents/process",status="200"}' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/skills",le="+Inf"}' in text
+    assert 'agent_routing_decisions_total{agent="sub-agent-003"}' in text
+    assert 'cache_requests_total{cache="catalog",result="hit"}' in text
+    assert "websocket_connections " in text
+
+
+def test_counter_shards_sum_across_threads():
+    registry = MetricsRegistry()
+    counter = registry.counter("jobs_total", "Jobs", ("kind",))
+
+    def work():
+        for _ in range(1000):
+            counter.labels("sync").inc()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.labels("sync").value() == 4000
+    assert 'jobs_total{kind="sync"} 4000' in registry.render()
+
+
+def test_multiprocess_snapshots_are_merged(tmp_path):
+    worker = MetricsRegistry(multiproc_dir=str(tmp_path))
+    worker.counter("jobs_total", "Jobs").inc(3)
+    worker.histogram("job_seconds", "Job time", buckets=[0.1, 1.0]).observe(0.5)
+    worker.write_snapshot()
+
+    # Pretend a second (exited) worker left its snapshot behind
+    other_pid = os.getpid() + 100000
+    os.rename(worker.snapshot_path, tmp_path / f"metrics-{other_pid}-exited.json")
+
+    scraper = MetricsRegistry(multiproc_dir=str(tmp_path))
+    scraper.counter("jobs_total", "Jobs").inc(2)
+    scraper.histogram("job_seconds", "Job time", buckets=[0.1, 1.0]).observe(2.0)
+
+    text = scraper.render()
+    assert "jobs_total 5" in text
+    assert 'job_seconds_bucket{le="1"} 1' in text
+    assert 'job_seconds_bucket{le="+Inf"} 2' in text
+    assert "job_seconds_count 2" in text
+
+
+def test_dead_thread_cells_are_folded():
+    registry = MetricsRegistry()
+    counter = registry.counter("jobs_total", "Jobs")
+
+    for _ in range(20):
+        thread = threading.Thread(target=lambda: counter.inc(2))
+        thread.start()
+        thread.join()
+
+    assert counter._default.value() == 40
+    assert len(counter._default._shards._cells) == 0
+
+
+def test_dead_worker_snapshots_are_archived_not_overwritten(tmp_path):
+    dead_pid = os.getpid() + 100000
+    for run in range(2):
+        # Two workers that happened to get the same pid, one after the other
+        worker = MetricsRegistry(multiproc_dir=str(tmp_path))
+        worker.counter("jobs_total", "Jobs").inc(3)
+        worker.gauge("busy", "Busy").inc()
+        worker.write_snapshot()
+        os.rename(worker.snapshot_path, tmp_path / f"metrics-{dead_pid}-run{run}.json")
+
+    scraper = MetricsRegistry(multiproc_dir=str(tmp_path))
+    scraper.counter("jobs_total", "Jobs").inc(1)
+    scraper.gauge("busy", "Busy")
+
+    text = scraper.render()
+    assert "jobs_total 7" in text
+    # Gauges only count live workers
+    assert "busy 0" in text
+    assert sorted(path.name for path in tmp_path.glob("metrics-*")) == [os.path.basename(scraper.snapshot_path)]
+    assert "jobs_total 7" in scraper.render()
+
+
+def test_stalled_workers_are_not_archived(tmp_path):
+    worker = MetricsRegistry(multiproc_dir=str(tmp_path), flush_seconds=1)
+    jobs = worker.counter("jobs_total", "Jobs")
+    busy = worker.gauge("busy", "Busy")
+    jobs.inc(3)
+    busy.inc()
+    worker.write_snapshot()
+    # The worker is alive (it is this process) but has not flushed for a while
+    os.utime(worker.snapshot_path, (0, 0))
+
+    scraper = MetricsRegistry(multiproc_dir=str(tmp_path))
+    scraper.counter("jobs_total", "Jobs")
+    scraper.gauge("busy", "Busy")
+    text = scraper.render()
+    assert "jobs_total 3" in text
+    assert "busy 0" in text
+
+    # Its next cumulative snapshot replaces, rather than adds to, the stale one
+    jobs.inc(1)
+    worker.write_snapshot()
+    assert "jobs_total 4" in scraper.render()
@@ -0,0 +1,79 @@
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, inspect, select
+
+from migrations import MIGRATIONS, applied_versions, migrate
+from models.agent_models import ChatMessage, Conversation, Task
+from pagination import encode_cursor, keyset_statement
+
+
+@pytest.fixture(scope="module")
+def migrated_engine(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('migrations')}/schema.db")
+    applied = migrate(engine)
+    assert [migration.version for migration in applied] == [m.version for m in MIGRATIONS]
+    yield engine
+    engine.dispose()
+
+
+def test_migrations_are_recorded_and_idempotent(migrated_engine):
+    with migrated_engine.connect() as connection:
+        assert applied_versions(connection) == {m.version for m in MIGRATIONS}
+    assert migrate(migrated_engine) == []
+
+
+def test_migrated_schema_has_access_path_indexes(migrated_engine):
+    inspector = inspect(migrated_engine)
+    columns = {
+        table: {index["name"]: index["column_names"] for index in inspector.get_indexes(table)}
+        for table in ("tasks", "conversations", "chat_messages")
+    }
+    assert columns["tasks"]["ix_tasks_user_created_id"] == ["user_id", "created_at", "id"]
+    assert columns["chat_messages"]["ix_chat_messages_conversation_created_id"] == ["conversation_id", "created_at", "id"]
+    assert columns["conversations"]["ix_conversations_user_created_id"] == ["user_id", "created_at", "id"]
+
+
+def query_plan(engine, stmt) -> str:
+    compiled = stmt.compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}").fetchall()
+    return "\n".join(row[-1] for row in rows)
+
+
+@pytest.mark.parametrize("model, column, index", [
+    (Task, Task.user_id, "ix_tasks_user_created_id"),
+    (Conversation, Conversation.user_id, "ix_conversations_user_created_id"),
+    (ChatMessage, ChatMessage.conversation_id, "ix_chat_messages_conversation_created_id"),
+])
+def test_keyset_pages_use_an_index_without_sorting(migrated_engine, model, column, index):
+    cursor = encode_cursor(datetime(2024, 1, 1), uuid.uuid4())
+    for page_cursor in (None, cursor):
+        stmt = keyset_statement(select(model).where(column == uuid.uuid4()), model, page_cursor, 50)
+        plan = query_plan(migrated_engine, stmt)
+        assert f"USING INDEX {index}" in plan, plan
+        # A missing or mismatched index shows up as a table scan or a sort step
+        assert "TEMP B-TREE" not in plan, plan
+
+
+def test_task_search_index_follows_updates_and_deletes(migrated_engine):
+    task_id = uuid.uuid4()
+    tasks = Task.__table__
+
+    def matches(word):
+        with migrated_engine.connect() as connection:
+            return connection.exec_driver_sql(
+                f"SELECT count(*) FROM tasks_fts WHERE tasks_fts MATCH '{word}'").scalar()
+
+    with migrated_engine.begin() as connection:
+        connection.execute(tasks.insert(), [{
+            "id": task_id, "user_id": uuid.uuid4(), "title": "Quarterly report",
+            "status": "pending", "priority": "medium", "created_at": datetime(2024, 1, 1)}])
+    assert matches("quarterly") == 1
+    with migrated_engine.begin() as connection:
+        connection.execute(tasks.update().where(tasks.c.id == task_id).values(title="Annual report"))
+    assert (matches("quarterly"), matches("annual")) == (0, 1)
+    with migrated_engine.begin() as connection:
+        connection.execute(tasks.delete().where(tasks.c.id == task_id))
+    assert matches("report") == 0
@@ -0,0 +1,57 @@
+from fastapi.testclient import TestClient
+
+from main import app
+from monitoring.histogram import LatencyHistogram
+from monitoring.timing import request_stats
+
+client = TestClient(app)
+
+
+def test_histogram_percentiles_are_close():
+    histogram = LatencyHistogram()
+    for millis in range(1, 1001):
+        histogram.record(millis / 1000)
+
+    assert histogram.count == 1000
+    assert abs(histogram.percentile(0.50) - 0.500) < 0.05
+    assert abs(histogram.percentile(0.95) - 0.950) < 0.095
+    assert histogram.percentile(1.0) == 1.0
+    assert LatencyHistogram().percentile(0.5) is None
+
+
+def test_server_timing_header_lists_phases():
+    response = client.post("/agents/main?content=Build a REST api with fastapi")
+    assert response.status_code == 200
+
+    server_timing = response.headers["server-timing"]
+    assert "routing;dur=" in server_timing
+    assert "agent;dur=" in server_timing
+    assert "app;dur=" in server_timing
+
+    analysis = client.post("/analyze/task?content=Write unit tests")
+    assert "analysis;dur=" in analysis.headers["server-timing"]
+
+
+def test_integration_endpoint_records_each_phase_once():
+    def counts():
+        return {name: request_stats.phases[name].count if name in request_stats.phases else 0
+                for name in ("routing", "agent")}
+
+    before = counts()
+    response = client.post("/agents/integration?content=Build a REST api with fastapi")
+    assert response.status_code == 200
+    after = counts()
+    assert {name: after[name] - before[name] for name in after} == {"routing": 1, "agent": 1}
+
+
+def test_performance_reports_measured_latency():
+    client.get("/health")
+    client.get("/agents/sub-agent-001")
+
+    data = client.get("/performance").json()
+    assert data["latency"]["count"] > 0
+    assert data["latency"]["p99_ms"] >= data["latency"]["p50_ms"]
+    assert "GET /agents/{agent_id}" in data["routes"]
+    assert data["request_rate_per_second"] > 0
+    assert data["active_connections"] >= 1
+    assert data["memory_usage_mb"] > 0
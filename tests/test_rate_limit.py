@@ -0,0 +1,108 @@
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from middleware.rate_limit import OVERFLOW_KEY, RateLimitMiddleware, TokenBucketStore, charge
+
+
+def make_client(**settings):
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, **settings)
+
+    @app.get("/skills")
+    async def skills():
+        return {"skills": []}
+
+    @app.post("/agents/process")
+    async def process():
+        return {"response": "ok"}
+
+    @app.post("/agents/process/batch")
+    async def process_batch(request: Request, tasks: int):
+        if charge(request.scope, tasks - 1):
+            raise HTTPException(status_code=429, detail="Rate limit exceeded")
+        return {"total": tasks}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    return TestClient(app)
+
+
+def test_token_bucket_refills_over_time():
+    store = TokenBucketStore(rate=1.0, burst=2.0)
+    assert store.take("client", now=100.0) == 0
+    assert store.take("client", now=100.0) == 0
+    assert store.take("client", now=100.0) == 1.0
+    assert store.take("client", now=101.0) == 0
+
+
+def test_idle_keys_are_evicted_and_store_is_bounded():
+    store = TokenBucketStore(rate=1.0, burst=1.0, max_keys=2, idle_seconds=10)
+    store.take("a", now=0.0)
+    store.take("b", now=0.0)
+    store.take("c", now=1.0)
+    assert OVERFLOW_KEY in store._slots
+    assert len(store) == 3
+
+    store.sweep(now=20.0)
+    assert len(store) == 0
+
+
+def test_agent_calls_have_their_own_bucket():
+    client = make_client(default_rate=0.001, default_burst=5, agent_rate=0.001, agent_burst=2)
+
+    assert client.post("/agents/process").status_code == 200
+    assert client.post("/agents/process").status_code == 200
+    limited = client.post("/agents/process")
+    assert limited.status_code == 429
+    assert int(limited.headers["retry-after"]) >= 1
+
+    # Catalog reads are still allowed, and /health is never limited
+    assert client.get("/skills").status_code == 200
+    for _ in range(10):
+        assert client.get("/health").status_code == 200
+
+
+def test_only_known_api_keys_get_their_own_bucket():
+    client = make_client(default_rate=0.001, default_burst=1, api_keys=["one"])
+
+    assert client.get("/skills", headers={"X-API-Key": "one"}).status_code == 200
+    assert client.get("/skills", headers={"X-API-Key": "one"}).status_code == 429
+    # Made-up keys and sender ids cannot buy a fresh bucket; they share the IP's
+    assert client.get("/skills", headers={"X-API-Key": "random-1"}).status_code == 200
+    assert client.get("/skills", headers={"X-API-Key": "random-2"}).status_code == 429
+    assert client.get("/skills?sender_id=alice").status_code == 429
+
+
+def test_forwarded_for_is_trusted_unless_disabled():
+    headers = {"X-Forwarded-For": "203.0.113.7"}
+    untrusting = make_client(default_rate=0.001, default_burst=1, trust_forwarded=False)
+    assert untrusting.get("/skills", headers=headers).status_code == 200
+    assert untrusting.get("/skills", headers={"X-Forwarded-For": "203.0.113.8"}).status_code == 429
+
+    trusting = make_client(default_rate=0.001, default_burst=1)
+    assert trusting.get("/skills", headers=headers).status_code == 200
+    assert trusting.get("/skills", headers={"X-Forwarded-For": "203.0.113.8"}).status_code == 200
+    assert trusting.get("/skills", headers=headers).status_code == 429
+    # Only the right-most entry, the one our proxy appended, identifies the client
+    assert trusting.get("/skills", headers={"X-Forwarded-For": "198.51.100.1, 203.0.113.7"}).status_code == 429
+
+
+def test_batches_are_charged_per_task():
+    client = make_client(batch_rate=0.001, batch_burst=10)
+
+    assert client.post("/agents/process/batch?tasks=6").status_code == 200
+    # Four tokens left: a five task batch does not fit, though the attempt costs one
+    assert client.post("/agents/process/batch?tasks=5").status_code == 429
+    assert client.post("/agents/process/batch?tasks=3").status_code == 200
+    # More than the whole bucket never fits
+    assert make_client(batch_burst=10).post("/agents/process/batch?tasks=11").status_code == 429
+
+
+def test_default_limits_admit_a_full_batch():
+    client = make_client()
+    # Far above the agent burst, and the agent bucket is left untouched
+    assert client.post("/agents/process/batch?tasks=500").status_code == 200
+    assert client.post("/agents/process/batch?tasks=2").status_code == 429
+    assert client.post("/agents/process").status_code == 200
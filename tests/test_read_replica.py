@@ -0,0 +1,71 @@
+import tempfile
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import database
+from database import RoutingSession, SessionLocal
+from main import app
+from migrations import migrate
+from models.agent_models import Task, User
+
+client = TestClient(app)
+
+
+def test_session_reads_replica_until_it_writes():
+    directory = tempfile.mkdtemp()
+    primary, replica = (create_engine(f"sqlite:///{directory}/{name}.db") for name in ("primary", "replica"))
+    for target in (primary, replica):
+        migrate(target)
+    Session = sessionmaker(class_=RoutingSession, bind=primary)
+
+    user_id = uuid.uuid4()
+    with Session() as db:
+        db.add(User(id=user_id, username="primary-only", email="primary@example.com"))
+        db.commit()
+
+    with Session(replica=replica) as db:
+        # Only the primary has the user
+        assert db.get(User, user_id) is None
+        db.add(Task(id=uuid.uuid4(), user_id=user_id, title="Mine", description=""))
+        db.flush()
+        # After a write every read goes to the primary
+        assert db.scalars(select(Task.title).where(Task.user_id == user_id)).all() == ["Mine"]
+        assert db.get(User, user_id) is not None
+
+    with Session() as db:
+        # Without a replica everything goes to the primary
+        assert db.get(User, user_id) is not None
+
+
+def test_read_handlers_use_the_replica_except_right_after_a_write(monkeypatch):
+    path = f"{tempfile.mkdtemp()}/replica.db"
+    migrate(create_engine(f"sqlite:///{path}"))
+    replica = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    monkeypatch.setattr(database, "async_replica_engine", replica)
+    client.cookies.clear()
+
+    db = SessionLocal()
+    user = User(id=uuid.uuid4(), username=f"u-{uuid.uuid4().hex[:8]}", email=f"{uuid.uuid4().hex}@example.com")
+    db.add(user)
+    db.commit()
+    user_id = str(user.id)
+    db.close()
+
+    created = client.post(f"/api/{user_id}/tasks", json={"title": "Fresh", "description": "", "user_id": user_id})
+    assert created.status_code == 200
+    assert "db_wrote=1" in created.headers["set-cookie"]
+
+    # The writer reads its own write from the primary, on any worker, while
+    # it holds the cookie...
+    listing = client.get(f"/api/{user_id}/tasks")
+    assert [task["title"] for task in listing.json()] == ["Fresh"]
+    # ...another client from the same address reads from the (empty) replica...
+    assert TestClient(app).get(f"/api/{user_id}/tasks").status_code == 404
+
+    # ...and so does the writer once the cookie has expired
+    client.cookies.clear()
+    assert client.get(f"/api/{user_id}/tasks/{created.json()['id']}").status_code == 404
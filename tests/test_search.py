@@ -0,0 +1,72 @@
+import uuid
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from database import SessionLocal
+from main import app
+from models.agent_models import ChatMessage, Conversation, Task, User
+from search import sqlite_match_query
+
+client = TestClient(app)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    db = SessionLocal()
+    user = User(id=uuid.uuid4(), username=f"s-{uuid.uuid4().hex[:8]}", email=f"{uuid.uuid4().hex}@example.com")
+    conversation = Conversation(id=uuid.uuid4(), user_id=user.id, title="Search")
+    db.add_all([user, conversation])
+    db.flush()
+    for index in range(6):
+        db.add(ChatMessage(id=uuid.uuid4(), conversation_id=conversation.id, sender_type="user",
+                           sender_id=user.id, content=f"kubernetes rollout number {index}",
+                           agent_used="Deployment Agent" if index % 2 else None,
+                           created_at=datetime(2024, 1, 1, 0, index)))
+    db.add(Task(id=uuid.uuid4(), user_id=user.id, title="Kubernetes kubernetes migration",
+                description="move the rollout to the new cluster"))
+    db.add(Task(id=uuid.uuid4(), user_id=uuid.uuid4(), title="Someone else's kubernetes task", description=""))
+    db.commit()
+    ids = {"user_id": str(user.id), "conversation_id": str(conversation.id)}
+    db.close()
+    return ids
+
+
+def test_match_query_quotes_user_input():
+    assert sqlite_match_query('kubernetes "OR" -rollout*') == '"kubernetes" "OR" "rollout"'
+    assert sqlite_match_query("!!!") == ""
+
+
+def test_search_ranks_and_filters(corpus):
+    response = client.get("/search", params={"q": "kubernetes", "user_id": corpus["user_id"]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == 7
+    # The task says "kubernetes" twice and in its weighted title
+    assert results[0]["kind"] == "task"
+    assert all(result["user_id"] == corpus["user_id"] for result in results)
+
+    messages = client.get("/search", params={"q": "rollout", "conversation_id": corpus["conversation_id"]}).json()
+    assert {result["kind"] for result in messages["results"]} == {"message"}
+    assert len(messages["results"]) == 6
+
+    by_agent = client.get("/search", params={"q": "kubernetes", "agent": "Deployment Agent"}).json()
+    assert len(by_agent["results"]) == 3
+
+
+def test_search_pages_with_cursor(corpus):
+    seen = []
+    cursor = None
+    while True:
+        params = {"q": "kubernetes", "user_id": corpus["user_id"], "limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/search", params=params).json()
+        seen.extend(result["id"] for result in page["results"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert len(seen) == 7 and len(set(seen)) == 7
+
+    assert client.get("/search", params={"q": "kubernetes", "cursor": "bad"}).status_code == 400